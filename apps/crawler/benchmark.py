@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import crawler
+from house_parser import HouseSnapshot, FIELD_EXTRACTORS, parse_list_page
+from http_fetcher import fetch_house_pages
+from replay import PageCorpus, ReplayServer
+
+
+def benchmark_parser(corpus, target_region=None, repeat=1):
+    """對語料庫中的詳細頁計時：整頁解析速度、各欄位萃取時間、記憶體峰值，並與 golden 比對"""
+    field_times = {name: 0.0 for name, _ in FIELD_EXTRACTORS}
+    field_times["snapshot"] = 0.0
+    mismatches = []
+    missing_golden = []
+    pages = list(corpus.pages("detail"))
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    for round_index in range(repeat):
+        for url, _, html in pages:
+            step_start = time.perf_counter()
+            page = HouseSnapshot(html, url, target_region)
+            field_times["snapshot"] += time.perf_counter() - step_start
+
+            house_data = {"url": url}
+            for name, extractor in FIELD_EXTRACTORS:
+                step_start = time.perf_counter()
+                ok = extractor(page, house_data)
+                field_times[name] += time.perf_counter() - step_start
+                if not ok:
+                    house_data = None
+                    break
+
+            # golden 只需比對第一輪
+            if round_index > 0:
+                continue
+            golden = corpus.load_golden(url)
+            if golden is None:
+                missing_golden.append(url)
+            elif golden != house_data:
+                mismatches.append({"url": url, "diff": _diff(golden, house_data)})
+    elapsed = time.perf_counter() - start_time
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    parsed_pages = len(pages) * repeat
+    return {
+        "pages": parsed_pages,
+        "seconds": elapsed,
+        "pages_per_sec": parsed_pages / elapsed if elapsed else 0.0,
+        "field_ms_per_page": {name: total * 1000 / parsed_pages for name, total in field_times.items()} if parsed_pages else {},
+        "peak_memory_mb": peak_bytes / 1024 / 1024,
+        "mismatches": mismatches,
+        "missing_golden": missing_golden,
+    }
+
+
+def benchmark_list_pages(corpus):
+    pages = list(corpus.pages("list"))
+    start_time = time.perf_counter()
+    cards = 0
+    for url, _, html in pages:
+        cards += len(parse_list_page(html, url))
+    elapsed = time.perf_counter() - start_time
+    return {
+        "pages": len(pages),
+        "cards": cards,
+        "seconds": elapsed,
+        "pages_per_sec": len(pages) / elapsed if elapsed else 0.0,
+    }
+
+
+def benchmark_replay_fetch(corpus, target_region=None):
+    """透過本機重播伺服器走完整的 HTTP 抓取 + 解析流程"""
+    urls = [url for url, _, _ in corpus.pages("detail")]
+    with ReplayServer(corpus) as server:
+        crawler.set_replay_origin(server.origin)
+        try:
+            start_time = time.perf_counter()
+            results = asyncio.run(fetch_house_pages(urls, target_region))
+            elapsed = time.perf_counter() - start_time
+        finally:
+            crawler.set_replay_origin(os.getenv("CRAWLER_BASE_URL"))
+    parsed = sum(1 for _, house_data in results if house_data)
+    return {
+        "pages": len(urls),
+        "parsed": parsed,
+        "seconds": elapsed,
+        "pages_per_sec": len(urls) / elapsed if elapsed else 0.0,
+    }
+
+
+def update_golden(corpus, target_region=None):
+    """以目前解析器的輸出覆寫 golden（確認輸出正確後再執行）"""
+    from house_parser import parse_house_html
+    count = 0
+    for url, _, html in corpus.pages("detail"):
+        corpus.save_golden(url, parse_house_html(html, url, target_region))
+        count += 1
+    return count
+
+
+def _diff(expected, actual):
+    if expected is None or actual is None:
+        return {"expected": expected, "actual": actual}
+    keys = set(expected) | set(actual)
+    return {key: {"expected": expected.get(key), "actual": actual.get(key)}
+            for key in sorted(keys) if expected.get(key) != actual.get(key)}
+
+
+def print_report(report):
+    parser_report = report["parser"]
+    print("=== 詳細頁解析 ===")
+    print(f"頁數: {parser_report['pages']}，耗時 {parser_report['seconds']:.3f} 秒，"
+          f"{parser_report['pages_per_sec']:.1f} 頁/秒，記憶體峰值 {parser_report['peak_memory_mb']:.1f} MB")
+    print("各欄位平均耗時（毫秒/頁）:")
+    for name, ms in sorted(parser_report["field_ms_per_page"].items(), key=lambda x: x[1], reverse=True):
+        print(f"   {name}: {ms:.3f}")
+
+    list_report = report["list"]
+    print("=== 列表頁解析 ===")
+    print(f"頁數: {list_report['pages']}，卡片 {list_report['cards']} 張，{list_report['pages_per_sec']:.1f} 頁/秒")
+
+    if "replay" in report:
+        replay_report = report["replay"]
+        print("=== 重播 HTTP 抓取 ===")
+        print(f"頁數: {replay_report['pages']}，成功解析 {replay_report['parsed']}，"
+              f"{replay_report['pages_per_sec']:.1f} 頁/秒")
+
+    print("=== Golden 比對 ===")
+    if parser_report["missing_golden"]:
+        print(f"缺少 golden: {len(parser_report['missing_golden'])} 頁（可用 --update-golden 建立）")
+    if parser_report["mismatches"]:
+        print(f"與 golden 不符: {len(parser_report['mismatches'])} 頁")
+        for mismatch in parser_report["mismatches"][:10]:
+            print(f"   {mismatch['url']}")
+            for field, values in mismatch["diff"].items():
+                print(f"      {field}: {values['expected']!r} → {values['actual']!r}")
+    else:
+        print("全部相符")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以離線語料庫量測並驗證爬蟲解析")
+    parser.add_argument("corpus_dir", help="語料庫目錄")
+    parser.add_argument("--region", default=None, help="解析時使用的 target_region")
+    parser.add_argument("--repeat", type=int, default=1, help="重複解析次數，讓計時更穩定")
+    parser.add_argument("--replay", action="store_true", help="同時量測經由本機重播伺服器的 HTTP 抓取")
+    parser.add_argument("--update-golden", action="store_true", help="以目前輸出覆寫 golden 後結束")
+    parser.add_argument("--json", dest="json_path", default=None, help="將報告另存為 JSON")
+    args = parser.parse_args()
+
+    corpus = PageCorpus(args.corpus_dir)
+    if args.update_golden:
+        print(f"已更新 {update_golden(corpus, args.region)} 份 golden")
+        sys.exit(0)
+
+    report = {
+        "parser": benchmark_parser(corpus, args.region, args.repeat),
+        "list": benchmark_list_pages(corpus),
+    }
+    if args.replay:
+        report["replay"] = benchmark_replay_fetch(corpus, args.region)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    sys.exit(1 if report["parser"]["mismatches"] else 0)
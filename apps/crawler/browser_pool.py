@@ -0,0 +1,109 @@
+import queue
+import threading
+import traceback
+
+from crawler import setup_browser, crawl_house_details
+from browser_session import BrowserSession, DEFAULT_MAX_PAGES, DEFAULT_MAX_RSS_MB
+
+_STOP = object()
+
+
+class BrowserPool:
+    """多個瀏覽器平行爬取詳細頁，每個工作執行緒各自持有一個 BrowserSession
+
+    工作執行緒不保留備用瀏覽器：某個瀏覽器重啟時其他執行緒仍在處理，Chrome 數量維持與 size 相同。
+    請求間隔由 safe_get_page 向 RATE_CONTROLLER 取得，所有瀏覽器合計不會超過同一主機的速率上限。
+    """
+
+    def __init__(self, size=4, browser_factory=setup_browser, max_pages=DEFAULT_MAX_PAGES,
+                 max_rss_mb=DEFAULT_MAX_RSS_MB):
+        self.size = max(1, int(size))
+        self.browser_factory = browser_factory
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._workers = []
+
+    def start(self):
+        for worker_idx in range(self.size):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                args=(worker_idx,),
+                name=f"browser-worker-{worker_idx}",
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+        print(f"已啟動 {self.size} 個瀏覽器工作執行緒")
+        return self
+
+    def _worker_loop(self, worker_idx):
+        # 瀏覽器延遲建立，建立失敗時下一個任務會再嘗試
+        session = BrowserSession(self.browser_factory, max_pages=self.max_pages, max_rss_mb=self.max_rss_mb,
+                                 warm_spare=False)
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is _STOP:
+                    break
+
+                house_url, target_region = task
+                house_data = None
+                try:
+                    house_data = session.call(crawl_house_details, house_url, target_region)
+                except Exception as e:
+                    print(f"工作執行緒 {worker_idx} 處理 {house_url} 失敗: {e}")
+                    traceback.print_exc()
+                finally:
+                    self._results.put((house_url, house_data))
+        finally:
+            session.close()
+
+    def crawl(self, house_urls, target_region, limit):
+        """依剩餘配額分派詳細頁，逐筆產出 (house_url, house_data)
+
+        進行中的任務數加上已成功筆數不會超過 limit，
+        因此成功筆數恰好不超過配額，也不會多爬用不到的頁面。
+        """
+        pending = iter(house_urls)
+        in_flight = 0
+        collected = 0
+
+        def dispatch():
+            nonlocal in_flight
+            while in_flight + collected < limit:
+                house_url = next(pending, None)
+                if house_url is None:
+                    break
+                self._tasks.put((house_url, target_region))
+                in_flight += 1
+
+        dispatch()
+        try:
+            while in_flight:
+                house_url, house_data = self._results.get()
+                in_flight -= 1
+                if house_data:
+                    collected += 1
+                yield house_url, house_data
+                dispatch()
+        finally:
+            # 呼叫端提前中止時，收回仍在進行中的結果，避免混入下一批
+            while in_flight:
+                self._results.get()
+                in_flight -= 1
+
+    def close(self):
+        for _ in self._workers:
+            self._tasks.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        print("瀏覽器工作執行緒已全部關閉")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,163 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler import setup_browser, is_session_dead
+from metrics import METRICS
+
+# 每個瀏覽器最多處理幾頁就換新，避免 Chrome 記憶體持續成長
+DEFAULT_MAX_PAGES = 150
+# chromedriver + Chrome 全部程序的 RSS 上限（MB），超過即換新
+DEFAULT_MAX_RSS_MB = 1500
+# 每處理幾頁檢查一次 RSS（需掃描 /proc）
+RSS_CHECK_EVERY = 10
+
+
+def _process_tree_rss(root_pid):
+    """以 /proc 計算某程序及其所有子程序的 RSS（bytes）；非 Linux 環境回傳 None"""
+    if not root_pid or not os.path.isdir("/proc"):
+        return None
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 程序名稱可能含空白或括號，從最後一個 ')' 之後開始解析：state ppid ...
+        ppid = int(stat[stat.rfind(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/statm", 'r') as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            pass
+        stack.extend(children.get(pid, []))
+    return total
+
+
+def _browser_rss(browser):
+    try:
+        return _process_tree_rss(browser.service.process.pid)
+    except AttributeError:
+        return None
+
+
+def _quit_quietly(browser):
+    try:
+        browser.quit()
+    except Exception:
+        pass
+
+
+class BrowserSession:
+    """管理瀏覽器生命週期：處理頁數或記憶體超過上限時換新，工作階段失效時重啟並重試目前網址
+
+    warm_spare=True 時會在背景先啟動一個備用瀏覽器，換新時直接切換，不必等待 Chrome 啟動。
+    舊瀏覽器在背景關閉。同一個 session 只供單一執行緒使用。
+    """
+
+    def __init__(self, browser_factory=setup_browser, max_pages=DEFAULT_MAX_PAGES,
+                 max_rss_mb=DEFAULT_MAX_RSS_MB, warm_spare=True):
+        self.browser_factory = browser_factory
+        self.max_pages = max_pages
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.warm_spare = warm_spare
+        self.browser = None
+        self.pages = 0
+        self.restarts = 0
+        self.recycles = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser-spare")
+        self._spare = None
+
+    def _start_spare(self):
+        if self.warm_spare and self._spare is None:
+            self._spare = self._executor.submit(self.browser_factory)
+
+    def _take_spare(self):
+        """取得備用瀏覽器；尚未準備好時等待，啟動失敗時改為直接建立"""
+        spare, self._spare = self._spare, None
+        if spare is not None:
+            try:
+                return spare.result()
+            except Exception as e:
+                print(f"備用瀏覽器啟動失敗，改為直接建立: {e}")
+        return self.browser_factory()
+
+    def acquire(self):
+        if self.browser is None:
+            with METRICS.timer("browser_start"):
+                self.browser = self._take_spare()
+            self.pages = 0
+            self._start_spare()
+        return self.browser
+
+    def _replace(self):
+        old_browser, self.browser = self.browser, None
+        if old_browser is not None:
+            # 關閉可能要數秒，不阻塞爬取
+            threading.Thread(target=_quit_quietly, args=(old_browser,), daemon=True).start()
+        self.acquire()
+
+    def restart(self):
+        """工作階段失效時換上新的瀏覽器"""
+        self.restarts += 1
+        METRICS.incr("browser_restart")
+        self._replace()
+
+    def recycle(self, reason):
+        self.recycles += 1
+        METRICS.incr("browser_recycle")
+        print(f"瀏覽器已處理 {self.pages} 頁，{reason}，換新瀏覽器")
+        self._replace()
+
+    def _after_page(self):
+        self.pages += 1
+        if self.max_pages and self.pages >= self.max_pages:
+            self.recycle("達到頁數上限")
+            return
+        if self.max_rss_bytes and self.pages % RSS_CHECK_EVERY == 0:
+            rss = _browser_rss(self.browser)
+            if rss is not None:
+                METRICS.set_gauge("browser_rss_bytes", rss)
+                if rss > self.max_rss_bytes:
+                    self.recycle(f"記憶體 {rss / 1024 / 1024:.0f} MB 超過上限")
+
+    def call(self, fn, *args, **kwargs):
+        """以目前的瀏覽器執行 fn(browser, ...)；工作階段失效時重啟瀏覽器並重試一次"""
+        for attempt in range(2):
+            browser = self.acquire()
+            try:
+                result = fn(browser, *args, **kwargs)
+            except Exception as e:
+                if attempt or not is_session_dead(e):
+                    raise
+                print(f"瀏覽器工作階段失效（{type(e).__name__}），重新啟動後重試")
+                self.restart()
+                continue
+            self._after_page()
+            return result
+
+    def close(self):
+        if self.browser is not None:
+            _quit_quietly(self.browser)
+            self.browser = None
+        if self._spare is not None:
+            self._spare.add_done_callback(lambda future: future.exception() or _quit_quietly(future.result()))
+            self._spare = None
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from metrics import METRICS
+from spatial_index import EARTH_RADIUS_KM, haversine_km
+
+DEFAULT_DESTINATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "commute_destinations.json")
+DESTINATION_DEFAULTS = {"modes": ["transit"], "radius_km": 15, "max_minutes": 60}
+
+# 與後端 commuteCacheService.generateDestinationHash 相同：0.003 度（約 300 公尺）量化後取 3 位小數
+QUANTIZE_PRECISION = 0.003
+
+# Google Distance Matrix 單次請求上限（起點、終點各 25 個，元素 100 個）
+MAX_ORIGINS = 25
+MAX_ELEMENTS = 100
+# 各交通方式的直線速度上限（km/h），直線距離超過 上限 × 時間 的物件不可能在時限內到達，不送出請求
+MAX_SPEED_KMH = {"transit": 60, "driving": 80, "walking": 6, "bicycling": 25}
+# 與後端相同：回應中狀態不是 OK 的元素記為 999 分鐘（整批請求失敗時不寫入）
+FAILED_DURATION = 999
+# commute_cache 中較此新的資料不重算
+DEFAULT_MAX_AGE_DAYS = 7
+# 後端 smartCommuteSearch 讀取的 Redis 快取鍵與有效期
+REDIS_KEY_PREFIX = "commute:"
+REDIS_CACHE_TTL = 7 * 24 * 3600
+# 批次間隔（秒），與後端相同避免超過 API 限制
+BATCH_INTERVAL = 0.1
+
+GOOGLE_DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+# 本機 stub 的平均速度（km/h）、道路繞行係數與大眾運輸的固定步行 / 等車時間（分鐘）
+STUB_SPEED_KMH = {"transit": 25, "driving": 30, "walking": 4.8, "bicycling": 15}
+STUB_DETOUR = 1.3
+STUB_TRANSIT_OVERHEAD = 8
+
+UPSERT_SQL = """
+INSERT INTO commute_cache (destination_hash, listing_id, duration_minutes, distance_km, updated_at)
+VALUES %s
+ON CONFLICT (listing_id, destination_hash) DO UPDATE SET
+    duration_minutes = EXCLUDED.duration_minutes,
+    distance_km = EXCLUDED.distance_km,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+def quantize_coordinate(value, precision=QUANTIZE_PRECISION):
+    # JavaScript 的 Math.round 是四捨五入（.5 往正無限大），Python 的 round 是銀行家捨入，不能直接使用
+    return math.floor(value / precision + 0.5) * precision
+
+
+def destination_hash(lat, lng, mode):
+    return f"{quantize_coordinate(lat):.3f},{quantize_coordinate(lng):.3f}:{mode}"
+
+
+def load_destinations(path=DEFAULT_DESTINATIONS_FILE):
+    """讀取熱門目的地；每個目的地可覆寫 defaults 中的 modes / radius_km / max_minutes"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    defaults = dict(DESTINATION_DEFAULTS)
+    defaults.update(config.get("defaults", {}))
+
+    destinations = []
+    for entry in config.get("destinations", []):
+        destination = dict(defaults)
+        destination.update(entry)
+        if destination.get("lat") is None or destination.get("lng") is None:
+            raise ValueError(f"目的地缺少 lat 或 lng: {entry}")
+        destination.setdefault("name", f"{destination['lat']},{destination['lng']}")
+        destinations.append(destination)
+    return destinations
+
+
+def expand_jobs(destinations):
+    """展開成 (目的地, 交通方式) 工作；量化後雜湊相同的合併，取較大的半徑與時間"""
+    jobs = {}
+    for destination in destinations:
+        for mode in destination["modes"]:
+            key = destination_hash(destination["lat"], destination["lng"], mode)
+            job = jobs.get(key)
+            if job is None:
+                jobs[key] = {
+                    "hash": key, "name": destination["name"], "mode": mode,
+                    "lat": float(destination["lat"]), "lng": float(destination["lng"]),
+                    "radius_km": float(destination["radius_km"]), "max_minutes": float(destination["max_minutes"]),
+                }
+            else:
+                job["radius_km"] = max(job["radius_km"], float(destination["radius_km"]))
+                job["max_minutes"] = max(job["max_minutes"], float(destination["max_minutes"]))
+    return list(jobs.values())
+
+
+def haversine_vector(lats, lngs, lat, lng):
+    """一次計算多個點到 (lat, lng) 的大圓距離（公里）"""
+    lat1 = np.radians(lats)
+    lat2 = math.radians(lat)
+    d_lat = lat2 - lat1
+    d_lng = math.radians(lng) - np.radians(lngs)
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * math.cos(lat2) * np.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def prefilter(listings, job, cached_ids=()):
+    """回傳需要查詢的物件索引：在半徑內、直線距離在速度上限可及範圍內，且沒有新鮮快取"""
+    ids, lats, lngs = listings
+    distances = haversine_vector(lats, lngs, job["lat"], job["lng"])
+    reachable_km = MAX_SPEED_KMH.get(job["mode"], max(MAX_SPEED_KMH.values())) * job["max_minutes"] / 60
+    mask = distances <= min(job["radius_km"], reachable_km)
+    if cached_ids:
+        mask &= ~np.isin(ids, np.fromiter(cached_ids, dtype=np.int64, count=len(cached_ids)))
+    return np.flatnonzero(mask)
+
+
+def pack_requests(needed):
+    """將 {物件索引: 目的地雜湊集合} 打包成請求 [(物件索引清單, 目的地雜湊清單)]
+
+    每個物件需要的目的地排序後每 4 個一段，需要同一段目的地的物件放在同一批，搭配 100 / 段長 個起點；
+    每個請求的 起點 × 終點 都是需要的元素，不會為了湊滿而多算，相鄰目的地共用起點時請求數最少。
+    """
+    destinations_per_request = MAX_ELEMENTS // MAX_ORIGINS
+    chunks = {}
+    for origin, hashes in needed.items():
+        hashes = sorted(hashes)
+        for start in range(0, len(hashes), destinations_per_request):
+            chunks.setdefault(tuple(hashes[start:start + destinations_per_request]), []).append(origin)
+
+    plan = []
+    for chunk, origins in chunks.items():
+        origins.sort()
+        origins_per_request = min(MAX_ORIGINS, MAX_ELEMENTS // len(chunk))
+        for offset in range(0, len(origins), origins_per_request):
+            plan.append((origins[offset:offset + origins_per_request], list(chunk)))
+    return plan
+
+
+class StubDistanceMatrixClient:
+    """本機估算的距離矩陣：直線距離 × 繞行係數 ÷ 平均速度，不呼叫外部 API，供測試與演練"""
+
+    def __init__(self):
+        self.calls = 0
+        self.elements = 0
+
+    def matrix(self, origins, destinations, mode):
+        self.calls += 1
+        self.elements += len(origins) * len(destinations)
+        speed = STUB_SPEED_KMH.get(mode, STUB_SPEED_KMH["driving"])
+        rows = []
+        for origin_lat, origin_lng in origins:
+            row = []
+            for dest_lat, dest_lng in destinations:
+                distance_km = haversine_km(origin_lat, origin_lng, dest_lat, dest_lng) * STUB_DETOUR
+                minutes = distance_km / speed * 60 + (STUB_TRANSIT_OVERHEAD if mode == "transit" else 0)
+                row.append((minutes * 60, distance_km * 1000))
+            rows.append(row)
+        return rows
+
+
+class GoogleDistanceMatrixClient:
+    """Google Distance Matrix API，請求格式與後端 mapService.getDistanceMatrix 相同"""
+
+    def __init__(self, api_key, timeout=30, max_attempts=3):
+        import requests
+
+        self.session = requests.Session()
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.calls = 0
+        self.elements = 0
+
+    def matrix(self, origins, destinations, mode):
+        params = {
+            "origins": "|".join(f"{lat},{lng}" for lat, lng in origins),
+            "destinations": "|".join(f"{lat},{lng}" for lat, lng in destinations),
+            "mode": mode,
+            "key": self.api_key,
+        }
+        for attempt in range(self.max_attempts):
+            self.calls += 1
+            self.elements += len(origins) * len(destinations)
+            try:
+                with METRICS.timer("distance_matrix"):
+                    response = self.session.get(GOOGLE_DISTANCE_MATRIX_URL, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+                if data.get("status") == "OK":
+                    return [
+                        [
+                            (element["duration"]["value"], element.get("distance", {}).get("value"))
+                            if element.get("status") == "OK" and element.get("duration") else None
+                            for element in row.get("elements", [])
+                        ]
+                        for row in data.get("rows", [])
+                    ]
+                print(f"Distance Matrix 回應狀態: {data.get('status')} {data.get('error_message', '')}")
+                if data.get("status") not in ("OVER_QUERY_LIMIT", "UNKNOWN_ERROR"):
+                    return None
+            except Exception as e:
+                print(f"Distance Matrix 請求失敗: {e}")
+            METRICS.incr("distance_matrix_retry")
+            METRICS.sleep(2 ** attempt + random.uniform(0, 1), phase="distance_matrix_backoff")
+        return None
+
+
+def load_active_listings(connection):
+    """回傳 (ids, lats, lngs) 三個 numpy 陣列；座標為 0 的物件略過"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, latitude, longitude FROM listings "
+            "WHERE is_active AND latitude <> 0 AND longitude <> 0 ORDER BY id"
+        )
+        rows = cursor.fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+
+def load_cached_ids(connection, hashes, max_age_days=DEFAULT_MAX_AGE_DAYS):
+    """各目的地雜湊在 commute_cache 中仍新鮮的物件 id"""
+    cached = {destination: set() for destination in hashes}
+    if not hashes or max_age_days is None:
+        return cached
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT destination_hash, listing_id FROM commute_cache "
+            "WHERE destination_hash = ANY(%s) AND updated_at > now() - make_interval(days => %s)",
+            (list(hashes), int(max_age_days)),
+        )
+        for destination, listing_id in cursor:
+            cached[destination].add(listing_id)
+    return cached
+
+
+def upsert_commute_cache(connection, rows, page_size=1000):
+    """rows: [(destination_hash, listing_id, duration_minutes, distance_km)]"""
+    from psycopg2.extras import execute_values
+
+    if not rows:
+        return 0
+    with connection:
+        with connection.cursor() as cursor:
+            execute_values(cursor, UPSERT_SQL, rows, template="(%s, %s, %s, %s, now())", page_size=page_size)
+    return len(rows)
+
+
+def warm_redis(redis_url, results):
+    """合併進後端 smartCommuteSearch 使用的 Redis 鍵 commute:<destinationHash>（JSON：{listingId: {...}}）"""
+    import redis
+
+    client = redis.Redis.from_url(redis_url, decode_responses=True)
+    try:
+        for destination, entries in results.items():
+            key = REDIS_KEY_PREFIX + destination
+            try:
+                merged = json.loads(client.get(key) or "{}")
+            except json.JSONDecodeError:
+                merged = {}
+            merged.update({str(listing_id): entry for listing_id, entry in entries.items()})
+            client.setex(key, REDIS_CACHE_TTL, json.dumps(merged))
+    finally:
+        client.close()
+
+
+def precompute_commutes(listings, jobs, client, cached=None):
+    """對每個工作預先過濾物件、打包請求並呼叫 client，回傳 {目的地雜湊: {listing_id: {durationMinutes, distanceKm}}}"""
+    cached = cached or {}
+    ids, lats, lngs = listings
+    results = {job["hash"]: {} for job in jobs}
+    jobs_by_hash = {job["hash"]: job for job in jobs}
+
+    needed_by_mode = {}
+    for job in jobs:
+        with METRICS.timer("commute_prefilter"):
+            survivors = prefilter(listings, job, cached.get(job["hash"], ()))
+        METRICS.incr("commute_pairs_skipped", len(ids) - len(survivors))
+        print(f"{job['name']}（{job['mode']}）：{len(ids)} 筆物件中 {len(survivors)} 筆需要計算")
+        needed = needed_by_mode.setdefault(job["mode"], {})
+        for origin in survivors.tolist():
+            needed.setdefault(origin, set()).add(job["hash"])
+
+    for mode, needed in needed_by_mode.items():
+        plan = pack_requests(needed)
+        for batch_num, (origins, hashes) in enumerate(plan):
+            destinations = [(jobs_by_hash[key]["lat"], jobs_by_hash[key]["lng"]) for key in hashes]
+            rows = client.matrix([(float(lats[origin]), float(lngs[origin])) for origin in origins], destinations, mode)
+            if rows is None:
+                # 整批請求失敗（額度、網路或 API 錯誤）不寫入任何結果，下次執行會重算；
+                # 寫成 999 分鐘會被當成新鮮資料，這些物件一週內都不會出現在通勤搜尋
+                METRICS.incr("commute_batch_failed")
+                METRICS.incr("commute_pairs_unfetched", len(origins) * len(hashes))
+                print(f"Distance Matrix 第 {batch_num + 1}/{len(plan)} 批失敗，略過 {len(origins)} 個起點")
+            else:
+                for i, origin in enumerate(origins):
+                    for j, key in enumerate(hashes):
+                        if i >= len(rows) or j >= len(rows[i]):
+                            # 回應缺少此元素，不當成查詢失敗
+                            METRICS.incr("commute_pairs_unfetched")
+                            continue
+                        element = rows[i][j]
+                        if element is None:
+                            # 與後端相同：只有回應中個別元素狀態不是 OK 時才記為 999 分鐘
+                            entry = {"durationMinutes": FAILED_DURATION, "distanceKm": None}
+                            METRICS.incr("commute_element_failed")
+                        else:
+                            duration_seconds, distance_m = element
+                            entry = {
+                                "durationMinutes": math.ceil(duration_seconds / 60),
+                                "distanceKm": distance_m / 1000 if distance_m is not None else None,
+                            }
+                        results[key][int(ids[origin])] = entry
+            if batch_num + 1 < len(plan):
+                METRICS.sleep(BATCH_INTERVAL, phase="distance_matrix_interval")
+    return results
+
+
+def result_rows(results):
+    return [
+        (destination, listing_id, entry["durationMinutes"], entry["distanceKm"])
+        for destination, entries in results.items()
+        for listing_id, entry in entries.items()
+    ]
+
+
+def make_client(name):
+    if name == "stub":
+        return StubDistanceMatrixClient()
+    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+    if not api_key or api_key == "your_google_maps_api_key_here":
+        raise ValueError("Google Maps API Key 未設定（GOOGLE_MAPS_API_KEY），或改用 --client stub")
+    return GoogleDistanceMatrixClient(api_key)
+
+
+if __name__ == "__main__":
+    from bulk_loader import connect_database
+
+    parser = argparse.ArgumentParser(description="為熱門目的地預先計算通勤時間並寫入 commute_cache")
+    parser.add_argument("--destinations", default=DEFAULT_DESTINATIONS_FILE, help="熱門目的地設定檔")
+    parser.add_argument("--database-url", default=None, help="預設讀取 DATABASE_URL 環境變數")
+    parser.add_argument("--client", choices=["google", "stub"], default="google",
+                        help="google 呼叫 Distance Matrix API；stub 以直線距離估算，不呼叫外部 API")
+    parser.add_argument("--max-age-days", type=int, default=DEFAULT_MAX_AGE_DAYS,
+                        help="commute_cache 中較此新的資料不重算")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL"),
+                        help="同時寫入後端 smartCommuteSearch 讀取的 Redis 快取（未設定則略過）")
+    parser.add_argument("--dry-run", action="store_true", help="只計算需要的請求數，不呼叫 API 也不寫入")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    jobs = expand_jobs(load_destinations(args.destinations))
+    connection = connect_database(args.database_url)
+    try:
+        listings = load_active_listings(connection)
+        cached = load_cached_ids(connection, [job["hash"] for job in jobs], args.max_age_days)
+        client = StubDistanceMatrixClient() if args.dry_run else make_client(args.client)
+        results = precompute_commutes(listings, jobs, client, cached)
+        rows = result_rows(results)
+        print(f"共 {len(jobs)} 個目的地 / 交通方式，{len(listings[0])} 筆上架物件，"
+              f"{client.calls} 次請求、{client.elements} 個元素，取得 {len(rows)} 筆通勤時間")
+        if not args.dry_run:
+            print(f"已寫入 commute_cache: {upsert_commute_cache(connection, rows)} 筆")
+            if args.redis_url:
+                warm_redis(args.redis_url, results)
+                print(f"已更新 Redis 快取: {len(results)} 個目的地")
+    finally:
+        connection.close()
+    print(f"耗時: {time.time() - start_time:.1f} 秒")
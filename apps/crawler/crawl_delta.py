@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from crawler import DATA_FOLDER
+from bulk_loader import STAGING_COLUMNS, SOURCE, iter_crawler_records, normalize_record, normalize_typed_record
+
+DEFAULT_DELTA_FILE = os.path.join(DATA_FOLDER, "crawl_delta.json")
+# 比對的欄位即寫入 listings 的欄位；縮圖、geohash 等只在爬蟲端使用的欄位變動不會產生更新
+DELTA_FIELDS = [column for column in STAGING_COLUMNS if column not in ("row_num", "source_id")]
+
+
+def field_hash(value):
+    """單一欄位值的 8 bytes 雜湊；先序列化成 JSON，清單與數值的比對與型別一致"""
+    encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=8).digest()
+
+
+def _normalizer_for(path):
+    return normalize_typed_record if path.endswith(".parquet") else normalize_record
+
+
+def iter_normalized(path):
+    """讀取爬蟲輸出並整理成 listings 欄位，略過缺少編號或標題的資料"""
+    normalize = _normalizer_for(path)
+    for item in iter_crawler_records(path):
+        try:
+            normalized = normalize(item)
+        except Exception as e:
+            print(f"整理資料失敗: {e}")
+            normalized = None
+        if normalized is not None:
+            yield normalized
+
+
+def load_field_hashes(path):
+    """回傳 {source_id: (各欄位雜湊, ...)}；同一編號出現多次時以最後一筆為準（與 bulk_loader 合併規則相同）"""
+    return {
+        record["source_id"]: tuple(field_hash(record[name]) for name in DELTA_FIELDS)
+        for record in iter_normalized(path)
+    }
+
+
+def compute_delta(previous_path, current_path):
+    """比對兩次爬取結果，回傳 {"added", "changed", "removed", "unchanged"}
+
+    記憶體中只保留上一次每筆物件的欄位雜湊，本次結果逐筆串流比對：
+    新出現的物件保留完整欄位，有變動的只保留變動的欄位，消失的只保留編號。
+    """
+    previous = load_field_hashes(previous_path)
+    # 同一編號再次出現時覆寫先前的比對結果；未變動的只記 None
+    results = {}
+    for record in iter_normalized(current_path):
+        source_id = record["source_id"]
+        hashes = previous.get(source_id)
+        if hashes is None:
+            results[source_id] = ("added", record)
+            continue
+        changed_fields = {
+            name: record[name]
+            for name, old_hash in zip(DELTA_FIELDS, hashes)
+            if field_hash(record[name]) != old_hash
+        }
+        results[source_id] = ("changed", changed_fields) if changed_fields else None
+
+    delta = {"source": SOURCE, "previous": previous_path, "current": current_path,
+             "added": [], "changed": [], "removed": [], "unchanged": 0}
+    for source_id, result in results.items():
+        if result is None:
+            delta["unchanged"] += 1
+        elif result[0] == "added":
+            delta["added"].append(result[1])
+        else:
+            delta["changed"].append({"source_id": source_id, "fields": result[1]})
+    delta["removed"] = [source_id for source_id in previous if source_id not in results]
+    return delta
+
+
+def write_delta(delta, path=DEFAULT_DELTA_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(delta, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def print_stats(delta):
+    field_counts = {}
+    for change in delta["changed"]:
+        for name in change["fields"]:
+            field_counts[name] = field_counts.get(name, 0) + 1
+    print(f"差異比對：新增 {len(delta['added'])} 筆，變動 {len(delta['changed'])} 筆，"
+          f"下架 {len(delta['removed'])} 筆，未變動 {delta['unchanged']} 筆")
+    if field_counts:
+        summary = "、".join(f"{name} {count}" for name, count in sorted(field_counts.items(), key=lambda item: -item[1]))
+        print(f"   變動欄位：{summary}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比對兩次爬取結果，輸出新增、變動欄位與下架的物件")
+    parser.add_argument("previous", help="上一次匯入的爬蟲輸出（.json、.jsonl 或 .parquet）")
+    parser.add_argument("current", help="本次爬蟲輸出")
+    parser.add_argument("--output", default=DEFAULT_DELTA_FILE, help="差異檔輸出路徑")
+    args = parser.parse_args()
+
+    delta = compute_delta(args.previous, args.current)
+    write_delta(delta, args.output)
+    print_stats(delta)
+    print(f"已寫入差異檔: {args.output}")
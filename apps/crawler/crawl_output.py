@@ -0,0 +1,171 @@
+import os
+import json
+import time
+
+from crawler import DATA_FOLDER
+
+DEFAULT_JSONL_FILE = os.path.join(DATA_FOLDER, "stable_crawl_result.jsonl")
+DEFAULT_CHECKPOINT_FILE = os.path.join(DATA_FOLDER, "stable_crawl_checkpoint.json")
+DEFAULT_JSON_FILE = os.path.join(DATA_FOLDER, "stable_crawl_result.json")
+
+
+def _fsync_directory(path):
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class JsonlRecordWriter:
+    """每抓到一筆就追加寫入 JSONL，記憶體中不保留資料"""
+
+    def __init__(self, path=DEFAULT_JSONL_FILE, append=False):
+        self.path = path
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
+def iter_jsonl(path):
+    """逐行讀取 JSONL；當機時寫到一半的最後一行會被略過"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def rewrite_jsonl(path, records):
+    """以暫存檔寫出 records 後原子替換 path；records 可以是讀取 path 本身的產生器，回傳寫入筆數"""
+    count = 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def truncate_partial_line(path):
+    """移除檔尾未寫完的一行，讓續跑時的追加寫入從完整的行開始"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+
+        # 由檔尾往前找最後一個換行，只讀取必要的區塊
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            newline_idx = f.read(step).rfind(b"\n")
+            if newline_idx != -1:
+                f.truncate(pos + newline_idx + 1)
+                return
+        f.truncate(0)
+
+
+def export_json_array(jsonl_path=DEFAULT_JSONL_FILE, json_path=DEFAULT_JSON_FILE):
+    """將 JSONL 串流轉成後端匯入用的 JSON 陣列，不一次載入全部資料"""
+    count = 0
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for record in iter_jsonl(jsonl_path):
+            f.write(",\n  " if count else "\n  ")
+            f.write(json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+            count += 1
+        f.write("\n]\n" if count else "]\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, json_path)
+    return count
+
+
+class CrawlCheckpoint:
+    """地區 / 頁碼進度檔，以 fsync + 原子替換寫入；已完成的網址由 JSONL 本身還原
+
+    地區交錯處理，因此每個地區各自記錄下一個要處理的頁碼；
+    current_region 為最後處理中的地區，檢查點之後才寫入的資料歸入此地區。
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_FILE):
+        self.path = path
+        self.region_pages = {}
+        self.finished_regions = []
+        self.current_region = None
+        self.region_counts = {}
+        self.total_records = 0
+        self.updated_at = None
+        # 續跑時，上次檢查點之後才寫入的筆數（不寫入檔案）
+        self.pending_records = 0
+
+    @classmethod
+    def load(cls, path=DEFAULT_CHECKPOINT_FILE):
+        checkpoint = cls(path)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        # 舊版檢查點只有 region_index / page_num，無法對應到地區名稱，各地區從第一頁重新掃描（已寫入的物件仍會略過）
+        checkpoint.region_pages = state.get("region_pages", {})
+        checkpoint.finished_regions = state.get("finished_regions", [])
+        checkpoint.current_region = state.get("current_region")
+        checkpoint.region_counts = state.get("region_counts", {})
+        checkpoint.total_records = state.get("total_records", 0)
+        checkpoint.updated_at = state.get("updated_at")
+        return checkpoint
+
+    def save(self):
+        self.updated_at = time.time()
+        state = {
+            "region_pages": self.region_pages,
+            "finished_regions": self.finished_regions,
+            "current_region": self.current_region,
+            "region_counts": self.region_counts,
+            "total_records": self.total_records,
+            "updated_at": self.updated_at,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_directory(self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
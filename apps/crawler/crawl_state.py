@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from crawler import DATA_FOLDER
+from house_parser import extract_listing_id
+
+DEFAULT_STATE_DB = os.path.join(DATA_FOLDER, "crawl_state.db")
+
+# 重抓間隔（秒）
+STALE_AFTER = 7 * 24 * 3600          # 一般物件一週重抓一次
+CHANGED_STALE_AFTER = 24 * 3600      # 近期有變動的物件每天重抓
+RECENT_CHANGE_WINDOW = 7 * 24 * 3600  # 「近期變動」的定義
+RETRY_AFTER = 6 * 3600               # 上次抓取失敗後的重試間隔
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id   TEXT PRIMARY KEY,
+    url          TEXT NOT NULL,
+    region       TEXT,
+    first_seen   REAL NOT NULL,
+    last_seen    REAL NOT NULL,
+    last_fetched REAL,
+    last_changed REAL,
+    content_hash TEXT,
+    outcome      TEXT,
+    fail_count   INTEGER NOT NULL DEFAULT 0,
+    change_count INTEGER NOT NULL DEFAULT 0,
+    record       TEXT,
+    summary_hash TEXT
+)
+"""
+
+
+def content_hash(house_data):
+    """以排序後的 JSON 計算內容雜湊，用來判斷物件是否變動"""
+    payload = json.dumps(house_data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class CrawlStateStore:
+    """以 SQLite 保存每個物件的抓取時間、內容雜湊與結果"""
+
+    def __init__(self, path=DEFAULT_STATE_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self._ensure_column("summary_hash", "TEXT")
+        self.conn.commit()
+
+    def _ensure_column(self, name, column_type):
+        """舊版資料庫補上新欄位"""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(listings)")}
+        if name not in columns:
+            self.conn.execute(f"ALTER TABLE listings ADD COLUMN {name} {column_type}")
+
+    def get(self, listing_id):
+        row = self.conn.execute("SELECT * FROM listings WHERE listing_id = ?", (listing_id,)).fetchone()
+        return dict(row) if row else None
+
+    def mark_seen(self, house_url, region=None, now=None, commit=True):
+        """列表頁上看到物件時呼叫，新物件會在此建立紀錄；commit=False 時由呼叫者統一提交"""
+        listing_id = extract_listing_id(house_url)
+        if not listing_id:
+            return None
+        now = now or time.time()
+        self.conn.execute(
+            """
+            INSERT INTO listings (listing_id, url, region, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(listing_id) DO UPDATE SET url = excluded.url, last_seen = excluded.last_seen,
+                region = COALESCE(excluded.region, listings.region)
+            """,
+            (listing_id, house_url, region, now, now),
+        )
+        if commit:
+            self.conn.commit()
+        return listing_id
+
+    def record_fetch(self, house_url, house_data, region=None, now=None, summary_hash=None):
+        """記錄一次詳細頁抓取結果，回傳 new / changed / unchanged / failed
+
+        summary_hash 為抓取當下列表卡片的摘要雜湊，只在成功時寫入，
+        之後列表摘要與它不同就代表物件有變動。
+        """
+        listing_id = self.mark_seen(house_url, region, now)
+        if not listing_id:
+            return None
+        now = now or time.time()
+        previous = self.get(listing_id)
+
+        if not house_data:
+            self.conn.execute(
+                "UPDATE listings SET last_fetched = ?, outcome = 'failed', fail_count = fail_count + 1 "
+                "WHERE listing_id = ?",
+                (now, listing_id),
+            )
+            self.conn.commit()
+            return "failed"
+
+        new_hash = content_hash(house_data)
+        if previous["content_hash"] is None:
+            status = "new"
+        elif previous["content_hash"] != new_hash:
+            status = "changed"
+        else:
+            status = "unchanged"
+
+        self.conn.execute(
+            """
+            UPDATE listings SET last_fetched = ?, outcome = 'ok', fail_count = 0, content_hash = ?, record = ?,
+                last_changed = CASE WHEN ? = 'changed' THEN ? ELSE last_changed END,
+                change_count = change_count + CASE WHEN ? = 'changed' THEN 1 ELSE 0 END,
+                summary_hash = COALESCE(?, summary_hash)
+            WHERE listing_id = ?
+            """,
+            (now, new_hash, json.dumps(house_data, ensure_ascii=False), status, now, status, summary_hash,
+             listing_id),
+        )
+        self.conn.commit()
+        return status
+
+    def set_summary_hash(self, listing_id, summary_hash, commit=True):
+        self.conn.execute("UPDATE listings SET summary_hash = ? WHERE listing_id = ?", (summary_hash, listing_id))
+        if commit:
+            self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
+
+    def last_record(self, listing_id):
+        row = self.conn.execute("SELECT record FROM listings WHERE listing_id = ?", (listing_id,)).fetchone()
+        return json.loads(row["record"]) if row and row["record"] else None
+
+    def close(self):
+        self.conn.close()
+
+
+class RecrawlScheduler:
+    """依新鮮度決定哪些詳細頁需要抓取：新物件優先，其次是列表摘要有變動的物件，再來是過期物件；
+    近期變動的物件較常重抓
+
+    列表頁是一頁一頁看到的，過期物件先暫存起來，等整個地區的列表頁都看過後才由 plan_stale 分配剩餘預算，
+    避免前幾頁的過期物件先用完預算，後面頁面的新物件反而抓不到。
+    """
+
+    def __init__(self, store, budget=None, stale_after=STALE_AFTER, changed_stale_after=CHANGED_STALE_AFTER,
+                 retry_after=RETRY_AFTER):
+        self.store = store
+        self.budget = budget
+        self.stale_after = stale_after
+        self.changed_stale_after = changed_stale_after
+        self.retry_after = retry_after
+        self.fetched = 0
+        self._pending_summaries = {}
+        # {地區: {網址: 過期倍數}}，等待 plan_stale 分配預算
+        self._stale = {}
+
+    @property
+    def remaining_budget(self):
+        if self.budget is None:
+            return None
+        return max(0, self.budget - self.fetched)
+
+    def _interval(self, state, now):
+        if state["outcome"] == "failed":
+            return self.retry_after
+        if state["last_changed"] and now - state["last_changed"] <= RECENT_CHANGE_WINDOW:
+            return self.changed_stale_after
+        return self.stale_after
+
+    def _apply_budget(self, to_fetch, reusable):
+        """超出剩餘預算的網址改為沿用舊紀錄（沒有舊紀錄的直接略過）"""
+        remaining = self.remaining_budget
+        if remaining is not None and len(to_fetch) > remaining:
+            deferred = to_fetch[remaining:]
+            to_fetch = to_fetch[:remaining]
+            reusable.extend(house_url for house_url in deferred if self.reuse(house_url))
+        return to_fetch, reusable
+
+    def plan(self, house_urls, region=None, now=None, summaries=None):
+        """回傳 (to_fetch, reusable)
+
+        to_fetch 為「新物件 → 摘要變動」並受剩餘預算限制；過期物件先暫存，之後由 plan_stale 取出。
+        reusable 為仍新鮮、可直接沿用上次結果的網址。
+        summaries 為 {網址: 列表卡片摘要}，摘要雜湊與上次抓取時不同的物件視為已變動。
+        """
+        now = now or time.time()
+        summaries = summaries or {}
+        new_urls = []
+        changed_urls = []
+        reusable = []
+        stale = self._stale.setdefault(region, {})
+
+        for house_url in house_urls:
+            listing_id = self.store.mark_seen(house_url, region, now, commit=False)
+            state = self.store.get(listing_id) if listing_id else None
+            current_hash = (summaries.get(house_url) or {}).get("summary_hash")
+            if current_hash:
+                self._pending_summaries[house_url] = current_hash
+
+            if state is None or state["last_fetched"] is None:
+                new_urls.append(house_url)
+                continue
+
+            if current_hash and state["outcome"] == "ok":
+                if state["summary_hash"] is None:
+                    # 尚未記錄過摘要的舊物件：以目前摘要作為基準
+                    self.store.set_summary_hash(listing_id, current_hash, commit=False)
+                elif state["summary_hash"] != current_hash:
+                    changed_urls.append(house_url)
+                    continue
+
+            interval = self._interval(state, now)
+            overdue = (now - state["last_fetched"]) / interval if interval > 0 else float("inf")
+            if overdue >= 1:
+                stale[house_url] = overdue
+            elif state["record"]:
+                reusable.append(house_url)
+
+        # 整頁只提交一次
+        self.store.commit()
+        return self._apply_budget(new_urls + changed_urls, reusable)
+
+    def plan_stale(self, region=None):
+        """地區的列表頁都看過後呼叫：取出暫存的過期物件，過期越久越前面並受剩餘預算限制，回傳 (to_fetch, reusable)"""
+        stale = self._stale.pop(region, {})
+        return self._apply_budget(sorted(stale, key=stale.get, reverse=True), [])
+
+    def record(self, house_url, house_data, region=None):
+        """記錄抓取結果並扣除預算"""
+        self.fetched += 1
+        summary_hash = self._pending_summaries.pop(house_url, None)
+        return self.store.record_fetch(house_url, house_data, region, summary_hash=summary_hash)
+
+    def reuse(self, house_url):
+        """取出仍新鮮物件的上次結果"""
+        listing_id = extract_listing_id(house_url)
+        return self.store.last_record(listing_id) if listing_id else None
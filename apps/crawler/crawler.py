@@ -1,16 +1,14 @@
 import time
-import json
 import os
-import re
-from urllib.parse import parse_qs, urlparse
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException, InvalidSessionIdException
+from selenium.common.exceptions import TimeoutException, WebDriverException, InvalidSessionIdException
 import random
-import traceback
+
+from house_parser import parse_house_html
+from metrics import METRICS
+from rate_controller import RATE_CONTROLLER
 
 LOG_FOLDER = "logs"
 if not os.path.exists(LOG_FOLDER):
@@ -20,15 +18,43 @@ DATA_FOLDER = "data"
 if not os.path.exists(DATA_FOLDER):
     os.makedirs(DATA_FOLDER)
 
-def setup_browser():
-    """設置Chrome瀏覽器"""
+SITE_ORIGIN = "https://rent.houseprice.tw"
+
+# 離線重播時，將網站網址改指向本機的重播伺服器（見 replay.py）
+_replay_origin = os.getenv("CRAWLER_BASE_URL")
+# 錄製模式下，每個載入的頁面都會交給 recorder.save(url, html, kind) 存進語料庫
+_page_recorder = None
+# 磁碟回應快取（見 response_cache.py），None 表示不使用快取
+_response_cache = None
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+]
+
+# 精簡模式封鎖的資源：圖片、影音、字型、樣式表與追蹤程式（欄位都從 DOM 取得，不需要這些資源）
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.mp4", "*.webm", "*.mp3",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*", "*clarity.ms*",
+]
+
+# 頁面就緒條件：所需的 DOM 元素出現即可開始解析
+DETAIL_READY_SELECTORS = ("h1", "span.text-3xl.font-bold.text-c-orange-700", "div.base_info")
+LIST_READY_SELECTORS = ("a.group",)
+READY_TIMEOUT = 15
+
+def setup_browser(lean=True):
+    """設置Chrome瀏覽器
+
+    lean=True 時使用精簡設定：eager 載入策略、封鎖重資源、不使用隱式等待（改由 safe_get_page 明確等待元素）。
+    """
     from selenium.webdriver.chrome.options import Options
     
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    ]
-    user_agent = random.choice(user_agents)
+    user_agent = random.choice(USER_AGENTS)
     
     chrome_options = Options()
     chrome_options.add_argument("--headless=new")
@@ -40,285 +66,168 @@ def setup_browser():
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
     
+    if lean:
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-background-networking")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.media_stream": 2,
+        })
+    
     browser = webdriver.Chrome(options=chrome_options)
-    browser.set_page_load_timeout(120)
-    browser.implicitly_wait(10)
+    if lean:
+        browser.set_page_load_timeout(30)
+        browser.implicitly_wait(0)
+        browser.execute_cdp_cmd("Network.enable", {})
+        browser.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    else:
+        browser.set_page_load_timeout(120)
+        browser.implicitly_wait(10)
     browser.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
     
     return browser
 
-def safe_get_page(browser, url, max_retries=3):
-    """安全地訪問頁面，帶重試機制"""
+def set_replay_origin(origin):
+    """設定重播伺服器位址，None 表示連線到真正的網站"""
+    global _replay_origin
+    _replay_origin = origin
+
+def set_page_recorder(recorder):
+    """設定頁面錄製器，None 表示停止錄製"""
+    global _page_recorder
+    _page_recorder = recorder
+
+def set_response_cache(cache):
+    """設定瀏覽器與 HTTP 抓取共用的回應快取，None 表示停用"""
+    global _response_cache
+    _response_cache = cache
+
+def get_response_cache():
+    return _response_cache
+
+def resolve_url(url):
+    """重播模式下把網站網址換成重播伺服器網址，其餘情況原樣返回"""
+    if _replay_origin and url.startswith(SITE_ORIGIN):
+        return _replay_origin.rstrip("/") + url[len(SITE_ORIGIN):]
+    return url
+
+def record_page(url, html, kind):
+    """錄製模式下保存頁面 HTML；url 一律使用網站原始網址"""
+    if _page_recorder is not None and html:
+        _page_recorder.save(url, html, kind)
+
+# 出現這些錯誤訊息代表 Chrome / chromedriver 已經失效，重試同一個工作階段沒有意義
+DEAD_SESSION_MESSAGES = (
+    "invalid session id", "session deleted", "chrome not reachable", "disconnected",
+    "no such window", "target window already closed", "connection refused", "max retries exceeded",
+)
+
+def is_session_dead(error):
+    """判斷例外是否代表瀏覽器工作階段已失效（需要重新啟動瀏覽器）"""
+    if isinstance(error, InvalidSessionIdException):
+        return True
+    if isinstance(error, TimeoutException):
+        return False
+    if isinstance(error, (WebDriverException, ConnectionError)) or type(error).__module__.startswith("urllib3"):
+        message = str(error).lower()
+        return any(keyword in message for keyword in DEAD_SESSION_MESSAGES)
+    return False
+
+def wait_until_ready(browser, ready_selectors=None, timeout=READY_TIMEOUT):
+    """等待所需元素出現；未指定元素時等待 DOM 解析完成。逾時回傳 False"""
+    def is_ready(driver):
+        if ready_selectors:
+            return all(driver.find_elements(By.CSS_SELECTOR, selector) for selector in ready_selectors)
+        return driver.execute_script("return document.readyState") != "loading"
+    
+    try:
+        WebDriverWait(browser, timeout, poll_frequency=0.2).until(is_ready)
+        return True
+    except TimeoutException:
+        return False
+
+def safe_get_page(browser, url, max_retries=3, ready_selectors=None):
+    """安全地訪問頁面，帶重試機制；頁面就緒即返回，請求間隔與失敗後的退避交給 RATE_CONTROLLER"""
+    target_url = resolve_url(url)
     for attempt in range(max_retries):
+        if attempt:
+            METRICS.incr("navigation_retry")
+        RATE_CONTROLLER.acquire(target_url)
         try:
-            browser.get(url)
-            time.sleep(random.uniform(3, 6))
-            
-            if "租屋" in browser.title or "house" in browser.current_url:
+            start_time = time.perf_counter()
+            with METRICS.timer("navigation"):
+                browser.get(target_url)
+            
+            # 某些物件缺少價格或基本資料區塊，逾時後仍以標題 / 網址判斷是否載入成功
+            with METRICS.timer("wait"):
+                ready = wait_until_ready(browser, ready_selectors)
+            if not ready:
+                METRICS.incr("ready_timeout")
+            
+            has_marker = "租屋" in browser.title
+            # 網域本身含 house，網址條件幾乎都成立；給速率控制的訊號只看標題標記
+            # 驗證頁或錯誤頁也可能剛好帶有必要元素的選擇器，缺少標記一律視為失敗
+            if has_marker:
+                RATE_CONTROLLER.record_success(target_url, time.perf_counter() - start_time)
+            else:
+                RATE_CONTROLLER.record_failure(target_url, "missing_marker")
+            if has_marker or "house" in browser.current_url:
                 return True
                 
         except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(random.uniform(5, 10))
-            else:
+            if is_session_dead(e):
+                # 交給 BrowserSession 重啟瀏覽器
+                raise
+            timed_out = isinstance(e, TimeoutException)
+            METRICS.incr("navigation_timeout" if timed_out else "navigation_error")
+            RATE_CONTROLLER.record_failure(target_url, "timeout" if timed_out else "error")
+            if attempt == max_retries - 1:
                 return False
+    METRICS.incr("navigation_failed")
     return False
 
-def extract_coordinates(url):
-    """從Google Maps URL中提取經緯度"""
-    try:
-        parsed_url = urlparse(url)
-        query_params = parse_qs(parsed_url.query)
-        
-        if 'query' in query_params:
-            coords = query_params['query'][0].split(',')
-            if len(coords) == 2:
-                return {"latitude": float(coords[0]), "longitude": float(coords[1])}
-        
-        coords_match = re.search(r'query=(-?\d+\.\d+),(-?\d+\.\d+)', url)
-        if coords_match:
-            return {"latitude": float(coords_match.group(1)), "longitude": float(coords_match.group(2))}
-            
-        return {"latitude": None, "longitude": None}
-    except Exception as e:
-        return {"latitude": None, "longitude": None}
+def page_is_complete(browser, ready_selectors=None):
+    """標題含租屋標記，或必要元素都已出現時才視為完整頁面"""
+    if "租屋" in browser.title:
+        return True
+    return bool(ready_selectors) and all(browser.find_elements(By.CSS_SELECTOR, selector)
+                                         for selector in ready_selectors)
+
+def fetch_page_html(browser, url, kind, ready_selectors=None):
+    """取得頁面 HTML：快取仍新鮮時直接使用，否則以瀏覽器載入並寫回快取。失敗回傳 None
+
+    瀏覽器拿不到回應標頭，這裡只使用新鮮的快取；ETag / Last-Modified 重新驗證由 http_fetcher 負責。
+    """
+    html = _response_cache.get_fresh(url, kind) if _response_cache else None
+    if html is None:
+        if not safe_get_page(browser, url, ready_selectors=ready_selectors):
+            return None
+        with METRICS.timer("page_source"):
+            html = browser.page_source
+        if _response_cache:
+            if page_is_complete(browser, ready_selectors):
+                _response_cache.put(url, html, kind)
+            else:
+                # 驗證頁或錯誤頁也會通過 safe_get_page 的網址判斷，不能寫入快取後當成新鮮頁面重複使用
+                METRICS.incr("cache_skip_incomplete")
+    record_page(url, html, kind)
+    return html
 
 def crawl_house_details(browser, house_url, target_region=None):
     """爬取單個房屋的詳細資訊"""
     try:
-        if not safe_get_page(browser, house_url):
-            return None
-        
-        time.sleep(2)
-        house_data = {"url": house_url}
-        
-        # 爬取房屋名稱
-        try:
-            title_element = browser.find_element(By.CSS_SELECTOR, "h1.mb-3.text-2xl.font-bold")
-            house_data["title"] = title_element.text.strip()
-        except:
-            try:
-                title_element = browser.find_element(By.CSS_SELECTOR, "h1")
-                house_data["title"] = title_element.text.strip()
-            except:
+        with METRICS.timer("listing"):
+            # 瀏覽器只負責載入頁面，欄位一律從同一份 HTML 快照解析
+            html = fetch_page_html(browser, house_url, "detail", ready_selectors=DETAIL_READY_SELECTORS)
+            if html is None:
                 return None
-        
-        # 爬取價格
-        try:
-            price_element = browser.find_element(By.CSS_SELECTOR, "span.text-3xl.font-bold.text-c-orange-700")
-            price_text = price_element.text.strip().replace(',', '')
-            if price_text.isdigit() and 1000 <= int(price_text) <= 500000:
-                house_data["price"] = price_text
-            else:
-                house_data["price"] = "0"
-        except:
-            house_data["price"] = "0"
-        
-        # 爬取基本資料
-        try:
-            base_info_section = browser.find_element(By.CSS_SELECTOR, "div.base_info")
-            
-            # 坪數
-            try:
-                ping_element = base_info_section.find_element(By.XPATH, ".//span[contains(text(), '坪數')]/following-sibling::span")
-                ping_text = ping_element.text.strip()
-                numbers = re.findall(r'([0-9]+\.?[0-9]*)', ping_text)
-                house_data["size"] = numbers[0] if numbers else "0"
-                house_data["size_detail"] = ping_text
-            except:
-                house_data["size"] = "0"
-                house_data["size_detail"] = "未提供"
-            
-            # 格局
-            try:
-                layout_element = base_info_section.find_element(By.XPATH, ".//span[contains(text(), '格局')]/following-sibling::span")
-                house_data["room_layout"] = layout_element.text.strip()
-            except:
-                house_data["room_layout"] = "未提供"
-            
-            # 樓層
-            try:
-                floor_element = base_info_section.find_element(By.XPATH, ".//span[contains(text(), '樓層')]/following-sibling::span")
-                house_data["floor_info"] = floor_element.text.strip()
-            except:
-                house_data["floor_info"] = "未提供"
-            
-            # 房屋類型
-            try:
-                status_element = base_info_section.find_element(By.XPATH, ".//span[contains(text(), '現況')]/following-sibling::span")
-                type_element = base_info_section.find_element(By.XPATH, ".//span[contains(text(), '型態')]/following-sibling::span")
-                house_data["house_type"] = f"{status_element.text.strip()} ({type_element.text.strip()})"
-            except:
-                house_data["house_type"] = "未提供"
-            
-            # 車位
-            try:
-                parking_element = base_info_section.find_element(By.XPATH, ".//span[contains(text(), '車位')]/following-sibling::span")
-                house_data["parking"] = parking_element.text.strip()
-            except:
-                house_data["parking"] = "未提供"
-                
-        except:
-            house_data["size"] = "0"
-            house_data["size_detail"] = "未提供"
-            house_data["room_layout"] = "未提供"
-            house_data["floor_info"] = "未提供"
-            house_data["house_type"] = "未提供"
-            house_data["parking"] = "未提供"
-        
-        # 爬取地址
-        try:
-            address_elements = browser.find_elements(By.XPATH, "//span[contains(text(), '地址')]/following-sibling::span")
-            if address_elements:
-                house_data["address"] = address_elements[0].text.strip()
-            else:
-                house_data["address"] = house_data["title"]
-        except:
-            house_data["address"] = house_data["title"]
-        
-        # 爬取圖片
-        try:
-            images = []
-            lightbox_container = browser.find_element(By.CSS_SELECTOR, "div.overflow-auto")
-            image_elements = lightbox_container.find_elements(By.CSS_SELECTOR, "img")
-            
-            for img in image_elements[:2]:
-                img_src = img.get_attribute("src")
-                img_data_src = img.get_attribute("data-src")
-                image_url = img_data_src if img_data_src else img_src
-                
-                if image_url and image_url.startswith("http"):
-                    images.append(image_url)
-            
-            house_data["images"] = images
-        except:
-            house_data["images"] = []
-        
-        # 爬取地理座標
-        try:
-            page_source = browser.page_source
-            
-            coordinate_patterns = [
-                r'"lat"[:\s]*([0-9.-]+)',
-                r'"latitude"[:\s]*([0-9.-]+)',
-                r'lat[:\s]*([0-9.-]+)',
-            ]
-            
-            longitude_patterns = [
-                r'"lng"[:\s]*([0-9.-]+)',
-                r'"longitude"[:\s]*([0-9.-]+)',
-                r'lng[:\s]*([0-9.-]+)',
-            ]
-            
-            lat = None
-            lng = None
-            
-            for pattern in coordinate_patterns:
-                lat_match = re.search(pattern, page_source, re.IGNORECASE)
-                if lat_match:
-                    potential_lat = float(lat_match.group(1))
-                    if 20 <= potential_lat <= 30:
-                        lat = potential_lat
-                        break
-            
-            for pattern in longitude_patterns:
-                lng_match = re.search(pattern, page_source, re.IGNORECASE)
-                if lng_match:
-                    potential_lng = float(lng_match.group(1))
-                    if 115 <= potential_lng <= 125:
-                        lng = potential_lng
-                        break
-            
-            if lat is None or lng is None:
-                map_elements = browser.find_elements(By.CSS_SELECTOR, "a[href*='google.com/maps']")
-                for map_element in map_elements:
-                    map_url = map_element.get_attribute("href")
-                    if map_url:
-                        coords = extract_coordinates(map_url)
-                        if coords["latitude"] and coords["longitude"]:
-                            lat = coords["latitude"]
-                            lng = coords["longitude"]
-                            break
-            
-            house_data["latitude"] = lat
-            house_data["longitude"] = lng
-            house_data["detected_city"] = target_region or "未知"
-            
-        except:
-            house_data["detected_city"] = target_region or "未知"
-            house_data["latitude"] = None
-            house_data["longitude"] = None
-
-        # 抓取地區信息
-        try:
-            district = None
-            city = None
-            
-            nav_selectors = [
-                "nav.flex.space-x-2",
-                "nav[class*='breadcrumb']",
-                "div[class*='breadcrumb']",
-                ".breadcrumb",
-                "nav",
-                "[class*='nav']"
-            ]
-            
-            for selector in nav_selectors:
-                try:
-                    nav_elements = browser.find_elements(By.CSS_SELECTOR, selector)
-                    for nav_element in nav_elements:
-                        nav_text = nav_element.text
-                        if any(keyword in nav_text for keyword in ['區', '市', '縣', '鄉', '鎮']):
-                            links = nav_element.find_elements(By.TAG_NAME, "a")
-                            for link in links:
-                                link_text = link.text.strip()
-                                if link_text.endswith('區'):
-                                    district = link_text
-                                    break
-                                elif link_text.endswith('市') or link_text.endswith('縣'):
-                                    city = link_text
-                            break
-                    if district:
-                        break
-                except:
-                    continue
-            
-            if not district:
-                page_source = browser.page_source
-                districts = [
-                    '中正區', '大同區', '中山區', '松山區', '大安區', '萬華區', '信義區', '士林區', '北投區', '內湖區', '南港區', '文山區',
-                    '板橋區', '三重區', '中和區', '永和區', '新莊區', '新店區', '樹林區', '鶯歌區', '三峽區', '淡水區', '汐止區', '瑞芳區',
-                    '土城區', '蘆洲區', '五股區', '泰山區', '林口區', '深坑區', '石碇區', '坪林區', '烏來區', '金山區', '萬里區', '石門區',
-                    '三芝區', '貢寮區', '平溪區', '雙溪區', '八里區',
-                    '桃園區', '中壢區', '大溪區', '楊梅區', '蘆竹區', '大園區', '龜山區', '八德區', '龍潭區', '平鎮區', '新屋區', '觀音區', '復興區'
-                ]
-                
-                for district_name in districts:
-                    if district_name in page_source:
-                        context_patterns = [
-                            rf'{district_name}[^區市縣]*(?:出租|租屋|房屋)',
-                            rf'(?:位於|在){district_name}',
-                            rf'{district_name}(?:的|地區)',
-                            rf'href="[^"]*{district_name}[^"]*"[^>]*>{district_name}</a>'
-                        ]
-                        
-                        for pattern in context_patterns:
-                            if re.search(pattern, page_source):
-                                district = district_name
-                                break
-                        
-                        if district:
-                            break
-            
-            house_data["district"] = district or "未知"
-            house_data["city"] = target_region or "未知"
-            
-        except:
-            house_data["district"] = "未知"
-            house_data["city"] = target_region or "未知"
-        
-        time.sleep(random.uniform(0.5, 1.5))
-        return house_data
+            return parse_house_html(html, house_url, target_region)
         
     except Exception as e:
+        if is_session_dead(e):
+            raise
+        METRICS.incr("detail_error")
         return None
\ No newline at end of file
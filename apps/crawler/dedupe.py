@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import zlib
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from crawl_output import iter_jsonl, rewrite_jsonl, DEFAULT_JSONL_FILE
+from house_parser import MISSING, extract_listing_id
+from listing_record import parse_price, parse_size
+from spatial_index import validate_coordinates, haversine_km, geohash_encode
+from image_pipeline import hamming_distance
+
+# MinHash 排列數 = 分段數 × 每段列數；相似度約 (1/BANDS)^(1/ROWS) ≈ 0.5 以上的配對會落在同一桶
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+# 估計的 Jaccard 相似度達到此值才視為重複
+SIMILARITY_THRESHOLD = 0.6
+# 兩筆都有實際座標時，距離在此範圍內（公尺）才可能是同一間
+MAX_DISTANCE_M = 200
+# 坪數差距容許值：取 1 坪與 5% 的較大者
+SIZE_TOLERANCE_PING = 1.0
+SIZE_TOLERANCE_RATIO = 0.05
+# 圖片感知雜湊（64 位元 dHash）相差在此位元數內視為同一張；切成 4 段 16 位元分桶，至少一段相同才會成為候選
+PHASH_MAX_DISTANCE = 3
+PHASH_SEGMENTS = 4
+# 有相同圖片時，標題相似度門檻放寬到此值（仍須通過坪數、格局與位置檢查）
+IMAGE_MATCH_THRESHOLD = 0.3
+# 同一桶超過此筆數時（例如制式標題），改以 geohash 5 碼（約 5 km）再分組後才兩兩比對
+MAX_BUCKET_SIZE = 50
+SEED = 20240601
+
+# 比對前移除的空白與標點
+TITLE_NOISE_PATTERN = re.compile(r'[\s!-/:-@\[-`{-~！-／：-＠［-｀｛-､【】「」『』〈〉《》、。·•★☆◆◇●○■□▲△♥❤]+')
+_SHIFT32 = np.uint64(32)
+
+
+def _permutations(num_permutations=NUM_PERMUTATIONS, seed=SEED):
+    # a 必須是 64 位元奇數，乘積才會溢位打散；只用 32 位元時結果隨 x 單調遞增，每個排列都會選到同一個 shingle
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, np.iinfo(np.uint64).max, size=num_permutations, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, size=num_permutations, dtype=np.uint64, endpoint=True)
+    return a, b
+
+
+PERM_A, PERM_B = _permutations()
+
+
+def _normalize_layout(layout):
+    if not layout or layout == MISSING:
+        return None
+    return re.sub(r'\s+', "", str(layout))
+
+
+def record_shingles(record):
+    """標題的字元 3-gram，再加上格局與坪數（取整）兩個特徵"""
+    title = TITLE_NOISE_PATTERN.sub("", (record.get("title") or "").lower())
+    shingles = {title[i:i + SHINGLE_SIZE] for i in range(max(1, len(title) - SHINGLE_SIZE + 1))}
+    layout = _normalize_layout(record.get("room_layout"))
+    if layout:
+        shingles.add(f"layout:{layout}")
+    size = parse_size(record.get("size"))
+    if size:
+        shingles.add(f"size:{round(size)}")
+    shingles.discard("")
+    return shingles
+
+
+def minhash_signature(shingles):
+    """以 multiply-shift 雜湊模擬 NUM_PERMUTATIONS 個排列，回傳各排列下的最小值"""
+    if not shingles:
+        return None
+    values = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # uint64 溢位即為 mod 2^64，取高 32 位元
+    hashed = (PERM_A[:, None] * values[None, :] + PERM_B[:, None]) >> _SHIFT32
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+class ListingFingerprint:
+    """比對用的精簡資料，不保留整筆物件"""
+
+    __slots__ = ("position", "listing_id", "url", "title", "price", "signature", "size", "layout",
+                 "lat", "lng", "precise", "area", "image_hashes", "quality")
+
+    def __init__(self, position, record):
+        self.position = position
+        self.listing_id = str(record.get("id") or extract_listing_id(record.get("url")) or position)
+        self.url = record.get("url")
+        self.title = record.get("title")
+        self.price = record.get("price")
+        self.signature = minhash_signature(record_shingles(record))
+        self.size = parse_size(record.get("size"))
+        self.layout = _normalize_layout(record.get("room_layout"))
+        # 在複本上檢查座標，不改動原資料；行政區中心補上的座標不能用來判斷距離
+        probe = dict(record)
+        self.lat, self.lng = validate_coordinates(probe)
+        self.precise = probe["coordinate_source"] in ("original", "swapped")
+        self.area = (record.get("city"), record.get("district"))
+        # image_pipeline 產生的感知雜湊；沒有執行圖片處理時為空
+        self.image_hashes = [phash for phash in record.get("image_hashes") or [] if phash]
+        # 選代表物件時偏好有實際座標、圖片較多、欄位較完整的
+        filled = sum(1 for value in record.values() if value not in (None, "", MISSING, "0", [], "未知"))
+        self.quality = (self.precise, len(record.get("images") or []), filled, -position)
+
+
+def is_duplicate(left, right, threshold=SIMILARITY_THRESHOLD):
+    """LSH 候選配對的確認：簽章相似度（有相同圖片時放寬）、坪數、格局與位置都須吻合"""
+    if left.signature is None or right.signature is None:
+        return False
+    if _images_match(left, right):
+        threshold = min(threshold, IMAGE_MATCH_THRESHOLD)
+    if float(np.mean(left.signature == right.signature)) < threshold:
+        return False
+    if left.size and right.size:
+        tolerance = max(SIZE_TOLERANCE_PING, SIZE_TOLERANCE_RATIO * max(left.size, right.size))
+        if abs(left.size - right.size) > tolerance:
+            return False
+    if left.layout and right.layout and left.layout != right.layout:
+        return False
+    if left.precise and right.precise:
+        return haversine_km(left.lat, left.lng, right.lat, right.lng) * 1000 <= MAX_DISTANCE_M
+    # 任一筆只有行政區中心座標時，須在同一個行政區且租金相同
+    if left.area != right.area or None in left.area or "未知" in left.area:
+        return False
+    return parse_price(left.price) is not None and parse_price(left.price) == parse_price(right.price)
+
+
+def _images_match(left, right):
+    return any(hamming_distance(a, b) <= PHASH_MAX_DISTANCE for a in left.image_hashes for b in right.image_hashes)
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, left, right):
+        left, right = self.find(left), self.find(right)
+        if left == right:
+            return False
+        self.parent[max(left, right)] = min(left, right)
+        return True
+
+
+def _lsh_buckets(fingerprints):
+    buckets = {}
+    for fingerprint in fingerprints:
+        if fingerprint.signature is None:
+            continue
+        for band in range(LSH_BANDS):
+            key = (band, fingerprint.signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes())
+            buckets.setdefault(key, []).append(fingerprint.position)
+        for phash in set(fingerprint.image_hashes):
+            step = len(phash) // PHASH_SEGMENTS
+            for segment in range(PHASH_SEGMENTS):
+                key = ("image", segment, phash[segment * step:(segment + 1) * step])
+                buckets.setdefault(key, []).append(fingerprint.position)
+    return buckets
+
+
+def _split_large_bucket(members, fingerprints):
+    groups = {}
+    for position in members:
+        fingerprint = fingerprints[position]
+        cell = geohash_encode(fingerprint.lat, fingerprint.lng, 5) if fingerprint.lat is not None else None
+        groups.setdefault(cell, []).append(position)
+    return groups.values()
+
+
+def find_duplicate_clusters(fingerprints, threshold=SIMILARITY_THRESHOLD):
+    """以 LSH 分桶（標題簽章與圖片雜湊）找候選配對，確認後用 union-find 合併成群組；回傳 {代表位置: [其他位置]}
+
+    相似關係沒有遞移性（A 像 B、B 像 C 不代表 A 像 C），兩群的所有成員兩兩都確認為重複才合併，
+    避免一連串相近的刊登被串成同一群。
+    """
+    union_find = UnionFind(len(fingerprints))
+    members_of = {fingerprint.position: [fingerprint.position] for fingerprint in fingerprints}
+    verdicts = {}
+
+    def duplicate(left, right):
+        key = (min(left, right), max(left, right))
+        if key not in verdicts:
+            verdicts[key] = is_duplicate(fingerprints[left], fingerprints[right], threshold)
+        return verdicts[key]
+
+    for members in _lsh_buckets(fingerprints).values():
+        if len(members) < 2:
+            continue
+        groups = _split_large_bucket(members, fingerprints) if len(members) > MAX_BUCKET_SIZE else [members]
+        for group in groups:
+            for i, left in enumerate(group):
+                for right in group[i + 1:]:
+                    left_root, right_root = union_find.find(left), union_find.find(right)
+                    if left_root == right_root or (left, right) in verdicts or not duplicate(left, right):
+                        continue
+                    if all(duplicate(a, b) for a in members_of[left_root] for b in members_of[right_root]):
+                        union_find.union(left, right)
+                        root = union_find.find(left)
+                        members_of[root] = members_of.pop(left_root) + members_of.pop(right_root)
+
+    clusters = {}
+    for fingerprint in fingerprints:
+        clusters.setdefault(union_find.find(fingerprint.position), []).append(fingerprint.position)
+
+    result = {}
+    for members in clusters.values():
+        if len(members) < 2:
+            continue
+        canonical = max(members, key=lambda position: fingerprints[position].quality)
+        result[canonical] = [position for position in members if position != canonical]
+    return result
+
+
+def dedupe_jsonl(jsonl_path=DEFAULT_JSONL_FILE, threshold=SIMILARITY_THRESHOLD):
+    """合併 JSONL 中的重複物件：每群保留一筆代表資料，其餘以 alternates 記在代表資料上並從輸出移除
+
+    讀取兩次 JSONL：第一次只計算簽章與比對欄位，第二次改寫輸出，記憶體中不保留整筆資料。
+    回傳 {"records", "clusters", "removed"}。
+    """
+    fingerprints = [ListingFingerprint(position, record) for position, record in enumerate(iter_jsonl(jsonl_path))]
+    clusters = find_duplicate_clusters(fingerprints, threshold)
+    alternates = {}
+    removed = set()
+    for canonical, members in clusters.items():
+        alternates[canonical] = [
+            {"id": fingerprints[position].listing_id, "url": fingerprints[position].url,
+             "title": fingerprints[position].title, "price": fingerprints[position].price}
+            for position in members
+        ]
+        removed.update(members)
+
+    def canonical_records():
+        for position, record in enumerate(iter_jsonl(jsonl_path)):
+            if position in removed:
+                continue
+            record["alternates"] = alternates.get(position, [])
+            yield record
+
+    rewrite_jsonl(jsonl_path, canonical_records())
+    return {"records": len(fingerprints), "clusters": len(clusters), "removed": len(removed)}
+
+
+def print_stats(stats):
+    print(f"重複物件合併：{stats['records']} 筆中找到 {stats['clusters']} 組重複，移除 {stats['removed']} 筆，"
+          f"保留 {stats['records'] - stats['removed']} 筆")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以 MinHash/LSH 與座標距離合併重複刊登的物件")
+    parser.add_argument("file", nargs="?", default=DEFAULT_JSONL_FILE, help="爬蟲輸出的 JSONL（會就地改寫）")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD, help="標題相似度門檻")
+    args = parser.parse_args()
+
+    print_stats(dedupe_jsonl(args.file, args.threshold))
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import argparse
+import threading
+import traceback
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from crawler import setup_browser, crawl_house_details, fetch_page_html, is_session_dead, LIST_READY_SELECTORS
+from house_parser import parse_list_html
+from gazetteer import tally_location
+from rate_controller import RATE_CONTROLLER, DEFAULT_MAX_RATE
+from browser_session import BrowserSession
+from region_scheduler import load_regions, page_url, RegionScheduler, DEFAULT_REGIONS_FILE
+from crawl_state import CrawlStateStore, RecrawlScheduler, DEFAULT_STATE_DB
+from crawl_output import JsonlRecordWriter, export_json_array, DEFAULT_JSONL_FILE, DEFAULT_JSON_FILE
+from task_queue import MemoryTaskQueue, RedisTaskQueue, DEFAULT_VISIBILITY_TIMEOUT
+from image_pipeline import process_jsonl_images, print_stats as print_image_stats, DEFAULT_IMAGE_DIR
+from dedupe import dedupe_jsonl, print_stats as print_dedupe_stats
+from listing_record import export_parquet, DEFAULT_PARQUET_FILE
+from spatial_index import build_spatial_index, print_stats as print_spatial_stats, DEFAULT_SPATIAL_INDEX_FILE
+
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+DEFAULT_RUN_ID = "default"
+# 工作者沒有任務時的輪詢間隔（秒）
+IDLE_POLL = 0.5
+
+
+def process_task(browser, task):
+    """工作者執行單一任務，回傳要交給協調者的結果"""
+    if task["type"] == "list":
+        html = fetch_page_html(browser, task["url"], "list", ready_selectors=LIST_READY_SELECTORS)
+        summaries, last_page_link = parse_list_html(html, task["url"]) if html else ([], None)
+        return {
+            "type": "list",
+            "region": task["region"],
+            "page": task["page"],
+            "ok": html is not None,
+            "summaries": summaries,
+            "last_page_link": last_page_link,
+        }
+
+    house_data = crawl_house_details(browser, task["url"], task["region"])
+    return {"type": "detail", "region": task["region"], "url": task["url"], "data": house_data}
+
+
+def failed_result(task):
+    if task["type"] == "list":
+        return {"type": "list", "region": task["region"], "page": task["page"], "ok": False,
+                "summaries": [], "last_page_link": None}
+    return {"type": "detail", "region": task["region"], "url": task["url"], "data": None}
+
+
+class RunWatcher:
+    """判斷工作者參與過的那一輪是否已結束
+
+    只有看過仍在進行中的一輪，在它結束後才回傳 True；啟動前殘留的結束旗標（上一輪或其他協調者）不算。
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.joined = None
+
+    def __call__(self):
+        generation = self.queue.generation()
+        if generation is None:
+            return False
+        if not self.queue.is_closed(generation):
+            self.joined = generation
+            return False
+        return generation == self.joined
+
+
+def run_worker(queue, worker_id, browser_factory=setup_browser, should_stop=None, warm_spare=True):
+    """工作者：不斷向佇列租用任務，完成後回報結果再確認（ack）
+
+    預設為常駐工作者：一輪結束後繼續輪詢，等待下一個協調者排入任務。
+    傳入 should_stop（例如 RunWatcher 或 threading.Event.is_set）時，回傳 True 即結束。
+    同一行程有多個工作者時應傳入 warm_spare=False，否則每個工作者各多一個閒置的備用瀏覽器。
+    """
+    session = BrowserSession(browser_factory, warm_spare=warm_spare)
+    processed = 0
+    print(f"工作者 {worker_id} 已啟動")
+    try:
+        while should_stop is None or not should_stop():
+            leased = queue.lease()
+            if leased is None:
+                time.sleep(IDLE_POLL)
+                continue
+
+            task_id, task = leased
+            try:
+                # 工作階段失效時 session 會重啟瀏覽器並重試一次
+                result = session.call(process_task, task)
+            except Exception as e:
+                print(f"工作者 {worker_id} 處理 {task.get('url')} 失敗: {e}")
+                traceback.print_exc()
+                result = failed_result(task)
+                if is_session_dead(e):
+                    session.restart()
+
+            # 先回報再 ack：兩者之間當機時任務會被重新排入，協調者會忽略重複的結果
+            queue.push_result(result)
+            queue.ack(task_id)
+            processed += 1
+    finally:
+        session.close()
+        print(f"工作者 {worker_id} 結束，共處理 {processed} 個任務")
+
+
+class CrawlCoordinator:
+    """協調者：依地區配額排入列表頁與詳細頁任務，收集結果寫入 JSONL
+
+    每個地區同時最多一個列表頁任務；已排入加上已完成的詳細頁不超過目標筆數，
+    任務失敗時再從待排清單補上。網址經由佇列的已見集合去重，同一物件只會被一個工作者抓取。
+    """
+
+    def __init__(self, queue, region_configs, writer, scheduler=None):
+        self.queue = queue
+        self.region_scheduler = RegionScheduler(region_configs)
+        self.writer = writer
+        self.scheduler = scheduler
+        self.regions = self.region_scheduler.all_regions()
+        self.backlog = {region.name: deque() for region in self.regions}
+        self.reusable = {region.name: deque() for region in self.regions}
+        self.in_flight = {region.name: set() for region in self.regions}
+        self.list_in_flight = {region.name: None for region in self.regions}
+        self.finished = set()
+        self.stale_planned = set()
+        self.done_urls = set()
+        self.total_records = 0
+        self.final_stats = {"detected": {}, "districts": {}}
+
+    def _by_priority(self):
+        return sorted(
+            (region for region in self.regions if region.name not in self.finished),
+            key=lambda region: (-region.priority * region.remaining / max(region.target_count, 1), region.order),
+        )
+
+    def _has_more_pages(self, region):
+        return not region.exhausted and region.next_page <= region.max_pages
+
+    def dispatch(self):
+        for region in self._by_priority():
+            name = region.name
+            backlog = self.backlog[name]
+            while backlog and len(self.in_flight[name]) < region.remaining:
+                house_url = backlog.popleft()
+                if house_url in self.done_urls:
+                    continue
+                if self.queue.enqueue({"type": "detail", "region": name, "url": house_url}, dedupe_key=house_url):
+                    self.in_flight[name].add(house_url)
+
+            needs_more = len(self.in_flight[name]) + len(backlog) < region.remaining
+            if needs_more and self.list_in_flight[name] is None and self._has_more_pages(region):
+                page_num = region.next_page
+                self.queue.enqueue({"type": "list", "region": name, "page": page_num,
+                                    "url": page_url(region.url, page_num)})
+                self.list_in_flight[name] = page_num
+
+            self._check_finished(region)
+
+    def _check_finished(self, region):
+        name = region.name
+        if name in self.finished:
+            return
+        idle = not self.in_flight[name] and self.list_in_flight[name] is None
+        out_of_work = not self.backlog[name] and not self._has_more_pages(region)
+        if self.scheduler and region.remaining and idle and out_of_work and name not in self.stale_planned:
+            # 列表頁都看過後，才把剩餘預算分給過期物件，下一輪 dispatch 排入
+            self.stale_planned.add(name)
+            stale_urls, reusable_urls = self.scheduler.plan_stale(name)
+            self.backlog[name].extend(house_url for house_url in stale_urls if house_url not in self.done_urls)
+            self.reusable[name].extend(reusable_urls)
+            if self.backlog[name]:
+                return
+        if region.remaining and idle and out_of_work:
+            # 沒有新網址可抓時，以仍新鮮的上次結果補足配額
+            while region.remaining and self.reusable[name]:
+                house_url = self.reusable[name].popleft()
+                house_data = self.scheduler.reuse(house_url) if house_url not in self.done_urls else None
+                if house_data:
+                    self._write(region, house_url, house_data)
+        if region.remaining == 0 or (idle and out_of_work):
+            self.finished.add(name)
+            print(f"{name} 處理完成！共處理 {region.pages_done} 頁，收集資料: {region.count} 筆")
+
+    def _write(self, region, house_url, house_data):
+        self.writer.write(house_data)
+        self.done_urls.add(house_url)
+        tally_location(region.stats, house_data)
+        tally_location(self.final_stats, house_data)
+        region.count += 1
+        self.total_records += 1
+
+    def handle_result(self, result):
+        region = next((region for region in self.regions if region.name == result["region"]), None)
+        if region is None:
+            return
+        name = region.name
+
+        if result["type"] == "list":
+            if self.list_in_flight[name] != result["page"]:
+                return
+            self.list_in_flight[name] = None
+            summaries = result["summaries"]
+            if not result["ok"]:
+                print(f"無法訪問 {name} 第 {result['page']} 頁，結束此地區")
+                region.exhausted = True
+                return
+
+            is_new_page = self.region_scheduler.observe_page(region, result["page"], summaries,
+                                                              result["last_page_link"])
+            self.region_scheduler.finish_page(region)
+            print(f"{name} 第 {result['page']} 頁找到 {len(summaries)} 個房屋連結")
+            if not is_new_page:
+                return
+
+            house_urls = [summary["url"] for summary in summaries if summary["url"] not in self.done_urls]
+            if self.scheduler:
+                house_urls, reusable_urls = self.scheduler.plan(
+                    house_urls, name, summaries={summary["url"]: summary for summary in summaries}
+                )
+                self.reusable[name].extend(reusable_urls)
+            self.backlog[name].extend(house_urls)
+            return
+
+        house_url = result["url"]
+        if house_url not in self.in_flight[name]:
+            # 租約逾時後被重做的任務，結果已處理過
+            return
+        self.in_flight[name].discard(house_url)
+        house_data = result["data"]
+        if self.scheduler:
+            self.scheduler.record(house_url, house_data, name)
+        if house_data and house_url not in self.done_urls and region.remaining:
+            self._write(region, house_url, house_data)
+            print(f"成功: {house_data.get('title', '未取得')[:30]}... {name} 進度: {region.count}/{region.target_count}")
+        elif not house_data:
+            print(f"房屋資料抓取失敗: {house_url}")
+
+    def run(self):
+        self.dispatch()
+        while len(self.finished) < len(self.regions):
+            for task in self.queue.requeue_expired():
+                print(f"任務多次逾時，視為失敗: {task.get('url')}")
+                self.handle_result(failed_result(task))
+            for result in self.queue.pop_results(timeout=1.0):
+                self.handle_result(result)
+            self.dispatch()
+        self.queue.close()
+        return self.total_records
+
+
+def run_coordinator(queue, regions_file=DEFAULT_REGIONS_FILE, state_db=DEFAULT_STATE_DB, fetch_budget=None,
+                    jsonl_file=DEFAULT_JSONL_FILE, json_file=DEFAULT_JSON_FILE,
+                    spatial_index_file=DEFAULT_SPATIAL_INDEX_FILE, dedupe=True, image_dir=DEFAULT_IMAGE_DIR,
+                    parquet_file=DEFAULT_PARQUET_FILE):
+    """清空佇列後開始協調，回傳收集筆數"""
+    region_configs = load_regions(regions_file)
+    queue.reset()
+    store = CrawlStateStore(state_db) if state_db else None
+    scheduler = RecrawlScheduler(store, fetch_budget) if store else None
+    writer = JsonlRecordWriter(jsonl_file)
+    start_time = time.time()
+    try:
+        coordinator = CrawlCoordinator(queue, region_configs, writer, scheduler)
+        # run() 結束前已標記本輪結束，之後才改寫 JSONL；後處理中斷不會影響佇列狀態
+        total_records = coordinator.run()
+        writer.close()
+        print(f"所有地區處理完成！總收集資料: {total_records} 筆，耗時 {time.time() - start_time:.1f} 秒")
+        if total_records:
+            if image_dir:
+                try:
+                    print_image_stats(process_jsonl_images(jsonl_file, image_dir))
+                except Exception as e:
+                    print(f"圖片處理失敗（資料仍會輸出）: {e}")
+            if dedupe:
+                try:
+                    print_dedupe_stats(dedupe_jsonl(jsonl_file))
+                except Exception as e:
+                    print(f"合併重複物件失敗（保留全部資料）: {e}")
+            if spatial_index_file:
+                try:
+                    index, spatial_stats = build_spatial_index(jsonl_file, spatial_index_file)
+                    print_spatial_stats(index, spatial_stats)
+                except Exception as e:
+                    print(f"建立空間索引失敗（資料仍會輸出）: {e}")
+            export_json_array(jsonl_file, json_file)
+            print(f"資料已保存至: {json_file}")
+            if parquet_file:
+                try:
+                    export_parquet(jsonl_file, parquet_file)
+                    print(f"Parquet 已保存至: {parquet_file}")
+                except Exception as e:
+                    print(f"輸出 Parquet 失敗: {e}")
+        return total_records
+    finally:
+        writer.close()
+        if store:
+            store.close()
+
+
+def run_local(workers=2, **coordinator_kwargs):
+    """單機模式：以記憶體佇列與多個工作執行緒跑完整流程，不需要 Redis"""
+    queue = MemoryTaskQueue()
+    stop = threading.Event()
+    # 多個工作執行緒時不保留備用瀏覽器，Chrome 數量與工作者數相同
+    threads = [
+        threading.Thread(target=run_worker, args=(queue, f"local-{idx}"),
+                         kwargs={"should_stop": stop.is_set, "warm_spare": workers <= 1},
+                         name=f"crawl-worker-{idx}", daemon=True)
+        for idx in range(workers)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        return run_coordinator(queue, **coordinator_kwargs)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分散式爬蟲：協調者排入任務，多台機器上的工作者經由 Redis 領取")
+    parser.add_argument("role", choices=["coordinator", "worker", "local"],
+                        help="coordinator 排程與收集結果；worker 執行任務；local 在單一行程內以記憶體佇列模擬")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", DEFAULT_REDIS_URL))
+    parser.add_argument("--run-id", default=os.getenv("CRAWLER_RUN_ID", DEFAULT_RUN_ID),
+                        help="同一次執行的協調者與工作者須使用相同的 run id")
+    parser.add_argument("--visibility-timeout", type=int, default=DEFAULT_VISIBILITY_TIMEOUT,
+                        help="任務租約秒數，逾時未回報的任務會重新排入")
+    parser.add_argument("--workers", type=int, default=2, help="local 模式的工作執行緒數")
+    parser.add_argument("--worker-id", default=None, help="工作者名稱（預設為主機名稱 + PID）")
+    parser.add_argument("--regions", default=os.getenv("CRAWLER_REGIONS_FILE", DEFAULT_REGIONS_FILE))
+    parser.add_argument("--state-db", default=DEFAULT_STATE_DB, help="協調者的抓取狀態資料庫，設為空字串則停用排程")
+    parser.add_argument("--fetch-budget", type=int, default=None)
+    parser.add_argument("--spatial-index", default=DEFAULT_SPATIAL_INDEX_FILE,
+                        help="協調者完成後輸出的空間索引路徑，設為空字串則略過")
+    parser.add_argument("--no-dedupe", action="store_true", help="不要合併重複刊登的物件")
+    parser.add_argument("--parquet", default=DEFAULT_PARQUET_FILE, help="Parquet 輸出路徑，設為空字串則不輸出")
+    parser.add_argument("--image-dir", default=os.getenv("CRAWLER_IMAGE_DIR", DEFAULT_IMAGE_DIR),
+                        help="圖片縮圖的存放目錄，設為空字串則不下載圖片")
+    parser.add_argument("--exit-when-done", action="store_true",
+                        help="worker 在參與的那一輪結束後離開（預設常駐，持續等待下一輪的任務）")
+    parser.add_argument("--max-rate", type=float, default=DEFAULT_MAX_RATE,
+                        help="每個工作者對同一主機的請求速率上限（次/秒），回應順利時會逐步加速到此值")
+    args = parser.parse_args()
+
+    RATE_CONTROLLER.configure(max_rate=args.max_rate)
+
+    coordinator_kwargs = {"regions_file": args.regions, "state_db": args.state_db, "fetch_budget": args.fetch_budget,
+                          "spatial_index_file": args.spatial_index, "dedupe": not args.no_dedupe,
+                          "image_dir": args.image_dir, "parquet_file": args.parquet}
+    if args.role == "local":
+        result = run_local(args.workers, **coordinator_kwargs)
+        print(f"本機分散式模式完成，共收集 {result} 筆資料")
+    else:
+        queue = RedisTaskQueue(args.redis_url, args.run_id, visibility_timeout=args.visibility_timeout)
+        if args.role == "coordinator":
+            result = run_coordinator(queue, **coordinator_kwargs)
+            print(f"協調者完成，共收集 {result} 筆資料")
+        else:
+            worker_id = args.worker_id or f"{os.uname().nodename}-{os.getpid()}"
+            run_worker(queue, worker_id, should_stop=RunWatcher(queue) if args.exit_when_done else None)
@@ -0,0 +1,209 @@
+import re
+from collections import namedtuple
+
+# 全台 22 個縣市及其 368 個鄉鎮市區，名稱統一使用「台」
+TAIWAN_DIVISIONS = {
+    "台北市": [
+        "中正區", "大同區", "中山區", "松山區", "大安區", "萬華區", "信義區", "士林區", "北投區", "內湖區", "南港區", "文山區",
+    ],
+    "新北市": [
+        "板橋區", "三重區", "中和區", "永和區", "新莊區", "新店區", "樹林區", "鶯歌區", "三峽區", "淡水區", "汐止區", "瑞芳區",
+        "土城區", "蘆洲區", "五股區", "泰山區", "林口區", "深坑區", "石碇區", "坪林區", "烏來區", "金山區", "萬里區", "石門區",
+        "三芝區", "貢寮區", "平溪區", "雙溪區", "八里區",
+    ],
+    "桃園市": [
+        "桃園區", "中壢區", "大溪區", "楊梅區", "蘆竹區", "大園區", "龜山區", "八德區", "龍潭區", "平鎮區", "新屋區", "觀音區",
+        "復興區",
+    ],
+    "台中市": [
+        "中區", "東區", "南區", "西區", "北區", "北屯區", "西屯區", "南屯區", "太平區", "大里區", "霧峰區", "烏日區", "豐原區",
+        "后里區", "石岡區", "東勢區", "和平區", "新社區", "潭子區", "大雅區", "神岡區", "大肚區", "沙鹿區", "龍井區", "梧棲區",
+        "清水區", "大甲區", "外埔區", "大安區",
+    ],
+    "台南市": [
+        "中西區", "東區", "南區", "北區", "安平區", "安南區", "永康區", "歸仁區", "新化區", "左鎮區", "玉井區", "楠西區",
+        "南化區", "仁德區", "關廟區", "龍崎區", "官田區", "麻豆區", "佳里區", "西港區", "七股區", "將軍區", "學甲區", "北門區",
+        "新營區", "後壁區", "白河區", "東山區", "六甲區", "下營區", "柳營區", "鹽水區", "善化區", "大內區", "山上區", "新市區",
+        "安定區",
+    ],
+    "高雄市": [
+        "新興區", "前金區", "苓雅區", "鹽埕區", "鼓山區", "旗津區", "前鎮區", "三民區", "楠梓區", "小港區", "左營區", "仁武區",
+        "大社區", "岡山區", "路竹區", "阿蓮區", "田寮區", "燕巢區", "橋頭區", "梓官區", "彌陀區", "永安區", "湖內區", "鳳山區",
+        "大寮區", "林園區", "鳥松區", "大樹區", "旗山區", "美濃區", "六龜區", "內門區", "杉林區", "甲仙區", "桃源區", "那瑪夏區",
+        "茂林區", "茄萣區",
+    ],
+    "基隆市": ["仁愛區", "信義區", "中正區", "中山區", "安樂區", "暖暖區", "七堵區"],
+    "新竹市": ["東區", "北區", "香山區"],
+    "嘉義市": ["東區", "西區"],
+    "新竹縣": [
+        "竹北市", "竹東鎮", "新埔鎮", "關西鎮", "湖口鄉", "新豐鄉", "芎林鄉", "橫山鄉", "北埔鄉", "寶山鄉", "峨眉鄉", "尖石鄉",
+        "五峰鄉",
+    ],
+    "苗栗縣": [
+        "苗栗市", "頭份市", "竹南鎮", "後龍鎮", "通霄鎮", "苑裡鎮", "卓蘭鎮", "造橋鄉", "西湖鄉", "頭屋鄉", "公館鄉", "銅鑼鄉",
+        "三義鄉", "大湖鄉", "獅潭鄉", "三灣鄉", "南庄鄉", "泰安鄉",
+    ],
+    "彰化縣": [
+        "彰化市", "員林市", "和美鎮", "鹿港鎮", "溪湖鎮", "二林鎮", "田中鎮", "北斗鎮", "花壇鄉", "芬園鄉", "大村鄉", "永靖鄉",
+        "伸港鄉", "線西鄉", "福興鄉", "秀水鄉", "埔心鄉", "埔鹽鄉", "大城鄉", "芳苑鄉", "竹塘鄉", "社頭鄉", "二水鄉", "田尾鄉",
+        "埤頭鄉", "溪州鄉",
+    ],
+    "南投縣": [
+        "南投市", "埔里鎮", "草屯鎮", "竹山鎮", "集集鎮", "名間鄉", "鹿谷鄉", "中寮鄉", "魚池鄉", "國姓鄉", "水里鄉", "信義鄉",
+        "仁愛鄉",
+    ],
+    "雲林縣": [
+        "斗六市", "斗南鎮", "虎尾鎮", "西螺鎮", "土庫鎮", "北港鎮", "古坑鄉", "大埤鄉", "莿桐鄉", "林內鄉", "二崙鄉", "崙背鄉",
+        "麥寮鄉", "東勢鄉", "褒忠鄉", "台西鄉", "元長鄉", "四湖鄉", "口湖鄉", "水林鄉",
+    ],
+    "嘉義縣": [
+        "太保市", "朴子市", "布袋鎮", "大林鎮", "民雄鄉", "溪口鄉", "新港鄉", "六腳鄉", "東石鄉", "義竹鄉", "鹿草鄉", "水上鄉",
+        "中埔鄉", "竹崎鄉", "梅山鄉", "番路鄉", "大埔鄉", "阿里山鄉",
+    ],
+    "屏東縣": [
+        "屏東市", "潮州鎮", "東港鎮", "恆春鎮", "萬丹鄉", "長治鄉", "麟洛鄉", "九如鄉", "里港鄉", "鹽埔鄉", "高樹鄉", "萬巒鄉",
+        "內埔鄉", "竹田鄉", "新埤鄉", "枋寮鄉", "新園鄉", "崁頂鄉", "林邊鄉", "南州鄉", "佳冬鄉", "琉球鄉", "車城鄉", "滿州鄉",
+        "枋山鄉", "三地門鄉", "霧台鄉", "瑪家鄉", "泰武鄉", "來義鄉", "春日鄉", "獅子鄉", "牡丹鄉",
+    ],
+    "宜蘭縣": [
+        "宜蘭市", "羅東鎮", "蘇澳鎮", "頭城鎮", "礁溪鄉", "壯圍鄉", "員山鄉", "冬山鄉", "五結鄉", "三星鄉", "大同鄉", "南澳鄉",
+    ],
+    "花蓮縣": [
+        "花蓮市", "鳳林鎮", "玉里鎮", "新城鄉", "吉安鄉", "壽豐鄉", "光復鄉", "豐濱鄉", "瑞穗鄉", "富里鄉", "秀林鄉", "萬榮鄉",
+        "卓溪鄉",
+    ],
+    "台東縣": [
+        "台東市", "成功鎮", "關山鎮", "卑南鄉", "鹿野鄉", "池上鄉", "東河鄉", "長濱鄉", "太麻里鄉", "大武鄉", "綠島鄉", "海端鄉",
+        "延平鄉", "金峰鄉", "達仁鄉", "蘭嶼鄉",
+    ],
+    "澎湖縣": ["馬公市", "湖西鄉", "白沙鄉", "西嶼鄉", "望安鄉", "七美鄉"],
+    "金門縣": ["金城鎮", "金湖鎮", "金沙鎮", "金寧鄉", "烈嶼鄉", "烏坵鄉"],
+    "連江縣": ["南竿鄉", "北竿鄉", "莒光鄉", "東引鄉"],
+}
+
+# 上下文加分：區名後接租屋字樣、前有「位於/在」、後接「的/地區」、作為連結文字、緊接在縣市名之後
+CONTEXT_WINDOW = 30
+RENT_KEYWORD_PATTERN = re.compile(r'^[^區市縣]*?(?:出租|租屋|房屋)')
+CITY_GAP_PATTERN = re.compile(r'^[\s>/\-|,、·•»›]{0,4}$')
+SCORE_RENT_KEYWORD = 2
+SCORE_LOCATED_AT = 2
+SCORE_POSSESSIVE = 1
+SCORE_LINK_TEXT = 3
+SCORE_AFTER_CITY = 4
+
+Location = namedtuple("Location", ["city", "district", "score"])
+_EMPTY_LOCATION = Location(None, None, 0)
+
+
+def normalize_name(name):
+    """統一「臺/台」寫法"""
+    return name.replace("臺", "台")
+
+
+def _variant_pattern(name):
+    return "".join("[台臺]" if char in "台臺" else re.escape(char) for char in name)
+
+
+class Gazetteer:
+    """以單一編譯正規表達式一次掃描全文，找出所有縣市與鄉鎮市區並依上下文評分"""
+
+    def __init__(self, divisions=TAIWAN_DIVISIONS):
+        self.divisions = divisions
+        self.cities = set(divisions)
+        self.district_cities = {}
+        for city, districts in divisions.items():
+            for district in districts:
+                self.district_cities.setdefault(district, []).append(city)
+
+        # 長名稱優先，避免「中西區」被拆成「西區」
+        names = sorted(self.cities | set(self.district_cities), key=len, reverse=True)
+        self.pattern = re.compile("|".join(_variant_pattern(name) for name in names))
+
+    def find_all(self, text):
+        """單次線性掃描，回傳 [(名稱, 起點, 終點)]"""
+        return [(normalize_name(match.group()), match.start(), match.end()) for match in self.pattern.finditer(text)]
+
+    def locate(self, text, city_hint=None, min_context=0):
+        """從文字中推斷最可能的 (縣市, 鄉鎮市區)
+
+        每個區名出現一次得 1 分，再依上下文加分；上下文加分未達 min_context 的候選會被捨棄。
+        區名在多個縣市重複時（如「東區」「信義區」），以緊鄰的縣市名、全文縣市出現次數、
+        city_hint 依序決定所屬縣市。
+        """
+        if not text:
+            return _EMPTY_LOCATION
+
+        city_hint = normalize_name(city_hint) if city_hint else None
+        city_counts = {}
+        district_scores = {}
+        paired_cities = {}
+        context_scores = {}
+        last_city = None
+
+        for name, start, end in self.find_all(text):
+            if name in self.cities:
+                city_counts[name] = city_counts.get(name, 0) + 1
+                last_city = (name, end)
+                continue
+
+            score = 1
+            context = 0
+            after = text[end:end + CONTEXT_WINDOW]
+            before = text[max(0, start - 2):start]
+            if RENT_KEYWORD_PATTERN.match(after):
+                context += SCORE_RENT_KEYWORD
+            if before.endswith("位於") or before.endswith("在"):
+                context += SCORE_LOCATED_AT
+            if after.startswith("的") or after.startswith("地區"):
+                context += SCORE_POSSESSIVE
+            if before.endswith(">") and after.startswith("</a>"):
+                context += SCORE_LINK_TEXT
+
+            if last_city is not None:
+                city, city_end = last_city
+                if city in self.district_cities[name] and CITY_GAP_PATTERN.match(text[city_end:start]):
+                    context += SCORE_AFTER_CITY
+                    paired_cities.setdefault(name, {})
+                    paired_cities[name][city] = paired_cities[name].get(city, 0) + 1
+
+            district_scores[name] = district_scores.get(name, 0) + score + context
+            context_scores[name] = context_scores.get(name, 0) + context
+
+        candidates = [name for name in district_scores if context_scores[name] >= min_context]
+        if not candidates:
+            city = max(city_counts, key=city_counts.get) if city_counts else None
+            return Location(city, None, 0)
+
+        district = max(candidates, key=lambda name: (district_scores[name], city_hint in self.district_cities[name]))
+        city = self._resolve_city(district, paired_cities.get(district, {}), city_counts, city_hint)
+        return Location(city, district, district_scores[district])
+
+    def _resolve_city(self, district, paired, city_counts, city_hint):
+        owners = self.district_cities[district]
+        if len(owners) == 1:
+            return owners[0]
+        if paired:
+            return max(paired, key=paired.get)
+
+        def rank(city):
+            return (city_counts.get(city, 0), city == city_hint)
+
+        best = max(owners, key=rank)
+        if rank(best) == (0, False):
+            return None
+        return best
+
+
+GAZETTEER = Gazetteer()
+
+
+def tally_location(stats, house_data):
+    """累計城市 / 地區分布，只保留計數不保留資料"""
+    detected = house_data.get('detected_city', '未知')
+    stats["detected"][detected] = stats["detected"].get(detected, 0) + 1
+
+    city = house_data.get('city', '未知')
+    district = house_data.get('district', '未知')
+    if city != '未知' and district != '未知':
+        key = f"{city} {district}"
+        stats["districts"][key] = stats["districts"].get(key, 0) + 1
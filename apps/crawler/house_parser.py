@@ -0,0 +1,367 @@
+import re
+import sys
+import json
+import time
+import hashlib
+from urllib.parse import urljoin, urlparse, parse_qs
+
+import soupsieve as sv
+from bs4 import BeautifulSoup
+
+from gazetteer import GAZETTEER
+from metrics import METRICS
+
+# 預先編譯的選擇器與正規表達式，解析每一頁時直接重用
+TITLE_SELECTOR = sv.compile("h1.mb-3.text-2xl.font-bold")
+PRICE_SELECTOR = sv.compile("span.text-3xl.font-bold.text-c-orange-700")
+BASE_INFO_SELECTOR = sv.compile("div.base_info")
+IMAGE_CONTAINER_SELECTOR = sv.compile("div.overflow-auto")
+MAP_LINK_SELECTOR = sv.compile("a[href*='google.com/maps']")
+LISTING_CARD_SELECTOR = sv.compile("a.group")
+CARD_TITLE_SELECTOR = sv.compile("h2, h3, [class*='title']")
+# 分頁列：只在這些元素內找頁碼連結，卡片或其他連結中的 p=N 不算
+PAGINATION_SELECTOR = sv.compile("[class*='pagination' i], nav[aria-label*='pagination' i], [aria-label*='分頁']")
+NAV_SELECTORS = [sv.compile(selector) for selector in [
+    "nav.flex.space-x-2",
+    "nav[class*='breadcrumb']",
+    "div[class*='breadcrumb']",
+    ".breadcrumb",
+    "nav",
+    "[class*='nav']",
+]]
+
+SIZE_NUMBER_PATTERN = re.compile(r'([0-9]+\.?[0-9]*)')
+LATITUDE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'"lat"[:\s]*([0-9.-]+)',
+    r'"latitude"[:\s]*([0-9.-]+)',
+    r'lat[:\s]*([0-9.-]+)',
+]]
+LONGITUDE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'"lng"[:\s]*([0-9.-]+)',
+    r'"longitude"[:\s]*([0-9.-]+)',
+    r'lng[:\s]*([0-9.-]+)',
+]]
+CARD_PRICE_PATTERN = re.compile(r'([0-9][0-9,]*)\s*元')
+CARD_SIZE_PATTERN = re.compile(r'([0-9]+\.?[0-9]*)\s*坪')
+PAGE_PARAM_PATTERN = re.compile(r'[?&]p=(\d+)')
+BASE_INFO_LABELS = ["坪數", "格局", "樓層", "現況", "型態", "車位"]
+MISSING = "未提供"
+
+
+def extract_listing_id(url):
+    """從 /house/<id> 網址取出物件編號，與後端 importService 的 sourceId 相同"""
+    match = re.search(r'/house/([^/?#]+)', url or "")
+    return match.group(1) if match else None
+
+
+def extract_coordinates(url):
+    """從Google Maps URL中提取經緯度"""
+    try:
+        parsed_url = urlparse(url)
+        query_params = parse_qs(parsed_url.query)
+
+        if 'query' in query_params:
+            coords = query_params['query'][0].split(',')
+            if len(coords) == 2:
+                return {"latitude": float(coords[0]), "longitude": float(coords[1])}
+
+        coords_match = re.search(r'query=(-?\d+\.\d+),(-?\d+\.\d+)', url)
+        if coords_match:
+            return {"latitude": float(coords_match.group(1)), "longitude": float(coords_match.group(2))}
+
+        return {"latitude": None, "longitude": None}
+    except Exception as e:
+        return {"latitude": None, "longitude": None}
+
+
+class HouseSnapshot:
+    """一次載入的詳細頁快照：原始 HTML 與解析後的 DOM"""
+
+    def __init__(self, html, house_url, target_region=None):
+        self.html = html
+        self.house_url = house_url
+        self.target_region = target_region
+        self.soup = BeautifulSoup(html, "lxml")
+        self._labels = None
+
+    @property
+    def labels(self):
+        """掃描一次 base_info，建立「標籤 → 下一個 span 文字」對照"""
+        if self._labels is None:
+            self._labels = {}
+            base_info_section = BASE_INFO_SELECTOR.select_one(self.soup)
+            if base_info_section is not None:
+                self._labels = _collect_labels(base_info_section, BASE_INFO_LABELS)
+        return self._labels
+
+
+def _collect_labels(container, labels):
+    """單次走訪 container 內的 span，回傳每個標籤第一次出現時其後 span 的文字"""
+    found = {}
+    for span in container.find_all("span"):
+        own_text = "".join(span.find_all(string=True, recursive=False))
+        if not own_text:
+            continue
+        for label in labels:
+            if label not in found and label in own_text:
+                value_span = span.find_next_sibling("span")
+                if value_span is not None:
+                    found[label] = value_span.get_text(strip=True)
+        if len(found) == len(labels):
+            break
+    return found
+
+
+def extract_title(page, house_data):
+    title_element = TITLE_SELECTOR.select_one(page.soup) or page.soup.find("h1")
+    if title_element is None:
+        return False
+    house_data["title"] = title_element.get_text(strip=True)
+    return True
+
+
+def extract_price(page, house_data):
+    house_data["price"] = "0"
+    price_element = PRICE_SELECTOR.select_one(page.soup)
+    if price_element is not None:
+        price_text = price_element.get_text(strip=True).replace(',', '')
+        if price_text.isdigit() and 1000 <= int(price_text) <= 500000:
+            house_data["price"] = price_text
+    return True
+
+
+def extract_size(page, house_data):
+    ping_text = page.labels.get("坪數")
+    if ping_text is None:
+        house_data["size"] = "0"
+        house_data["size_detail"] = MISSING
+    else:
+        numbers = SIZE_NUMBER_PATTERN.findall(ping_text)
+        house_data["size"] = numbers[0] if numbers else "0"
+        house_data["size_detail"] = ping_text
+    return True
+
+
+def extract_layout(page, house_data):
+    house_data["room_layout"] = page.labels.get("格局") or MISSING
+    return True
+
+
+def extract_floor(page, house_data):
+    house_data["floor_info"] = page.labels.get("樓層") or MISSING
+    return True
+
+
+def extract_house_type(page, house_data):
+    status_text = page.labels.get("現況")
+    type_text = page.labels.get("型態")
+    if status_text is not None and type_text is not None:
+        house_data["house_type"] = f"{status_text} ({type_text})"
+    else:
+        house_data["house_type"] = MISSING
+    return True
+
+
+def extract_parking(page, house_data):
+    house_data["parking"] = page.labels.get("車位") or MISSING
+    return True
+
+
+def extract_address(page, house_data):
+    address = _collect_labels(page.soup, ["地址"]).get("地址")
+    house_data["address"] = address or house_data["title"]
+    return True
+
+
+def extract_images(page, house_data):
+    images = []
+    lightbox_container = IMAGE_CONTAINER_SELECTOR.select_one(page.soup)
+    if lightbox_container is not None:
+        for img in lightbox_container.find_all("img", limit=2):
+            image_url = img.get("data-src") or img.get("src")
+            if image_url and image_url.startswith("http"):
+                images.append(image_url)
+    house_data["images"] = images
+    return True
+
+
+def _first_in_range(patterns, text, low, high):
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            try:
+                value = float(match.group(1))
+            except ValueError:
+                continue
+            if low <= value <= high:
+                return value
+    return None
+
+
+def extract_coordinates_field(page, house_data):
+    lat = _first_in_range(LATITUDE_PATTERNS, page.html, 20, 30)
+    lng = _first_in_range(LONGITUDE_PATTERNS, page.html, 115, 125)
+
+    if lat is None or lng is None:
+        METRICS.incr("coordinates_map_link_fallback")
+        for map_element in MAP_LINK_SELECTOR.select(page.soup):
+            coords = extract_coordinates(map_element.get("href", ""))
+            if coords["latitude"] and coords["longitude"]:
+                lat = coords["latitude"]
+                lng = coords["longitude"]
+                break
+
+    house_data["latitude"] = lat
+    house_data["longitude"] = lng
+    house_data["detected_city"] = page.target_region or "未知"
+    return True
+
+
+def _breadcrumb_text(page):
+    """取第一個含行政區字樣的導覽列，將其連結文字串成「新北市 > 板橋區」"""
+    for selector in NAV_SELECTORS:
+        for nav_element in selector.select(page.soup):
+            nav_text = nav_element.get_text()
+            if any(keyword in nav_text for keyword in ['區', '市', '縣', '鄉', '鎮']):
+                return " > ".join(link.get_text(strip=True) for link in nav_element.find_all("a"))
+    return None
+
+
+def extract_district(page, house_data):
+    # 依可信度：導覽列 → 地址 → 全頁（全頁須有上下文佐證）
+    location = None
+    for source, text, min_context in [
+        ("breadcrumb", _breadcrumb_text(page), 0),
+        ("address", house_data.get("address"), 0),
+        ("full_page", page.html, 1),
+    ]:
+        location = GAZETTEER.locate(text, city_hint=page.target_region, min_context=min_context)
+        if location.district:
+            METRICS.incr(f"district_from_{source}")
+            break
+
+    house_data["district"] = location.district or "未知"
+    house_data["city"] = location.city or page.target_region or "未知"
+    return True
+
+
+# 依輸出欄位順序排列；回傳 False 代表此頁不是有效的房屋頁
+FIELD_EXTRACTORS = [
+    ("title", extract_title),
+    ("price", extract_price),
+    ("size", extract_size),
+    ("room_layout", extract_layout),
+    ("floor_info", extract_floor),
+    ("house_type", extract_house_type),
+    ("parking", extract_parking),
+    ("address", extract_address),
+    ("images", extract_images),
+    ("coordinates", extract_coordinates_field),
+    ("district", extract_district),
+]
+
+
+MONITORED_FIELDS = ("price", "size", "room_layout", "floor_info", "house_type", "images", "latitude", "district")
+
+
+def parse_house_html(html, house_url, target_region=None):
+    """從單一 HTML 快照解析房屋資訊，欄位與 crawl_house_details 相同"""
+    with METRICS.timer("snapshot"):
+        page = HouseSnapshot(html, house_url, target_region)
+    house_data = {"url": house_url}
+    for name, extractor in FIELD_EXTRACTORS:
+        with METRICS.timer(f"field_{name}"):
+            ok = extractor(page, house_data)
+        if not ok:
+            METRICS.incr(f"missing_{name}")
+            return None
+
+    # 選擇器失效時這些欄位會大量變成預設值，計數後可據此告警
+    for field in MONITORED_FIELDS:
+        if house_data.get(field) in ("0", MISSING, "未知", None, []):
+            METRICS.incr(f"missing_{field}")
+    return house_data
+
+
+def summary_hash(summary):
+    """列表卡片摘要的雜湊，只取標題 / 價格 / 坪數 / 地區，避免「幾天前更新」之類的文字造成誤判"""
+    payload = "|".join(str(summary.get(field) or "") for field in ("title", "price", "size", "area"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def parse_listing_card(card, base_url):
+    """從列表頁的單張 a.group 卡片取出摘要"""
+    href = card.get("href")
+    if not href:
+        return None
+    house_url = urljoin(base_url, href)
+    card_text = card.get_text(" ", strip=True)
+
+    title_element = CARD_TITLE_SELECTOR.select_one(card)
+    if title_element is not None:
+        title = title_element.get_text(strip=True)
+    else:
+        image = card.find("img", alt=True)
+        title = image["alt"].strip() if image else card_text[:40]
+
+    price_match = CARD_PRICE_PATTERN.search(card_text)
+    size_match = CARD_SIZE_PATTERN.search(card_text)
+    location = GAZETTEER.locate(card_text)
+
+    summary = {
+        "url": house_url,
+        "listing_id": extract_listing_id(house_url),
+        "title": title,
+        "price": price_match.group(1).replace(',', '') if price_match else None,
+        "size": size_match.group(1) if size_match else None,
+        "area": " ".join(part for part in (location.city, location.district) if part) or None,
+    }
+    summary["summary_hash"] = summary_hash(summary)
+    return summary
+
+
+def _card_summaries(soup, base_url):
+    summaries = []
+    seen_urls = set()
+    for card in LISTING_CARD_SELECTOR.select(soup):
+        summary = parse_listing_card(card, base_url)
+        if summary and summary["url"] not in seen_urls:
+            seen_urls.add(summary["url"])
+            summaries.append(summary)
+    return summaries
+
+
+def parse_last_page_link(soup):
+    """分頁列中最大的頁碼，沒有分頁列時回傳 None"""
+    page_numbers = [
+        int(match.group(1))
+        for pagination in PAGINATION_SELECTOR.select(soup)
+        for link in pagination.find_all("a", href=True)
+        for match in [PAGE_PARAM_PATTERN.search(link["href"])] if match
+    ]
+    return max(page_numbers) if page_numbers else None
+
+
+def parse_list_page(html, base_url):
+    """解析列表頁，回傳每張卡片的摘要（依頁面順序、同一網址只保留一次）"""
+    return _card_summaries(BeautifulSoup(html, "lxml"), base_url)
+
+
+def parse_list_html(html, base_url):
+    """只解析一次列表頁，回傳 (卡片摘要, 分頁列最大頁碼)"""
+    soup = BeautifulSoup(html, "lxml")
+    return _card_summaries(soup, base_url), parse_last_page_link(soup)
+
+
+if __name__ == "__main__":
+    # 用法: python house_parser.py page1.html [page2.html ...]
+    results = []
+    start_time = time.perf_counter()
+    for html_path in sys.argv[1:]:
+        with open(html_path, 'r', encoding='utf-8') as f:
+            results.append(parse_house_html(f.read(), html_path))
+    elapsed = time.perf_counter() - start_time
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if results:
+        print(f"解析 {len(results)} 頁，耗時 {elapsed:.3f} 秒", file=sys.stderr)
@@ -0,0 +1,150 @@
+import time
+import asyncio
+import random
+
+import aiohttp
+
+from crawler import USER_AGENTS, resolve_url, record_page, get_response_cache
+from house_parser import parse_house_html
+from metrics import METRICS
+from rate_controller import RATE_CONTROLLER
+
+DEFAULT_PER_HOST_LIMIT = 6
+DEFAULT_TOTAL_LIMIT = 32
+REQUEST_TIMEOUT = 30
+
+
+def is_complete(house_data):
+    """判斷必要欄位（標題、價格、坪數）是否都有取得"""
+    return bool(
+        house_data
+        and house_data.get("title")
+        and house_data.get("price", "0") != "0"
+        and house_data.get("size", "0") != "0"
+    )
+
+
+async def _fetch_html(session, url, max_retries=3):
+    """以共用連線池抓取單一頁面 HTML，失敗時退避重試
+
+    回傳 (html, validators)：validators 為新下載頁面的 ETag / Last-Modified，
+    來自快取（仍新鮮或伺服器回 304）時為 None。
+    """
+    cache = get_response_cache()
+    cached = cache.get(url, "detail") if cache else None
+    if cached and cached.fresh:
+        record_page(url, cached.html, "detail")
+        return cached.html, None
+
+    headers = cached.validators() if cached else {}
+    target_url = resolve_url(url)
+    for attempt in range(max_retries):
+        if attempt:
+            METRICS.incr("http_retry")
+        # 與瀏覽器共用同一個主機的速率；失敗後的退避也由 RATE_CONTROLLER 的暫停處理
+        await RATE_CONTROLLER.acquire_async(target_url)
+        start_time = time.perf_counter()
+        try:
+            with METRICS.timer("http_fetch"):
+                async with session.get(target_url, headers=headers) as response:
+                    if response.status == 304 and cached:
+                        METRICS.incr("http_not_modified")
+                        RATE_CONTROLLER.record_success(target_url, time.perf_counter() - start_time)
+                        cache.refresh(url)
+                        record_page(url, cached.html, "detail")
+                        return cached.html, None
+                    if response.status == 200:
+                        html = await response.text()
+                        RATE_CONTROLLER.record_success(target_url, time.perf_counter() - start_time)
+                        record_page(url, html, "detail")
+                        return html, (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                    METRICS.incr(f"http_status_{response.status}")
+                    if response.status in (404, 410):
+                        # 物件已下架，不代表網站忙碌
+                        return None, None
+                    RATE_CONTROLLER.record_failure(target_url, f"http_{response.status}")
+                    if response.status == 403:
+                        return None, None
+        except asyncio.TimeoutError:
+            METRICS.incr("http_timeout")
+            RATE_CONTROLLER.record_failure(target_url, "timeout")
+        except aiohttp.ClientError:
+            METRICS.incr("http_error")
+            RATE_CONTROLLER.record_failure(target_url, "error")
+    METRICS.incr("http_failed")
+    return None, None
+
+
+async def fetch_house_pages(house_urls, target_region=None,
+                            per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                            total_limit=DEFAULT_TOTAL_LIMIT):
+    """不經瀏覽器並行抓取並解析詳細頁，依輸入順序回傳 (house_url, house_data)"""
+    connector = aiohttp.TCPConnector(limit=total_limit, limit_per_host=per_host_limit, ttl_dns_cache=300)
+    headers = {
+        "User-Agent": random.choice(USER_AGENTS),
+        "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
+    }
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+    # 同時只讓 per_host_limit 個請求向速率控制預約，整批網址不會一次預約到數分鐘之後
+    semaphore = asyncio.Semaphore(per_host_limit)
+
+    async def fetch(url):
+        async with semaphore:
+            return await _fetch_html(session, url)
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+        pages = await asyncio.gather(*(fetch(url) for url in house_urls))
+
+    cache = get_response_cache()
+    results = []
+    for house_url, (html, validators) in zip(house_urls, pages):
+        house_data = None
+        if html:
+            try:
+                with METRICS.timer("listing_parse"):
+                    house_data = parse_house_html(html, house_url, target_region)
+            except Exception as e:
+                print(f"解析 {house_url} 失敗: {e}")
+            if not (house_data and house_data.get("title")):
+                # 回應 200 卻沒有標題，多半是驗證頁或錯誤頁
+                RATE_CONTROLLER.record_failure(resolve_url(house_url), "missing_marker")
+        # 只快取欄位完整的頁面，缺欄位的頁面交給瀏覽器備援重抓時才不會讀到同一份快取
+        if cache and validators is not None and is_complete(house_data):
+            etag, last_modified = validators
+            cache.put(house_url, html, "detail", etag=etag, last_modified=last_modified)
+        results.append((house_url, house_data))
+    return results
+
+
+def crawl_houses_http_first(house_urls, target_region, limit, fallback=None,
+                            per_host_limit=DEFAULT_PER_HOST_LIMIT):
+    """HTTP 優先抓取詳細頁，必要欄位缺漏時才交給 fallback（Selenium）重抓
+
+    每批只抓剩餘配額數量的網址，成功筆數不會超過 limit。
+    逐筆產出 (house_url, house_data)。
+    """
+    house_urls = list(house_urls)
+    collected = 0
+    next_idx = 0
+
+    while next_idx < len(house_urls) and collected < limit:
+        batch = house_urls[next_idx:next_idx + (limit - collected)]
+        next_idx += len(batch)
+
+        results = asyncio.run(fetch_house_pages(batch, target_region, per_host_limit=per_host_limit))
+        fallback_count = 0
+        for house_url, house_data in results:
+            if not is_complete(house_data) and fallback is not None:
+                fallback_count += 1
+                METRICS.incr("browser_fallback")
+                try:
+                    house_data = fallback(house_url) or house_data
+                except Exception as e:
+                    print(f"Selenium 備援抓取 {house_url} 失敗: {e}")
+
+            if house_data:
+                collected += 1
+            yield house_url, house_data
+
+        print(f"HTTP 抓取 {len(batch)} 頁，其中 {fallback_count} 頁改用瀏覽器備援")
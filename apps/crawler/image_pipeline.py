@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from crawler import DATA_FOLDER, USER_AGENTS
+from crawl_output import iter_jsonl, rewrite_jsonl, DEFAULT_JSONL_FILE
+from metrics import METRICS
+from rate_controller import RateController
+
+DEFAULT_IMAGE_DIR = os.path.join(DATA_FOLDER, "images")
+DEFAULT_WORKERS = 8
+# 地圖卡片與列表縮圖的最大邊長（原圖為 836×1114）
+THUMB_MAX_SIZE = (320, 320)
+THUMB_QUALITY = 70
+DOWNLOAD_TIMEOUT = 20
+MAX_ATTEMPTS = 2
+# 下載失敗的網址隔多久再試（秒）
+RETRY_AFTER = 24 * 3600
+IMAGE_REFERER = "https://rent.houseprice.tw/"
+# 圖片放在 CDN 上，速率另外控制：起始與上限都比網頁高（次/秒），失敗時同樣減速並暫停該主機
+IMAGE_INITIAL_RATE = 8
+IMAGE_MAX_RATE = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    url          TEXT PRIMARY KEY,
+    content_hash TEXT,
+    fetched_at   REAL NOT NULL,
+    error        TEXT
+);
+CREATE TABLE IF NOT EXISTS contents (
+    content_hash TEXT PRIMARY KEY,
+    phash        TEXT NOT NULL,
+    width        INTEGER NOT NULL,
+    height       INTEGER NOT NULL,
+    thumb_bytes  INTEGER NOT NULL
+);
+"""
+
+
+def perceptual_hash(image):
+    """64 位元 dHash：縮成 9×8 灰階後比較左右相鄰像素，回傳 16 碼十六進位字串"""
+    small = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hamming_distance(left, right):
+    return bin(int(left, 16) ^ int(right, 16)).count("1")
+
+
+class ImageStore:
+    """以原圖內容的 sha256 為鍵保存 WebP 縮圖：thumbs/<前兩碼>/<sha256>.webp
+
+    images.db 記錄每個網址對應的內容雜湊，contents 記錄每份內容的感知雜湊與尺寸。
+    已處理過的網址不再下載；不同網址下載到相同內容時也不會重新產生縮圖。
+    """
+
+    def __init__(self, image_dir=DEFAULT_IMAGE_DIR):
+        self.image_dir = image_dir
+        os.makedirs(os.path.join(image_dir, "thumbs"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(image_dir, "images.db"), check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def thumb_path(self, content_hash):
+        return os.path.join(self.image_dir, "thumbs", content_hash[:2], f"{content_hash}.webp")
+
+    def lookup(self, url):
+        """已成功處理過的網址回傳 (content_hash, phash)，否則回傳 None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT i.content_hash, c.phash FROM images i JOIN contents c ON c.content_hash = i.content_hash "
+                "WHERE i.url = ?", (url,)
+            ).fetchone()
+        if row and os.path.exists(self.thumb_path(row[0])):
+            return row
+        return None
+
+    def recently_failed(self, url, now=None):
+        now = now or time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT fetched_at FROM images WHERE url = ? AND error IS NOT NULL", (url,)).fetchone()
+        return row is not None and now - row[0] < RETRY_AFTER
+
+    def content_phash(self, content_hash):
+        with self._lock:
+            row = self.conn.execute("SELECT phash FROM contents WHERE content_hash = ?", (content_hash,)).fetchone()
+        if row and os.path.exists(self.thumb_path(content_hash)):
+            return row[0]
+        return None
+
+    def save_content(self, content_hash, phash, width, height, thumb):
+        path = self.thumb_path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(thumb)
+        os.replace(tmp_path, path)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO contents (content_hash, phash, width, height, thumb_bytes) VALUES (?, ?, ?, ?, ?)",
+                (content_hash, phash, width, height, len(thumb)),
+            )
+
+    def record_url(self, url, content_hash=None, error=None):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO images (url, content_hash, fetched_at, error) VALUES (?, ?, ?, ?)",
+                (url, content_hash, time.time(), error),
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def make_thumbnail(data):
+    """回傳 (WebP 縮圖 bytes, 感知雜湊, 原圖寬, 原圖高)"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        width, height = image.size
+        phash = perceptual_hash(image)
+        thumb = image.convert("RGB")
+        thumb.thumbnail(THUMB_MAX_SIZE, Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumb.save(buffer, format="WEBP", quality=THUMB_QUALITY, method=4)
+    return buffer.getvalue(), phash, width, height
+
+
+class ImagePipeline:
+    """以有上限的執行緒池下載物件圖片、產生縮圖並計算感知雜湊"""
+
+    def __init__(self, store, workers=DEFAULT_WORKERS, rate_controller=None):
+        self.store = store
+        self.workers = workers
+        self.rate_controller = rate_controller or RateController(
+            initial_rate=IMAGE_INITIAL_RATE, max_rate=IMAGE_MAX_RATE, burst=workers
+        )
+        self._local = threading.local()
+        self.stats = {"cached": 0, "downloaded": 0, "reused_content": 0, "failed": 0, "skipped_failed": 0,
+                      "bytes_in": 0, "bytes_out": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _session(self):
+        # requests.Session 不保證跨執行緒安全，每個工作執行緒各用一個
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({"User-Agent": random.choice(USER_AGENTS), "Referer": IMAGE_REFERER})
+            self._local.session = session
+        return session
+
+    def _download(self, url):
+        for attempt in range(MAX_ATTEMPTS):
+            # 失敗後的退避由速率控制暫停該主機，重試前不另外休息
+            self.rate_controller.acquire(url)
+            start_time = time.perf_counter()
+            try:
+                with METRICS.timer("image_download"):
+                    response = self._session().get(url, timeout=DOWNLOAD_TIMEOUT)
+                response.raise_for_status()
+                self.rate_controller.record_success(url, time.perf_counter() - start_time)
+                return response.content
+            except Exception as e:
+                METRICS.incr("image_download_error")
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                # 圖片已刪除不代表主機忙碌
+                if status not in (404, 410):
+                    self.rate_controller.record_failure(url, "image_error")
+                # 除了 429 之外的 4xx 重試也不會成功，直接放棄
+                if status is not None and 400 <= status < 500 and status != 429:
+                    raise
+                if attempt + 1 == MAX_ATTEMPTS:
+                    raise
+                print(f"圖片下載失敗，重試: {url} ({e})")
+
+    def process_url(self, url):
+        """處理單一圖片網址，回傳 {"thumbnail", "phash"}；失敗時回傳 None"""
+        known = self.store.lookup(url)
+        if known:
+            self._count("cached")
+            return {"thumbnail": self._relative(known[0]), "phash": known[1]}
+        if self.store.recently_failed(url):
+            self._count("skipped_failed")
+            return None
+
+        try:
+            data = self._download(url)
+        except Exception as e:
+            self._count("failed")
+            self.store.record_url(url, error=str(e)[:200])
+            return None
+        self._count("downloaded")
+        self._count("bytes_in", len(data))
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        phash = self.store.content_phash(content_hash)
+        if phash is not None:
+            self._count("reused_content")
+        else:
+            try:
+                with METRICS.timer("image_thumbnail"):
+                    thumb, phash, width, height = make_thumbnail(data)
+            except Exception as e:
+                self._count("failed")
+                self.store.record_url(url, error=f"decode: {e}"[:200])
+                return None
+            self.store.save_content(content_hash, phash, width, height, thumb)
+            self._count("bytes_out", len(thumb))
+        self.store.record_url(url, content_hash)
+        return {"thumbnail": self._relative(content_hash), "phash": phash}
+
+    def _relative(self, content_hash):
+        return os.path.relpath(self.store.thumb_path(content_hash), self.store.image_dir)
+
+    def process_urls(self, urls):
+        """並行處理多個網址（重複的只處理一次），回傳 {網址: 結果}"""
+        unique_urls = list(dict.fromkeys(urls))
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image") as executor:
+            return dict(zip(unique_urls, executor.map(self.process_url, unique_urls)))
+
+
+def process_jsonl_images(jsonl_path=DEFAULT_JSONL_FILE, image_dir=DEFAULT_IMAGE_DIR, workers=DEFAULT_WORKERS):
+    """為 JSONL 中每筆物件的圖片產生縮圖與感知雜湊，寫回 thumbnails / image_hashes 欄位；回傳統計
+
+    縮圖路徑相對於 image_dir，順序與 images 相同，失敗的圖片為 None。
+    """
+    urls = [url for record in iter_jsonl(jsonl_path) for url in record.get("images") or []]
+    store = ImageStore(image_dir)
+    pipeline = ImagePipeline(store, workers)
+    try:
+        with METRICS.timer("images"):
+            results = pipeline.process_urls(urls)
+
+        def records_with_images():
+            for record in iter_jsonl(jsonl_path):
+                processed = [results.get(url) for url in record.get("images") or []]
+                record["thumbnails"] = [result["thumbnail"] if result else None for result in processed]
+                record["image_hashes"] = [result["phash"] if result else None for result in processed]
+                yield record
+
+        rewrite_jsonl(jsonl_path, records_with_images())
+    finally:
+        store.close()
+    pipeline.stats["urls"] = len(set(urls))
+    return pipeline.stats
+
+
+def print_stats(stats):
+    print(f"圖片處理：{stats['urls']} 張，沿用先前結果 {stats['cached']} 張，下載 {stats['downloaded']} 張"
+          f"（內容重複 {stats['reused_content']} 張），失敗 {stats['failed']} 張，近期失敗略過 {stats['skipped_failed']} 張")
+    if stats["bytes_out"]:
+        print(f"   原圖 {stats['bytes_in'] / 1024 / 1024:.1f} MB → 縮圖 {stats['bytes_out'] / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="下載物件圖片，產生 WebP 縮圖並計算感知雜湊")
+    parser.add_argument("file", nargs="?", default=DEFAULT_JSONL_FILE, help="爬蟲輸出的 JSONL（會就地改寫）")
+    parser.add_argument("--image-dir", default=DEFAULT_IMAGE_DIR, help="縮圖與 images.db 的存放目錄")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="同時下載的執行緒數")
+    args = parser.parse_args()
+
+    print_stats(process_jsonl_images(args.file, args.image_dir, args.workers))
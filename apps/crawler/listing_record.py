@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import argparse
+from dataclasses import dataclass, field, fields, asdict
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from crawl_output import iter_jsonl, DEFAULT_JSONL_FILE
+from house_parser import MISSING, extract_listing_id
+
+DEFAULT_PARQUET_FILE = os.path.splitext(DEFAULT_JSONL_FILE)[0] + ".parquet"
+# 每次寫入 Parquet 的列數（一個 row group），記憶體中最多保留這麼多筆
+PARQUET_BATCH_SIZE = 10000
+
+# 爬蟲用來表示「沒有值」的字串，轉成 None
+SENTINELS = {"", "0", MISSING, "未知", "未取得"}
+
+LAYOUT_PATTERNS = {
+    "rooms": re.compile(r'(\d+)\s*房'),
+    "living_rooms": re.compile(r'(\d+)\s*廳'),
+    "bathrooms": re.compile(r'(\d+)\s*衛'),
+}
+# 格局數量的合理上限（整棟出租的套房可達上百間），超過視為解析錯誤，不寫入 int16 欄位
+MAX_LAYOUT_COUNT = 999
+# 樓層的合理範圍（全台最高建築約 100 層、最深地下室約 B7），超出視為解析錯誤，不寫入 int16 欄位
+MAX_FLOOR = 200
+MIN_FLOOR = -10
+# 樓層欄位如「3/13樓」「3F/13F」「B1/5樓」「1~3/5樓」「頂樓加蓋/5F」
+FLOOR_NUMBER_PATTERN = re.compile(r'(B)?\s*(\d+)', re.IGNORECASE)
+
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return None if value in SENTINELS else value
+    return value
+
+
+def parse_price(value):
+    value = _clean(value)
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value > 0 else None
+    digits = re.sub(r'[^\d]', "", str(value))
+    return int(digits) if digits and int(digits) > 0 else None
+
+
+def parse_size(value):
+    value = _clean(value)
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    try:
+        size = float(re.sub(r'[^\d.]', "", str(value)))
+    except ValueError:
+        return None
+    return size if size > 0 else None
+
+
+def _floor_number(text):
+    match = FLOOR_NUMBER_PATTERN.search(text)
+    if not match:
+        return None
+    number = int(match.group(2))
+    number = -number if match.group(1) else number
+    return number if MIN_FLOOR <= number <= MAX_FLOOR else None
+
+
+def parse_floor(value):
+    """回傳 (樓層, 總樓層)；地下室為負數，頂樓加蓋以總樓層 + 1 表示，無法判斷或不合理的為 None"""
+    value = _clean(value)
+    if value is None:
+        return None, None
+    floor_text, _, total_text = str(value).partition("/")
+    total_floors = _floor_number(total_text) if total_text else None
+    if "頂" in floor_text and "加" in floor_text:
+        floor = total_floors + 1 if total_floors else None
+    elif "頂" in floor_text:
+        floor = total_floors
+    elif "整" in floor_text:
+        floor = None
+    else:
+        floor = _floor_number(floor_text)
+    return floor, total_floors
+
+
+def parse_layout(value):
+    """「2房1廳1衛」→ {"rooms": 2, "living_rooms": 1, "bathrooms": 1}，沒有或不合理的項目為 None"""
+    value = _clean(value)
+    counts = {}
+    for name, pattern in LAYOUT_PATTERNS.items():
+        match = pattern.search(value) if value else None
+        count = int(match.group(1)) if match else None
+        counts[name] = count if count is not None and count <= MAX_LAYOUT_COUNT else None
+    return counts
+
+
+def _parse_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value != 0 else None
+
+
+@dataclass(slots=True)
+class ListingRecord:
+    """正規化後的物件資料：數值欄位已轉型，缺值一律為 None"""
+
+    source_id: str
+    url: Optional[str]
+    title: str
+    price: Optional[int]
+    size_ping: Optional[float]
+    size_detail: Optional[str]
+    room_layout: Optional[str]
+    rooms: Optional[int]
+    living_rooms: Optional[int]
+    bathrooms: Optional[int]
+    floor_info: Optional[str]
+    floor: Optional[int]
+    total_floors: Optional[int]
+    house_type: Optional[str]
+    parking: Optional[str]
+    address: Optional[str]
+    city: Optional[str]
+    district: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    coordinate_source: Optional[str] = None
+    geohash: Optional[str] = None
+    images: List[str] = field(default_factory=list)
+    thumbnails: List[Optional[str]] = field(default_factory=list)
+    image_hashes: List[Optional[str]] = field(default_factory=list)
+    facilities: List[str] = field(default_factory=list)
+    alternate_ids: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_raw(cls, item):
+        """由爬蟲輸出的 dict 建立；缺少編號或標題時回傳 None"""
+        source_id = item.get("id") or extract_listing_id(item.get("url"))
+        title = _clean(item.get("title"))
+        if not source_id or not title:
+            return None
+        floor, total_floors = parse_floor(item.get("floor_info"))
+        layout = parse_layout(item.get("room_layout"))
+        return cls(
+            source_id=str(source_id),
+            url=item.get("url"),
+            title=title,
+            price=parse_price(item.get("price")),
+            size_ping=parse_size(item.get("size")),
+            size_detail=_clean(item.get("size_detail")),
+            room_layout=_clean(item.get("room_layout")),
+            rooms=layout["rooms"],
+            living_rooms=layout["living_rooms"],
+            bathrooms=layout["bathrooms"],
+            floor_info=_clean(item.get("floor_info")),
+            floor=floor,
+            total_floors=total_floors,
+            house_type=_clean(item.get("house_type")),
+            parking=_clean(item.get("parking")),
+            address=_clean(item.get("address")),
+            city=_clean(item.get("city")),
+            district=_clean(item.get("district")),
+            latitude=_parse_float(item.get("latitude")),
+            longitude=_parse_float(item.get("longitude")),
+            coordinate_source=item.get("coordinate_source"),
+            geohash=item.get("geohash"),
+            images=list(item.get("images") or []),
+            thumbnails=list(item.get("thumbnails") or []),
+            image_hashes=list(item.get("image_hashes") or []),
+            facilities=list(item.get("facilities") or []),
+            alternate_ids=[str(alternate.get("id")) for alternate in item.get("alternates") or [] if alternate.get("id")],
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+
+FIELD_NAMES = [record_field.name for record_field in fields(ListingRecord)]
+
+
+def iter_listing_records(jsonl_path=DEFAULT_JSONL_FILE, stats=None):
+    """逐筆讀取 JSONL 並轉成 ListingRecord，略過缺少編號或標題的資料"""
+    for item in iter_jsonl(jsonl_path):
+        record = ListingRecord.from_raw(item)
+        if record is None:
+            if stats is not None:
+                stats["skipped"] = stats.get("skipped", 0) + 1
+            continue
+        yield record
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    string_list = pa.list_(pa.string())
+    types = {
+        "price": pa.int32(), "rooms": pa.int16(), "living_rooms": pa.int16(), "bathrooms": pa.int16(),
+        "floor": pa.int16(), "total_floors": pa.int16(),
+        "size_ping": pa.float64(), "latitude": pa.float64(), "longitude": pa.float64(),
+        "images": string_list, "thumbnails": string_list, "image_hashes": string_list,
+        "facilities": string_list, "alternate_ids": string_list,
+    }
+    # 重複度高的文字欄位以字典編碼，載入多次執行的資料時佔用較少記憶體
+    dictionary_fields = {"city", "district", "house_type", "parking", "room_layout", "coordinate_source"}
+    schema_fields = []
+    for name in FIELD_NAMES:
+        if name in types:
+            field_type = types[name]
+        elif name in dictionary_fields:
+            field_type = pa.dictionary(pa.int16(), pa.string())
+        else:
+            field_type = pa.string()
+        schema_fields.append(pa.field(name, field_type, nullable=name != "source_id"))
+    return pa.schema(schema_fields)
+
+
+def _record_batch(records, schema):
+    import pyarrow as pa
+
+    columns = {name: [getattr(record, name) for record in records] for name in FIELD_NAMES}
+    return pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def write_parquet(records, path=DEFAULT_PARQUET_FILE, batch_size=PARQUET_BATCH_SIZE):
+    """分批寫入 Parquet（zstd 壓縮），回傳寫入筆數"""
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema()
+    count = 0
+    batch = []
+    tmp_path = path + ".tmp"
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_batch(_record_batch(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_record_batch(batch, schema))
+            count += len(batch)
+    os.replace(tmp_path, path)
+    return count
+
+
+def iter_parquet_rows(path, columns=None, batch_size=PARQUET_BATCH_SIZE):
+    """逐批讀取 Parquet，以 dict 逐列回傳（欄位已是正確型別）"""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
+
+
+def export_parquet(jsonl_path=DEFAULT_JSONL_FILE, parquet_path=DEFAULT_PARQUET_FILE):
+    stats = {"skipped": 0}
+    stats["written"] = write_parquet(iter_listing_records(jsonl_path, stats), parquet_path)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="將爬蟲輸出轉成型別化的 Parquet 檔")
+    parser.add_argument("file", nargs="?", default=DEFAULT_JSONL_FILE, help="爬蟲輸出的 JSONL")
+    parser.add_argument("--output", default=None, help="Parquet 輸出路徑（預設與 JSONL 同名）")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.file)[0] + ".parquet"
+    stats = export_parquet(args.file, output)
+    print(f"已寫入 {stats['written']} 筆到 {output}（略過 {stats['skipped']} 筆缺少編號或標題的資料）")
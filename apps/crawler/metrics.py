@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+METRIC_PREFIX = "crawler"
+
+
+class CrawlMetrics:
+    """記錄各階段耗時與事件次數，執行結束後輸出 Prometheus 文字格式與 JSON 摘要
+
+    phase（導覽、等待、各欄位萃取、休息 / 退避等）累計次數、總時間與最大值；
+    counter 記錄重試、逾時與各種備援路徑的次數。瀏覽器工作池跨執行緒呼叫，更新時以鎖保護。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.phases = {}
+            self.counters = {}
+            self.gauges = {}
+            self.pages = []
+
+    def observe(self, phase, seconds):
+        with self._lock:
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = {"count": 0, "total": 0.0, "max": 0.0}
+            stats["count"] += 1
+            stats["total"] += seconds
+            if seconds > stats["max"]:
+                stats["max"] = seconds
+
+    @contextmanager
+    def timer(self, phase):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start_time)
+
+    def sleep(self, seconds, phase="sleep"):
+        """休息並計入指定階段，讓刻意等待的時間與實際工作分開統計"""
+        self.observe(phase, seconds)
+        time.sleep(seconds)
+
+    def incr(self, event, amount=1):
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def add_page(self, region, page_num, seconds, records):
+        """記錄單一列表頁（含其詳細頁）的處理結果"""
+        with self._lock:
+            self.pages.append({"region": region, "page": page_num, "seconds": round(seconds, 3), "records": records})
+
+    def summary(self):
+        with self._lock:
+            finished_at = time.time()
+            phases = {
+                phase: {
+                    "count": stats["count"],
+                    "total_seconds": round(stats["total"], 6),
+                    "mean_seconds": round(stats["total"] / stats["count"], 6) if stats["count"] else 0.0,
+                    "max_seconds": round(stats["max"], 6),
+                }
+                for phase, stats in sorted(self.phases.items(), key=lambda x: x[1]["total"], reverse=True)
+            }
+            return {
+                "started_at": self.started_at,
+                "finished_at": finished_at,
+                "duration_seconds": round(finished_at - self.started_at, 3),
+                "phases": phases,
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+                "pages": list(self.pages),
+            }
+
+    def to_prometheus(self):
+        summary = self.summary()
+        lines = [
+            f"# HELP {METRIC_PREFIX}_phase_seconds Time spent in each crawl phase",
+            f"# TYPE {METRIC_PREFIX}_phase_seconds summary",
+        ]
+        for phase, stats in summary["phases"].items():
+            lines.append(f'{METRIC_PREFIX}_phase_seconds_sum{{phase="{phase}"}} {stats["total_seconds"]}')
+            lines.append(f'{METRIC_PREFIX}_phase_seconds_count{{phase="{phase}"}} {stats["count"]}')
+
+        lines.append(f"# HELP {METRIC_PREFIX}_phase_max_seconds Slowest single observation per phase")
+        lines.append(f"# TYPE {METRIC_PREFIX}_phase_max_seconds gauge")
+        for phase, stats in summary["phases"].items():
+            lines.append(f'{METRIC_PREFIX}_phase_max_seconds{{phase="{phase}"}} {stats["max_seconds"]}')
+
+        lines.append(f"# HELP {METRIC_PREFIX}_events_total Retries, timeouts, fallbacks and missing fields")
+        lines.append(f"# TYPE {METRIC_PREFIX}_events_total counter")
+        for event, count in summary["counters"].items():
+            lines.append(f'{METRIC_PREFIX}_events_total{{event="{event}"}} {count}')
+
+        for name, value in summary["gauges"].items():
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+            lines.append(f"{METRIC_PREFIX}_{name} {value}")
+
+        lines.append(f"# TYPE {METRIC_PREFIX}_run_duration_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_run_duration_seconds {summary['duration_seconds']}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_run_finished_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_run_finished_timestamp_seconds {summary['finished_at']:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prom_path=None, json_path=None):
+        """以暫存檔 + 改名寫出，node_exporter textfile collector 不會讀到寫到一半的檔案"""
+        if prom_path:
+            _atomic_write(prom_path, self.to_prometheus())
+        if json_path:
+            _atomic_write(json_path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+
+    def print_report(self, top=10):
+        summary = self.summary()
+        print("各階段耗時（依總時間排序）:")
+        for phase, stats in list(summary["phases"].items())[:top]:
+            print(f"   {phase}: 共 {stats['total_seconds']:.1f} 秒，{stats['count']} 次，"
+                  f"平均 {stats['mean_seconds']:.3f} 秒，最長 {stats['max_seconds']:.3f} 秒")
+        if summary["counters"]:
+            print("事件次數:")
+            for event, count in summary["counters"].items():
+                print(f"   {event}: {count}")
+
+
+def _atomic_write(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+METRICS = CrawlMetrics()
@@ -0,0 +1,185 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from urllib.parse import urlparse
+
+from metrics import METRICS
+
+# 每個主機的請求速率（次/秒）：起始值、下限與上限；上限即禮貌性的天花板，可用 --max-rate 或 CRAWLER_MAX_RATE 調整
+DEFAULT_INITIAL_RATE = 0.5
+DEFAULT_MIN_RATE = 0.05
+DEFAULT_MAX_RATE = float(os.getenv("CRAWLER_MAX_RATE", "2"))
+# 每次順利回應增加的速率；失敗時乘上的倍數
+ADDITIVE_INCREASE = 0.05
+DECREASE_FACTOR = 0.5
+# 回應超過此秒數時不再加速
+SLOW_RESPONSE = 8.0
+# 閒置後最多可連續發出的請求數
+BURST = 2
+# 失敗後整個主機暫停的秒數，連續失敗時加倍
+COOLDOWN_BASE = 5.0
+COOLDOWN_MAX = 60.0
+# 等待時間加減的隨機比例，避免多個執行緒同步發出請求
+JITTER = 0.2
+# 本機的重播伺服器不限速（見 replay.py）
+UNLIMITED_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+class HostRate:
+    __slots__ = ("rate", "tokens", "updated_at", "decreased_at", "consecutive_failures", "successes", "failures",
+                 "waited", "generation")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.tokens = burst
+        self.updated_at = now
+        self.decreased_at = None
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.waited = 0.0
+        # 每次失敗加一；等待中的請求醒來時比對，不同代表等待期間發生失敗，原本的預約作廢
+        self.generation = 0
+
+
+class RateController:
+    """各主機獨立的 token bucket，速率以 AIMD 調整：回應快且正常時逐步加速，逾時、錯誤頁或缺少標題時減半並暫停
+
+    同一程序內所有抓取路徑（瀏覽器、HTTP、列表頁預抓）共用，多個執行緒對同一主機的總速率不會超過上限。
+    分散式爬取時每個工作者程序各自限速。
+    """
+
+    def __init__(self, initial_rate=DEFAULT_INITIAL_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 burst=BURST, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self.clock = clock
+        self.configure(initial_rate=initial_rate, min_rate=min_rate, max_rate=max_rate, burst=burst)
+
+    def configure(self, initial_rate=None, min_rate=None, max_rate=None, burst=None):
+        """更新設定並清除各主機目前的速率"""
+        with self._lock:
+            if min_rate is not None:
+                self.min_rate = min_rate
+            if max_rate is not None:
+                self.max_rate = max_rate
+            if initial_rate is not None:
+                self.initial_rate = initial_rate
+            if burst is not None:
+                self.burst = burst
+            self.initial_rate = min(max(self.initial_rate, self.min_rate), self.max_rate)
+            self.hosts = {}
+
+    @staticmethod
+    def host_of(url):
+        return urlparse(url).hostname or ""
+
+    def _state(self, host, now):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostRate(self.initial_rate, self.burst, now)
+        return state
+
+    def reserve(self, url):
+        """預約一次請求，回傳 (需要等待的秒數, 預約時該主機的失敗代數)"""
+        host = self.host_of(url)
+        if host in UNLIMITED_HOSTS:
+            return 0.0, None
+        with self._lock:
+            now = self.clock()
+            state = self._state(host, now)
+            # 暫停期間 updated_at 位於未來，暫停結束後才開始補充
+            if now > state.updated_at:
+                state.tokens = min(self.burst, state.tokens + (now - state.updated_at) * state.rate)
+                state.updated_at = now
+            state.tokens -= 1
+            delay = (state.updated_at - now) + max(0.0, -state.tokens) / state.rate
+            if delay > 0:
+                delay *= random.uniform(1 - JITTER, 1 + JITTER)
+                state.waited += delay
+            return delay, state.generation
+
+    def _failed_since(self, url, generation):
+        with self._lock:
+            state = self.hosts.get(self.host_of(url))
+            return state is not None and state.generation != generation
+
+    def acquire(self, url):
+        """等到可以對該主機發出請求（執行緒用）
+
+        預約的時間是依當時的速率排定的；等待期間若該主機發生失敗，醒來後依新的速率與暫停重新預約。
+        """
+        while True:
+            delay, generation = self.reserve(url)
+            if delay <= 0:
+                return
+            METRICS.sleep(delay, "rate_wait")
+            if not self._failed_since(url, generation):
+                return
+            METRICS.incr("rate_rereserve")
+
+    async def acquire_async(self, url):
+        """等到可以對該主機發出請求（asyncio 用），等待期間發生失敗時同樣重新預約"""
+        while True:
+            delay, generation = self.reserve(url)
+            if delay <= 0:
+                return
+            METRICS.observe("rate_wait", delay)
+            await asyncio.sleep(delay)
+            if not self._failed_since(url, generation):
+                return
+            METRICS.incr("rate_rereserve")
+
+    def record_success(self, url, latency=None):
+        """正常回應：速率加上 ADDITIVE_INCREASE（回應太慢時維持不變）"""
+        host = self.host_of(url)
+        if host in UNLIMITED_HOSTS:
+            return
+        with self._lock:
+            state = self._state(host, self.clock())
+            state.successes += 1
+            state.consecutive_failures = 0
+            if latency is not None and latency > SLOW_RESPONSE:
+                METRICS.incr("rate_slow_response")
+                return
+            state.rate = min(self.max_rate, state.rate + ADDITIVE_INCREASE)
+
+    def record_failure(self, url, reason="error"):
+        """逾時、錯誤頁、被封鎖或缺少標題：速率減半並暫停該主機
+
+        同時進行的請求常一起失敗，距離上次減速不到一個請求間隔時只延長暫停，不再重複減速或加長暫停。
+        """
+        host = self.host_of(url)
+        if host in UNLIMITED_HOSTS:
+            return
+        METRICS.incr(f"rate_backoff_{reason}")
+        with self._lock:
+            now = self.clock()
+            state = self._state(host, now)
+            state.failures += 1
+            if state.decreased_at is None or now - state.decreased_at >= 1.0 / state.rate:
+                state.rate = max(self.min_rate, state.rate * DECREASE_FACTOR)
+                state.decreased_at = now
+                state.consecutive_failures += 1
+            cooldown = min(COOLDOWN_MAX, COOLDOWN_BASE * 2 ** (state.consecutive_failures - 1))
+            state.updated_at = max(state.updated_at, now + cooldown)
+            # 先前的預約都會在醒來後重新預約，不再保留它們欠下的額度，以免重複計算
+            state.tokens = 0.0
+            state.generation += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                host: {"rate": round(state.rate, 3), "successes": state.successes, "failures": state.failures,
+                       "waited_seconds": round(state.waited, 1)}
+                for host, state in self.hosts.items()
+            }
+
+    def print_report(self):
+        for host, stats in self.snapshot().items():
+            print(f"速率控制 {host}: 目前 {stats['rate']:.2f} 次/秒，成功 {stats['successes']} 次，"
+                  f"失敗 {stats['failures']} 次，累計等待 {stats['waited_seconds']:.0f} 秒")
+
+
+RATE_CONTROLLER = RateController()
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import random
+import urllib.request
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, quote
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler import USER_AGENTS, resolve_url
+from house_parser import parse_list_html
+from metrics import METRICS
+from rate_controller import RATE_CONTROLLER
+
+DEFAULT_REGIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regions.json")
+
+REGION_DEFAULTS = {"target_count": 40, "max_pages": 3, "priority": 1, "enabled": True}
+
+PREFETCH_TIMEOUT = 20
+# 連續幾次預抓的列表頁解析不到物件，就停用預抓（代表列表需要瀏覽器執行 JS 才會產生）
+PREFETCH_MAX_MISSES = 2
+
+
+def load_regions(path=DEFAULT_REGIONS_FILE):
+    """讀取地區設定；每個地區可覆寫 defaults 中的 target_count / max_pages / priority"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    defaults = dict(REGION_DEFAULTS)
+    defaults.update(config.get("defaults", {}))
+
+    regions = []
+    names = set()
+    for entry in config.get("regions", []):
+        region = dict(defaults)
+        region.update(entry)
+        if not region.get("name") or not region.get("url"):
+            raise ValueError(f"地區設定缺少 name 或 url: {entry}")
+        if region["name"] in names:
+            raise ValueError(f"地區名稱重複: {region['name']}")
+        names.add(region["name"])
+        if region["enabled"]:
+            regions.append(region)
+    return regions
+
+
+def page_url(region_url, page_num):
+    """產生列表第 page_num 頁的網址（設定或取代查詢參數 p）"""
+    parsed = urlparse(region_url)
+    query = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True) if key != "p"]
+    if page_num > 1 or "p=" in parsed.query:
+        query.append(("p", str(page_num)))
+    return urlunparse(parsed._replace(path=parsed.path or "/", query=urlencode(query)))
+
+
+class RegionState:
+    """單一地區的進度：下一頁、已收集筆數、是否已到最後一頁"""
+
+    def __init__(self, config, order):
+        self.name = config["name"]
+        self.url = config["url"]
+        self.target_count = int(config["target_count"])
+        self.max_pages = int(config["max_pages"])
+        self.priority = float(config["priority"])
+        self.order = order
+        self.next_page = 1
+        self.count = 0
+        self.exhausted = False
+        self.first_page_size = None
+        self.last_page_urls = set()
+        self.pages_done = 0
+        self.stats = {"detected": {}, "districts": {}}
+
+    @property
+    def remaining(self):
+        return max(0, self.target_count - self.count)
+
+    @property
+    def done(self):
+        return self.exhausted or self.remaining == 0 or self.next_page > self.max_pages
+
+
+class RegionScheduler:
+    """多地區交錯排程：每處理完一頁就重新挑選下一個地區
+
+    以 priority × 剩餘配額比例排序，優先度相同的地區輪流推進；
+    地區達到目標、抓不到頁面或偵測到最後一頁即結束。
+    """
+
+    def __init__(self, region_configs, checkpoint=None):
+        self.regions = [RegionState(config, order) for order, config in enumerate(region_configs)]
+        if checkpoint:
+            for region in self.regions:
+                region.next_page = checkpoint.region_pages.get(region.name, 1)
+                region.count = checkpoint.region_counts.get(region.name, 0)
+                region.exhausted = region.name in checkpoint.finished_regions
+
+    def next_region(self):
+        candidates = [region for region in self.regions if not region.done]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda region: (
+            region.priority * region.remaining / max(region.target_count, 1),
+            -region.order,
+        ))
+
+    def observe_page(self, region, page_num, summaries, last_page_link=None):
+        """依列表頁內容判斷是否為最後一頁；回傳 False 表示此頁與上一頁相同（網站超出頁數時重複最後一頁）"""
+        page_urls = {summary["url"] for summary in summaries}
+        if not page_urls:
+            region.exhausted = True
+            return False
+        if page_urls <= region.last_page_urls:
+            region.exhausted = True
+            return False
+        region.last_page_urls = page_urls
+
+        if last_page_link is not None:
+            if last_page_link <= page_num:
+                region.exhausted = True
+        elif region.first_page_size is not None and len(summaries) < region.first_page_size:
+            # 沒有分頁列時，物件數少於第一頁即視為最後一頁
+            region.exhausted = True
+
+        if region.first_page_size is None:
+            region.first_page_size = len(summaries)
+        return True
+
+    def finish_page(self, region):
+        region.next_page += 1
+        region.pages_done += 1
+
+    def all_regions(self):
+        return list(self.regions)
+
+
+class ListPagePrefetcher:
+    """處理詳細頁時，以背景執行緒先用 HTTP 抓下一個列表頁
+
+    列表頁若需要瀏覽器執行 JS 才有物件，連續解析不到物件後會自動停用，改回瀏覽器載入。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="list-prefetch")
+        self._futures = {}
+        self.enabled = True
+        self._misses = 0
+
+    def _fetch(self, url):
+        # urllib 不接受非 ASCII 網址（如 /list/台北市_city/），先做百分比編碼
+        target_url = quote(resolve_url(url), safe=":/?&=%#+")
+        request = urllib.request.Request(target_url, headers={
+            "User-Agent": random.choice(USER_AGENTS),
+            "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
+        })
+        # 預抓與瀏覽器共用同一個主機的速率
+        RATE_CONTROLLER.acquire(target_url)
+        start_time = time.perf_counter()
+        try:
+            with METRICS.timer("list_prefetch"):
+                with urllib.request.urlopen(request, timeout=PREFETCH_TIMEOUT) as response:
+                    charset = response.headers.get_content_charset() or "utf-8"
+                    html = response.read().decode(charset, errors="replace")
+            RATE_CONTROLLER.record_success(target_url, time.perf_counter() - start_time)
+            return html
+        except Exception:
+            METRICS.incr("list_prefetch_error")
+            RATE_CONTROLLER.record_failure(target_url, "prefetch_error")
+            return None
+
+    def submit(self, url):
+        if self.enabled and url not in self._futures:
+            self._futures[url] = self._executor.submit(self._fetch, url)
+
+    def take(self, url):
+        """取出預抓結果 (html, 卡片摘要, 分頁列最大頁碼)；沒有預抓或無法使用時回傳 None，由呼叫端改用瀏覽器"""
+        future = self._futures.pop(url, None)
+        if future is None:
+            return None
+        html = future.result()
+        summaries, last_page_link = parse_list_html(html, url) if html else ([], None)
+        if summaries:
+            self._misses = 0
+            METRICS.incr("list_prefetch_hit")
+            return html, summaries, last_page_link
+
+        self._misses += 1
+        if self._misses >= PREFETCH_MAX_MISSES and self.enabled:
+            self.enabled = False
+            print("預抓的列表頁解析不到物件，停用列表頁預抓")
+        return None
+
+    def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+        self._executor.shutdown(wait=False)
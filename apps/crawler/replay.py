@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qsl, urlencode, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from house_parser import extract_listing_id
+
+# 語料庫格式版本，格式變動時遞增，讀取時會檢查
+CORPUS_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+PAGES_FOLDER = "pages"
+GOLDEN_FOLDER = "golden"
+
+
+def page_key(url):
+    """語料庫索引鍵：路徑 + 排序後的查詢字串，與網站主機無關，錄製與重播可共用
+
+    路徑先解碼，讓瀏覽器送出的 %E5%8F%B0 與錄製時的「台」對應到同一頁。
+    """
+    parsed = urlparse(url)
+    path = unquote(parsed.path) or "/"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"{path}?{query}" if query else path
+
+
+class PageCorpus:
+    """磁碟上的頁面語料庫：manifest.json 記錄網址 → 檔案，頁面存於 pages/，預期解析結果存於 golden/"""
+
+    def __init__(self, corpus_dir):
+        self.corpus_dir = corpus_dir
+        self.manifest_path = os.path.join(corpus_dir, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            version = self.manifest.get("format_version")
+            if version != CORPUS_FORMAT_VERSION:
+                raise ValueError(f"語料庫格式版本 {version} 與程式版本 {CORPUS_FORMAT_VERSION} 不符")
+        else:
+            self.manifest = {"format_version": CORPUS_FORMAT_VERSION, "created_at": time.time(), "pages": {}}
+
+    def save(self, url, html, kind):
+        """錄製一個頁面；同一網址再次錄製會覆蓋"""
+        key = page_key(url)
+        file_name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".html"
+        pages_dir = os.path.join(self.corpus_dir, PAGES_FOLDER)
+        os.makedirs(pages_dir, exist_ok=True)
+        with open(os.path.join(pages_dir, file_name), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+        with self._lock:
+            self.manifest["pages"][key] = {
+                "url": url,
+                "kind": kind,
+                "file": f"{PAGES_FOLDER}/{file_name}",
+                "recorded_at": time.time(),
+            }
+            self._write_manifest()
+
+    def _write_manifest(self):
+        os.makedirs(self.corpus_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def lookup(self, url_or_key):
+        entry = self.manifest["pages"].get(page_key(url_or_key))
+        if entry is None:
+            return None
+        with open(os.path.join(self.corpus_dir, entry["file"]), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def pages(self, kind=None):
+        """依網址排序產出 (url, kind, html)"""
+        for key in sorted(self.manifest["pages"]):
+            entry = self.manifest["pages"][key]
+            if kind and entry["kind"] != kind:
+                continue
+            with open(os.path.join(self.corpus_dir, entry["file"]), 'r', encoding='utf-8') as f:
+                yield entry["url"], entry["kind"], f.read()
+
+    def golden_path(self, url):
+        name = extract_listing_id(url) or hashlib.sha1(page_key(url).encode("utf-8")).hexdigest()
+        return os.path.join(self.corpus_dir, GOLDEN_FOLDER, f"{name}.json")
+
+    def load_golden(self, url):
+        path = self.golden_path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_golden(self, url, house_data):
+        path = self.golden_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(house_data, f, ensure_ascii=False, indent=2)
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    corpus = None
+
+    def do_GET(self):
+        html = self.corpus.lookup(self.path)
+        if html is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    """在本機以 HTTP 提供語料庫頁面，取代 rent.houseprice.tw"""
+
+    def __init__(self, corpus, host="127.0.0.1", port=0):
+        handler = type("ReplayHandler", (_ReplayHandler,), {"corpus": corpus})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.thread = None
+
+    @property
+    def origin(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="replay-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="離線重播伺服器")
+    parser.add_argument("corpus_dir", help="語料庫目錄（以 stable_crawl.py --record-corpus 錄製）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    corpus = PageCorpus(args.corpus_dir)
+    server = ReplayServer(corpus, args.host, args.port).start()
+    print(f"重播伺服器已啟動：{server.origin}（共 {len(corpus.manifest['pages'])} 頁）")
+    print(f"執行爬蟲時設定 CRAWLER_BASE_URL={server.origin}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,223 @@
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+from crawler import DATA_FOLDER
+
+DEFAULT_CACHE_DIR = os.path.join(DATA_FOLDER, "http_cache")
+
+# 快取有效時間（秒）：列表頁變動快，詳細頁較穩定
+LIST_TTL = 15 * 60
+DETAIL_TTL = 6 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url_key       TEXT PRIMARY KEY,
+    kind          TEXT NOT NULL,
+    content_hash  TEXT NOT NULL,
+    size          INTEGER NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    stored_at     REAL NOT NULL,
+    accessed_at   REAL NOT NULL
+)
+"""
+
+
+def normalize_url(url):
+    """快取鍵：主機轉小寫、去掉 fragment、查詢參數排序"""
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path or "/", "", query, ""))
+
+
+class CachedPage:
+    """快取中的一頁；fresh 表示仍在有效時間內，可直接使用不需連線"""
+
+    __slots__ = ("html", "etag", "last_modified", "fresh")
+
+    def __init__(self, html, etag, last_modified, fresh):
+        self.html = html
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh = fresh
+
+    def validators(self):
+        """條件式請求標頭，伺服器回 304 時即可沿用快取內容"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """以內容雜湊存放 gzip 壓縮頁面的磁碟快取，SQLite 記錄網址索引、驗證標頭與存取時間
+
+    相同內容的頁面只存一份；總大小超過上限時依最久未使用（LRU）淘汰。
+    瀏覽器工作池會跨執行緒使用，所有操作都以鎖保護。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, list_ttl=LIST_TTL, detail_ttl=DETAIL_TTL,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttls = {"list": list_ttl, "detail": detail_ttl}
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_content ON entries (content_hash)")
+        self.conn.commit()
+        # 目前的總大小只在開啟時加總一次，之後於寫入與刪除時增減
+        self._total_bytes = self.total_bytes()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, "blobs", digest[:2], digest + ".gz")
+
+    def _read_blob(self, digest):
+        try:
+            with gzip.open(self._blob_path(digest), 'rt', encoding='utf-8') as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def _write_blob(self, digest, html):
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            return os.path.getsize(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _in_use(self, digest):
+        return self.conn.execute("SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1", (digest,)).fetchone()
+
+    def _drop_blob_if_unused(self, digest, size):
+        """沒有項目再使用這份內容時刪除檔案並從總大小扣除"""
+        if self._in_use(digest):
+            return
+        self._total_bytes -= size
+        try:
+            os.remove(self._blob_path(digest))
+        except OSError:
+            pass
+
+    def get(self, url, kind, now=None):
+        """取得快取頁面（含是否仍新鮮），沒有快取時回傳 None"""
+        now = now or time.time()
+        url_key = normalize_url(url)
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM entries WHERE url_key = ?", (url_key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            html = self._read_blob(row["content_hash"])
+            if html is None:
+                # 檔案遺失或損毀，當作沒有快取
+                self.conn.execute("DELETE FROM entries WHERE url_key = ?", (url_key,))
+                self._drop_blob_if_unused(row["content_hash"], row["size"])
+                self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE url_key = ?", (now, url_key))
+            self.conn.commit()
+
+        fresh = now - row["stored_at"] < self.ttls.get(kind, 0)
+        if fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return CachedPage(html, row["etag"], row["last_modified"], fresh)
+
+    def is_fresh(self, url, kind, now=None):
+        """只查詢是否有新鮮的快取，不讀取內容也不計入命中統計"""
+        now = now or time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT stored_at FROM entries WHERE url_key = ?", (normalize_url(url),)).fetchone()
+        return row is not None and now - row["stored_at"] < self.ttls.get(kind, 0)
+
+    def get_fresh(self, url, kind, now=None):
+        """只在仍新鮮時回傳 HTML"""
+        cached = self.get(url, kind, now)
+        return cached.html if cached and cached.fresh else None
+
+    def put(self, url, html, kind, etag=None, last_modified=None, now=None):
+        if not html:
+            return
+        now = now or time.time()
+        url_key = normalize_url(url)
+        digest = hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            size = self._write_blob(digest, html)
+            if not self._in_use(digest):
+                self._total_bytes += size
+            previous = self.conn.execute("SELECT content_hash, size FROM entries WHERE url_key = ?",
+                                         (url_key,)).fetchone()
+            self.conn.execute(
+                """
+                INSERT INTO entries (url_key, kind, content_hash, size, etag, last_modified, stored_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url_key) DO UPDATE SET kind = excluded.kind, content_hash = excluded.content_hash,
+                    size = excluded.size, etag = excluded.etag, last_modified = excluded.last_modified,
+                    stored_at = excluded.stored_at, accessed_at = excluded.accessed_at
+                """,
+                (url_key, kind, digest, size, etag, last_modified, now, now),
+            )
+            if previous and previous["content_hash"] != digest:
+                self._drop_blob_if_unused(previous["content_hash"], previous["size"])
+            self.conn.commit()
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def refresh(self, url, now=None):
+        """伺服器回 304 時重新計算有效時間"""
+        now = now or time.time()
+        with self._lock:
+            self.conn.execute("UPDATE entries SET stored_at = ?, accessed_at = ? WHERE url_key = ?",
+                              (now, now, normalize_url(url)))
+            self.conn.commit()
+        self.revalidated += 1
+
+    def total_bytes(self):
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT content_hash, size FROM entries)"
+        ).fetchone()
+        return row[0]
+
+    def _evict(self):
+        """超過容量上限時，從最久未使用的項目開始刪除"""
+        rows = self.conn.execute("SELECT url_key, content_hash, size FROM entries ORDER BY accessed_at").fetchall()
+        evicted = 0
+        for row in rows:
+            if self._total_bytes <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM entries WHERE url_key = ?", (row["url_key"],))
+            self._drop_blob_if_unused(row["content_hash"], row["size"])
+            evicted += 1
+        self.conn.commit()
+        if evicted:
+            print(f"快取超過上限，淘汰 {evicted} 個最久未使用的頁面")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import math
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from crawler import DATA_FOLDER
+from house_parser import extract_listing_id
+from crawl_output import iter_jsonl, rewrite_jsonl, DEFAULT_JSONL_FILE
+from gazetteer import normalize_name
+
+DEFAULT_SPATIAL_INDEX_FILE = os.path.join(DATA_FOLDER, "spatial_index.json")
+# geohash 6 碼約 1.2 km × 0.6 km，半徑 1~10 km 的查詢只需查看數十到數百格
+DEFAULT_PRECISION = 6
+INDEX_VERSION = 1
+
+EARTH_RADIUS_KM = 6371.0
+# 台灣本島與離島（澎湖、金門、馬祖、蘭嶼）的經緯度範圍
+TAIWAN_BOUNDS = {"min_lat": 21.8, "max_lat": 26.4, "min_lng": 118.0, "max_lng": 122.1}
+# 座標與所屬行政區中心距離超過此值時，視為地區或座標其中一個有誤（只統計，不修改）
+DISTRICT_MISMATCH_KM = 20
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# 行政區中心座標 (緯度, 經度)，用於補齊沒有座標的物件；涵蓋 gazetteer.py 的所有鄉鎮市區，山地鄉以鄉公所所在地為準
+DISTRICT_CENTROIDS = {
+    "台北市": {
+        "中正區": (25.0324, 121.5199), "大同區": (25.0634, 121.5131), "中山區": (25.0685, 121.5336),
+        "松山區": (25.0598, 121.5576), "大安區": (25.0264, 121.5435), "萬華區": (25.0287, 121.4977),
+        "信義區": (25.0308, 121.5712), "士林區": (25.0928, 121.5250), "北投區": (25.1321, 121.4987),
+        "內湖區": (25.0830, 121.5888), "南港區": (25.0548, 121.6066), "文山區": (24.9897, 121.5700),
+    },
+    "新北市": {
+        "板橋區": (25.0143, 121.4672), "三重區": (25.0615, 121.4880), "中和區": (24.9994, 121.4990),
+        "永和區": (25.0095, 121.5145), "新莊區": (25.0358, 121.4500), "新店區": (24.9676, 121.5418),
+        "樹林區": (24.9907, 121.4206), "鶯歌區": (24.9554, 121.3547), "三峽區": (24.9341, 121.3689),
+        "淡水區": (25.1694, 121.4406), "汐止區": (25.0628, 121.6583), "瑞芳區": (25.1088, 121.8102),
+        "土城區": (24.9722, 121.4433), "蘆洲區": (25.0849, 121.4737), "五股區": (25.0829, 121.4380),
+        "泰山區": (25.0589, 121.4308), "林口區": (25.0775, 121.3918), "深坑區": (25.0023, 121.6159),
+        "石碇區": (24.9915, 121.6585), "坪林區": (24.9374, 121.7113), "烏來區": (24.8649, 121.5505),
+        "金山區": (25.2219, 121.6366), "萬里區": (25.1793, 121.6889), "石門區": (25.2904, 121.5685),
+        "三芝區": (25.2580, 121.5009), "貢寮區": (25.0222, 121.9085), "平溪區": (25.0258, 121.7384),
+        "雙溪區": (25.0334, 121.8660), "八里區": (25.1467, 121.3989),
+    },
+    "桃園市": {
+        "桃園區": (24.9937, 121.3010), "中壢區": (24.9653, 121.2249), "大溪區": (24.8806, 121.2866),
+        "楊梅區": (24.9077, 121.1454), "蘆竹區": (25.0454, 121.2918), "大園區": (25.0644, 121.1960),
+        "龜山區": (24.9925, 121.3380), "八德區": (24.9286, 121.2845), "龍潭區": (24.8640, 121.2164),
+        "平鎮區": (24.9459, 121.2180), "新屋區": (24.9723, 121.1058), "觀音區": (25.0336, 121.0828),
+        "復興區": (24.8185, 121.3520),
+    },
+    "台中市": {
+        "中區": (24.1417, 120.6797), "東區": (24.1365, 120.6975), "南區": (24.1215, 120.6630),
+        "西區": (24.1414, 120.6615), "北區": (24.1597, 120.6822), "北屯區": (24.1823, 120.6861),
+        "西屯區": (24.1814, 120.6265), "南屯區": (24.1380, 120.6434), "太平區": (24.1266, 120.7184),
+        "大里區": (24.0993, 120.6778), "霧峰區": (24.0613, 120.7003), "烏日區": (24.1047, 120.6238),
+        "豐原區": (24.2520, 120.7183), "后里區": (24.3048, 120.7109), "石岡區": (24.2749, 120.7803),
+        "東勢區": (24.2586, 120.8279), "和平區": (24.2480, 120.8820), "新社區": (24.2341, 120.8095),
+        "潭子區": (24.2096, 120.7051), "大雅區": (24.2291, 120.6478), "神岡區": (24.2577, 120.6615),
+        "大肚區": (24.1537, 120.5411), "沙鹿區": (24.2334, 120.5660), "龍井區": (24.1926, 120.5459),
+        "梧棲區": (24.2549, 120.5316), "清水區": (24.2682, 120.5594), "大甲區": (24.3488, 120.6222),
+        "外埔區": (24.3320, 120.6543), "大安區": (24.3460, 120.5862),
+    },
+    "台南市": {
+        "中西區": (22.9920, 120.1975), "東區": (22.9845, 120.2245), "南區": (22.9610, 120.1883),
+        "北區": (23.0070, 120.2095), "安平區": (22.9927, 120.1659), "安南區": (23.0474, 120.1852),
+        "永康區": (23.0264, 120.2570), "歸仁區": (22.9671, 120.2937), "新化區": (23.0385, 120.3106),
+        "左鎮區": (23.0578, 120.4073), "玉井區": (23.1237, 120.4600), "楠西區": (23.1734, 120.4853),
+        "南化區": (23.0425, 120.4770), "仁德區": (22.9722, 120.2518), "關廟區": (22.9627, 120.3279),
+        "龍崎區": (22.9656, 120.3609), "官田區": (23.1946, 120.3145), "麻豆區": (23.1817, 120.2479),
+        "佳里區": (23.1650, 120.1772), "西港區": (23.1231, 120.2036), "七股區": (23.1404, 120.1400),
+        "將軍區": (23.1994, 120.1563), "學甲區": (23.2324, 120.1803), "北門區": (23.2675, 120.1259),
+        "新營區": (23.3103, 120.3166), "後壁區": (23.3664, 120.3608), "白河區": (23.3513, 120.4155),
+        "東山區": (23.3263, 120.4035), "六甲區": (23.2319, 120.3477), "下營區": (23.2354, 120.2643),
+        "柳營區": (23.2781, 120.3113), "鹽水區": (23.3198, 120.2663), "善化區": (23.1322, 120.2967),
+        "大內區": (23.1195, 120.3486), "山上區": (23.1030, 120.3528), "新市區": (23.0786, 120.2950),
+        "安定區": (23.1213, 120.2371),
+    },
+    "高雄市": {
+        "新興區": (22.6311, 120.3096), "前金區": (22.6277, 120.2943), "苓雅區": (22.6219, 120.3122),
+        "鹽埕區": (22.6235, 120.2853), "鼓山區": (22.6416, 120.2808), "旗津區": (22.6135, 120.2665),
+        "前鎮區": (22.5955, 120.3184), "三民區": (22.6496, 120.3171), "楠梓區": (22.7282, 120.3262),
+        "小港區": (22.5653, 120.3378), "左營區": (22.6900, 120.2950), "仁武區": (22.7011, 120.3476),
+        "大社區": (22.7301, 120.3476), "岡山區": (22.7968, 120.2950), "路竹區": (22.8565, 120.2615),
+        "阿蓮區": (22.8836, 120.3271), "田寮區": (22.8690, 120.3595), "燕巢區": (22.7934, 120.3618),
+        "橋頭區": (22.7575, 120.3057), "梓官區": (22.7603, 120.2656), "彌陀區": (22.7827, 120.2472),
+        "永安區": (22.8186, 120.2256), "湖內區": (22.9082, 120.2117), "鳳山區": (22.6270, 120.3593),
+        "大寮區": (22.6053, 120.3953), "林園區": (22.5100, 120.3952), "鳥松區": (22.6596, 120.3644),
+        "大樹區": (22.6934, 120.4331), "旗山區": (22.8885, 120.4834), "美濃區": (22.8985, 120.5417),
+        "六龜區": (22.9979, 120.6330), "內門區": (22.9434, 120.4619), "杉林區": (22.9707, 120.5389),
+        "甲仙區": (23.0833, 120.5878), "桃源區": (23.1592, 120.7640), "那瑪夏區": (23.2170, 120.6950),
+        "茂林區": (22.8865, 120.6634), "茄萣區": (22.9066, 120.1826),
+    },
+    "基隆市": {
+        "仁愛區": (25.1275, 121.7405), "信義區": (25.1295, 121.7515), "中正區": (25.1423, 121.7745),
+        "中山區": (25.1500, 121.7310), "安樂區": (25.1209, 121.7227), "暖暖區": (25.0997, 121.7402),
+        "七堵區": (25.0955, 121.7134),
+    },
+    "新竹市": {
+        "東區": (24.8015, 120.9715), "北區": (24.8160, 120.9623), "香山區": (24.7768, 120.9139),
+    },
+    "嘉義市": {
+        "東區": (23.4845, 120.4580), "西區": (23.4770, 120.4359),
+    },
+    "新竹縣": {
+        "竹北市": (24.8390, 121.0044), "竹東鎮": (24.7363, 121.0917), "新埔鎮": (24.8254, 121.0728),
+        "關西鎮": (24.7887, 121.1766), "湖口鄉": (24.9034, 121.0437), "新豐鄉": (24.8990, 120.9837),
+        "芎林鄉": (24.7747, 121.0927), "橫山鄉": (24.7208, 121.1162), "北埔鄉": (24.7003, 121.0570),
+        "寶山鄉": (24.7609, 120.9851), "峨眉鄉": (24.6873, 121.0162), "尖石鄉": (24.7030, 121.2010),
+        "五峰鄉": (24.6350, 121.1176),
+    },
+    "苗栗縣": {
+        "苗栗市": (24.5602, 120.8214), "頭份市": (24.6879, 120.9135), "竹南鎮": (24.6856, 120.8728),
+        "後龍鎮": (24.6128, 120.7861), "通霄鎮": (24.4889, 120.6772), "苑裡鎮": (24.4411, 120.6530),
+        "卓蘭鎮": (24.3097, 120.8233), "造橋鄉": (24.6372, 120.8622), "西湖鄉": (24.5571, 120.7431),
+        "頭屋鄉": (24.5740, 120.8466), "公館鄉": (24.4991, 120.8226), "銅鑼鄉": (24.4886, 120.7863),
+        "三義鄉": (24.4134, 120.7654), "大湖鄉": (24.4226, 120.8641), "獅潭鄉": (24.5401, 120.9233),
+        "三灣鄉": (24.6511, 120.9512), "南庄鄉": (24.5962, 121.0010), "泰安鄉": (24.4621, 120.9046),
+    },
+    "彰化縣": {
+        "彰化市": (24.0809, 120.5386), "員林市": (23.9588, 120.5740), "和美鎮": (24.1109, 120.4979),
+        "鹿港鎮": (24.0566, 120.4345), "溪湖鎮": (23.9621, 120.4792), "二林鎮": (23.8998, 120.3740),
+        "田中鎮": (23.8576, 120.5808), "北斗鎮": (23.8706, 120.5209), "花壇鄉": (24.0294, 120.5380),
+        "芬園鄉": (24.0137, 120.6290), "大村鄉": (23.9937, 120.5407), "永靖鄉": (23.9245, 120.5478),
+        "伸港鄉": (24.1558, 120.4859), "線西鄉": (24.1286, 120.4658), "福興鄉": (24.0477, 120.4437),
+        "秀水鄉": (24.0352, 120.5028), "埔心鄉": (23.9521, 120.5434), "埔鹽鄉": (23.9990, 120.4641),
+        "大城鄉": (23.8525, 120.3203), "芳苑鄉": (23.9243, 120.3200), "竹塘鄉": (23.8600, 120.4272),
+        "社頭鄉": (23.8967, 120.5826), "二水鄉": (23.8067, 120.6183), "田尾鄉": (23.8905, 120.5250),
+        "埤頭鄉": (23.8909, 120.4624), "溪州鄉": (23.8513, 120.4925),
+    },
+    "南投縣": {
+        "南投市": (23.9157, 120.6639), "埔里鎮": (23.9648, 120.9697), "草屯鎮": (23.9738, 120.6800),
+        "竹山鎮": (23.7577, 120.6721), "集集鎮": (23.8290, 120.7875), "名間鄉": (23.8383, 120.6803),
+        "鹿谷鄉": (23.7447, 120.7527), "中寮鄉": (23.8789, 120.7667), "魚池鄉": (23.8963, 120.9361),
+        "國姓鄉": (24.0422, 120.8585), "水里鄉": (23.8120, 120.8540), "信義鄉": (23.6997, 120.8553),
+        "仁愛鄉": (24.0236, 121.1300),
+    },
+    "雲林縣": {
+        "斗六市": (23.7117, 120.5444), "斗南鎮": (23.6797, 120.4792), "虎尾鎮": (23.7082, 120.4318),
+        "西螺鎮": (23.7986, 120.4657), "土庫鎮": (23.6778, 120.3923), "北港鎮": (23.5712, 120.3025),
+        "古坑鄉": (23.6444, 120.5623), "大埤鄉": (23.6457, 120.4304), "莿桐鄉": (23.7607, 120.5026),
+        "林內鄉": (23.7587, 120.6142), "二崙鄉": (23.7714, 120.4153), "崙背鄉": (23.7585, 120.3552),
+        "麥寮鄉": (23.7538, 120.2519), "東勢鄉": (23.7000, 120.2526), "褒忠鄉": (23.6945, 120.3104),
+        "台西鄉": (23.7027, 120.1963), "元長鄉": (23.6496, 120.3150), "四湖鄉": (23.6375, 120.2256),
+        "口湖鄉": (23.5857, 120.1850), "水林鄉": (23.5725, 120.2453),
+    },
+    "嘉義縣": {
+        "太保市": (23.4595, 120.3327), "朴子市": (23.4649, 120.2470), "布袋鎮": (23.3779, 120.1669),
+        "大林鎮": (23.6016, 120.4717), "民雄鄉": (23.5514, 120.4287), "溪口鄉": (23.6024, 120.3937),
+        "新港鄉": (23.5518, 120.3476), "六腳鄉": (23.4946, 120.2911), "東石鄉": (23.4593, 120.1540),
+        "義竹鄉": (23.3363, 120.2431), "鹿草鄉": (23.4107, 120.3080), "水上鄉": (23.4282, 120.3989),
+        "中埔鄉": (23.4252, 120.5229), "竹崎鄉": (23.5232, 120.5512), "梅山鄉": (23.5846, 120.5560),
+        "番路鄉": (23.4656, 120.5551), "大埔鄉": (23.2964, 120.5931), "阿里山鄉": (23.4680, 120.7320),
+    },
+    "屏東縣": {
+        "屏東市": (22.6690, 120.4862), "潮州鎮": (22.5505, 120.5426), "東港鎮": (22.4664, 120.4495),
+        "恆春鎮": (22.0023, 120.7437), "萬丹鄉": (22.5893, 120.4848), "長治鄉": (22.6772, 120.5278),
+        "麟洛鄉": (22.6506, 120.5274), "九如鄉": (22.7397, 120.4903), "里港鄉": (22.7791, 120.4941),
+        "鹽埔鄉": (22.7542, 120.5728), "高樹鄉": (22.8268, 120.6001), "萬巒鄉": (22.5716, 120.5663),
+        "內埔鄉": (22.6119, 120.5668), "竹田鄉": (22.5849, 120.5441), "新埤鄉": (22.4698, 120.5497),
+        "枋寮鄉": (22.3657, 120.5937), "新園鄉": (22.5440, 120.4616), "崁頂鄉": (22.5147, 120.5140),
+        "林邊鄉": (22.4311, 120.5151), "南州鄉": (22.4902, 120.5103), "佳冬鄉": (22.4172, 120.5459),
+        "琉球鄉": (22.3420, 120.3696), "車城鄉": (22.0720, 120.7108), "滿州鄉": (22.0209, 120.8387),
+        "枋山鄉": (22.2605, 120.6560), "三地門鄉": (22.7138, 120.6543), "霧台鄉": (22.7450, 120.7320),
+        "瑪家鄉": (22.6766, 120.6360), "泰武鄉": (22.5917, 120.6263), "來義鄉": (22.5258, 120.6331),
+        "春日鄉": (22.3706, 120.6287), "獅子鄉": (22.2017, 120.7052), "牡丹鄉": (22.1295, 120.7718),
+    },
+    "宜蘭縣": {
+        "宜蘭市": (24.7517, 121.7580), "羅東鎮": (24.6770, 121.7670), "蘇澳鎮": (24.5960, 121.8513),
+        "頭城鎮": (24.8590, 121.8230), "礁溪鄉": (24.8270, 121.7700), "壯圍鄉": (24.7447, 121.7817),
+        "員山鄉": (24.7460, 121.7214), "冬山鄉": (24.6365, 121.7920), "五結鄉": (24.6847, 121.7985),
+        "三星鄉": (24.6669, 121.6532), "大同鄉": (24.6742, 121.6058), "南澳鄉": (24.4650, 121.8010),
+    },
+    "花蓮縣": {
+        "花蓮市": (23.9913, 121.6114), "鳳林鎮": (23.7446, 121.4520), "玉里鎮": (23.3364, 121.3116),
+        "新城鄉": (24.1282, 121.6406), "吉安鄉": (23.9617, 121.5680), "壽豐鄉": (23.8696, 121.5087),
+        "光復鄉": (23.6692, 121.4234), "豐濱鄉": (23.5973, 121.5197), "瑞穗鄉": (23.4968, 121.3757),
+        "富里鄉": (23.1795, 121.2478), "秀林鄉": (24.1164, 121.6209), "萬榮鄉": (23.7153, 121.4075),
+        "卓溪鄉": (23.3462, 121.3026),
+    },
+    "台東縣": {
+        "台東市": (22.7583, 121.1444), "成功鎮": (23.0999, 121.3773), "關山鎮": (23.0474, 121.1631),
+        "卑南鄉": (22.7864, 121.0833), "鹿野鄉": (22.9123, 121.1365), "池上鄉": (23.1253, 121.2192),
+        "東河鄉": (22.9693, 121.3007), "長濱鄉": (23.3152, 121.4516), "太麻里鄉": (22.6153, 121.0073),
+        "大武鄉": (22.3397, 120.8899), "綠島鄉": (22.6614, 121.4908), "海端鄉": (23.1016, 121.1720),
+        "延平鄉": (22.9023, 121.0841), "金峰鄉": (22.5953, 120.9703), "達仁鄉": (22.2946, 120.8784),
+        "蘭嶼鄉": (22.0447, 121.5480),
+    },
+    "澎湖縣": {
+        "馬公市": (23.5658, 119.5862), "湖西鄉": (23.5836, 119.6590), "白沙鄉": (23.6660, 119.5981),
+        "西嶼鄉": (23.6007, 119.5067), "望安鄉": (23.3575, 119.5050), "七美鄉": (23.2063, 119.4286),
+    },
+    "金門縣": {
+        "金城鎮": (24.4341, 118.3170), "金湖鎮": (24.4386, 118.4194), "金沙鎮": (24.4909, 118.4107),
+        "金寧鄉": (24.4563, 118.3357), "烈嶼鄉": (24.4332, 118.2444), "烏坵鄉": (24.9913, 119.4510),
+    },
+    "連江縣": {
+        "南竿鄉": (26.1598, 119.9432), "北竿鄉": (26.2240, 119.9976), "莒光鄉": (25.9764, 119.9400),
+        "東引鄉": (26.3667, 120.4897),
+    },
+}
+
+CITY_CENTROIDS = {
+    "台北市": (25.0375, 121.5637), "新北市": (25.0120, 121.4657), "桃園市": (24.9936, 121.3010),
+    "台中市": (24.1477, 120.6736), "台南市": (22.9999, 120.2270), "高雄市": (22.6273, 120.3014),
+    "基隆市": (25.1276, 121.7392), "新竹市": (24.8138, 120.9675), "嘉義市": (23.4801, 120.4491),
+    "新竹縣": (24.8387, 121.0177), "苗栗縣": (24.5602, 120.8214), "彰化縣": (24.0518, 120.5161),
+    "南投縣": (23.9157, 120.6639), "雲林縣": (23.7092, 120.4313), "嘉義縣": (23.4518, 120.2555),
+    "屏東縣": (22.5519, 120.5488), "宜蘭縣": (24.7021, 121.7378), "花蓮縣": (23.9872, 121.6015),
+    "台東縣": (22.7583, 121.1444), "澎湖縣": (23.5711, 119.5793), "金門縣": (24.4493, 118.3767),
+    "連江縣": (26.1605, 119.9517),
+}
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """兩點間的大圓距離（公里）"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def geohash_encode(lat, lng, precision=DEFAULT_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision=DEFAULT_PRECISION):
+    """geohash 格子的 (緯度跨度, 經度跨度)，單位為度"""
+    lng_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def radius_bounds(lat, lng, radius_km):
+    """圓形範圍的外接矩形 (min_lat, min_lng, max_lat, max_lng)，算法與後端 findNearbyListings 相同"""
+    lat_range = radius_km / 111
+    lng_range = radius_km / (111 * math.cos(math.radians(lat)))
+    return lat - lat_range, lng - lng_range, lat + lat_range, lng + lng_range
+
+
+def cells_in_radius(lat, lng, radius_km, precision=DEFAULT_PRECISION):
+    """與圓形外接矩形相交的所有 geohash 格子"""
+    min_lat, min_lng, max_lat, max_lng = radius_bounds(lat, lng, radius_km)
+    cell_lat, cell_lng = geohash_cell_size(precision)
+    # 對齊到格線，每格取中心點編碼
+    start_lat = math.floor(min_lat / cell_lat) * cell_lat + cell_lat / 2
+    start_lng = math.floor(min_lng / cell_lng) * cell_lng + cell_lng / 2
+    cells = set()
+    cur_lat = start_lat
+    while cur_lat - cell_lat / 2 <= max_lat:
+        cur_lng = start_lng
+        while cur_lng - cell_lng / 2 <= max_lng:
+            cells.add(geohash_encode(cur_lat, cur_lng, precision))
+            cur_lng += cell_lng
+        cur_lat += cell_lat
+    return cells
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) and value != 0 else None
+
+
+def in_taiwan(lat, lng):
+    return (TAIWAN_BOUNDS["min_lat"] <= lat <= TAIWAN_BOUNDS["max_lat"]
+            and TAIWAN_BOUNDS["min_lng"] <= lng <= TAIWAN_BOUNDS["max_lng"])
+
+
+def centroid_for(city, district):
+    """回傳 (緯度, 經度, 來源)；找不到時回傳 None"""
+    city = normalize_name(city) if city else None
+    district = normalize_name(district) if district else None
+    if district:
+        if city and district in DISTRICT_CENTROIDS.get(city, {}):
+            return DISTRICT_CENTROIDS[city][district] + ("district_centroid",)
+        if not city:
+            owners = [name for name, districts in DISTRICT_CENTROIDS.items() if district in districts]
+            if len(owners) == 1:
+                return DISTRICT_CENTROIDS[owners[0]][district] + ("district_centroid",)
+    if city in CITY_CENTROIDS:
+        return CITY_CENTROIDS[city] + ("city_centroid",)
+    return None
+
+
+def validate_coordinates(record, stats=None):
+    """檢查並修正單筆物件座標，回傳 (緯度, 經度)，無法定位時回傳 (None, None)
+
+    原座標在台灣範圍內則保留；經緯度顛倒時對調；缺少或超出範圍時以行政區（或縣市）中心補上。
+    修正方式記錄在 coordinate_source：original / swapped / district_centroid / city_centroid。
+    """
+    stats = stats if stats is not None else {}
+    lat = _to_float(record.get("latitude"))
+    lng = _to_float(record.get("longitude"))
+    source = None
+
+    if lat is not None and lng is not None:
+        if in_taiwan(lat, lng):
+            source = "original"
+        elif in_taiwan(lng, lat):
+            lat, lng = lng, lat
+            source = "swapped"
+        else:
+            stats["out_of_bounds"] = stats.get("out_of_bounds", 0) + 1
+
+    if source is None:
+        centroid = centroid_for(record.get("city"), record.get("district"))
+        if centroid is None:
+            stats["unlocated"] = stats.get("unlocated", 0) + 1
+            record["latitude"] = None
+            record["longitude"] = None
+            record["coordinate_source"] = None
+            return None, None
+        lat, lng, source = centroid
+    elif record.get("district"):
+        centroid = centroid_for(record.get("city"), record.get("district"))
+        if centroid and centroid[2] == "district_centroid" and haversine_km(lat, lng, centroid[0], centroid[1]) > DISTRICT_MISMATCH_KM:
+            stats["district_mismatch"] = stats.get("district_mismatch", 0) + 1
+
+    stats[source] = stats.get(source, 0) + 1
+    record["latitude"] = lat
+    record["longitude"] = lng
+    record["coordinate_source"] = source
+    return lat, lng
+
+
+class SpatialIndex:
+    """geohash 格子 → 物件編號，另記錄每格內物件的實際外接矩形
+
+    半徑查詢只查看與圓形外接矩形相交的格子，且跳過外接矩形離圓心超過半徑的格子，
+    回傳的是候選編號，精確距離仍由呼叫端計算。
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.cells = {}
+
+    def add(self, listing_id, lat, lng):
+        cell_id = geohash_encode(lat, lng, self.precision)
+        cell = self.cells.get(cell_id)
+        if cell is None:
+            self.cells[cell_id] = {"bbox": [lat, lng, lat, lng], "ids": [listing_id]}
+        else:
+            bbox = cell["bbox"]
+            bbox[0], bbox[1] = min(bbox[0], lat), min(bbox[1], lng)
+            bbox[2], bbox[3] = max(bbox[2], lat), max(bbox[3], lng)
+            cell["ids"].append(listing_id)
+        return cell_id
+
+    def __len__(self):
+        return sum(len(cell["ids"]) for cell in self.cells.values())
+
+    def query_radius(self, lat, lng, radius_km):
+        candidates = []
+        for cell_id in cells_in_radius(lat, lng, radius_km, self.precision):
+            cell = self.cells.get(cell_id)
+            if cell is None:
+                continue
+            min_lat, min_lng, max_lat, max_lng = cell["bbox"]
+            # 外接矩形上離圓心最近的點
+            nearest_lat = min(max(lat, min_lat), max_lat)
+            nearest_lng = min(max(lng, min_lng), max_lng)
+            if haversine_km(lat, lng, nearest_lat, nearest_lng) <= radius_km:
+                candidates.extend(cell["ids"])
+        return candidates
+
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "precision": self.precision,
+            "generated_at": time.time(),
+            "listing_count": len(self),
+            "bbox_order": ["min_lat", "min_lng", "max_lat", "max_lng"],
+            "cells": {
+                cell_id: {"bbox": [round(value, 6) for value in cell["bbox"]], "ids": cell["ids"]}
+                for cell_id, cell in sorted(self.cells.items())
+            },
+        }
+
+    def save(self, path=DEFAULT_SPATIAL_INDEX_FILE):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_SPATIAL_INDEX_FILE):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(data["precision"])
+        index.cells = data["cells"]
+        return index
+
+
+def build_spatial_index(jsonl_path=DEFAULT_JSONL_FILE, index_path=DEFAULT_SPATIAL_INDEX_FILE,
+                        precision=DEFAULT_PRECISION):
+    """爬取完成後的處理：修正 JSONL 中的座標並加上 geohash，再輸出空間索引；回傳 (索引, 統計)
+
+    JSONL 以暫存檔改寫後原子替換，後續匯入（importService / bulk_loader）拿到的是修正後的座標。
+    """
+    index = SpatialIndex(precision)
+    stats = {"records": 0}
+
+    def located_records():
+        for record in iter_jsonl(jsonl_path):
+            stats["records"] += 1
+            lat, lng = validate_coordinates(record, stats)
+            listing_id = record.get("id") or extract_listing_id(record.get("url"))
+            if lat is not None and listing_id:
+                record["geohash"] = index.add(str(listing_id), lat, lng)
+            else:
+                record["geohash"] = None
+            yield record
+
+    rewrite_jsonl(jsonl_path, located_records())
+
+    if index_path:
+        index.save(index_path)
+    return index, stats
+
+
+def print_stats(index, stats):
+    print(f"空間索引：{stats['records']} 筆物件，{len(index)} 筆已定位，共 {len(index.cells)} 格（geohash {index.precision} 碼）")
+    labels = {
+        "original": "原座標有效", "swapped": "經緯度對調", "district_centroid": "以行政區中心補上",
+        "city_centroid": "以縣市中心補上", "out_of_bounds": "座標超出台灣範圍", "unlocated": "無法定位",
+        "district_mismatch": "座標與行政區不符（未修改）",
+    }
+    for key, label in labels.items():
+        if stats.get(key):
+            print(f"   {label}: {stats[key]} 筆")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="修正爬蟲輸出的座標並建立 geohash 空間索引")
+    parser.add_argument("file", nargs="?", default=DEFAULT_JSONL_FILE, help="爬蟲輸出的 JSONL（會就地改寫）")
+    parser.add_argument("--output", default=DEFAULT_SPATIAL_INDEX_FILE, help="空間索引輸出檔")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION, help="geohash 碼數")
+    parser.add_argument("--query", default=None, metavar="LAT,LNG,KM",
+                        help="建立後以此半徑查詢，列出候選格子數與物件數")
+    args = parser.parse_args()
+
+    index, stats = build_spatial_index(args.file, args.output, args.precision)
+    print_stats(index, stats)
+    print(f"空間索引已寫入: {args.output}")
+
+    if args.query:
+        lat, lng, radius_km = (float(value) for value in args.query.split(","))
+        cells = cells_in_radius(lat, lng, radius_km, index.precision)
+        candidates = index.query_radius(lat, lng, radius_km)
+        touched = sum(1 for cell_id in cells if cell_id in index.cells)
+        print(f"半徑 {radius_km} km 查詢：檢查 {touched}/{len(index.cells)} 個有物件的格子，候選 {len(candidates)} 筆")
@@ -1,234 +1,478 @@
 #!/usr/bin/env python3
 import sys
 import os
-import json
 import time
-import random
+import argparse
 import traceback
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from crawler import setup_browser, safe_get_page, crawl_house_details
+from crawler import (DATA_FOLDER, crawl_house_details, fetch_page_html, record_page, set_page_recorder,
+                     set_response_cache, LIST_READY_SELECTORS)
+from browser_pool import BrowserPool
+from browser_session import BrowserSession, DEFAULT_MAX_PAGES, DEFAULT_MAX_RSS_MB
+from house_parser import parse_list_html
+from gazetteer import tally_location
+from http_fetcher import crawl_houses_http_first
+from crawl_state import CrawlStateStore, RecrawlScheduler, DEFAULT_STATE_DB
+from response_cache import ResponseCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from metrics import METRICS
+from rate_controller import RATE_CONTROLLER, DEFAULT_MAX_RATE
+from region_scheduler import load_regions, page_url, RegionScheduler, ListPagePrefetcher, DEFAULT_REGIONS_FILE
+from image_pipeline import process_jsonl_images, print_stats as print_image_stats, DEFAULT_IMAGE_DIR, DEFAULT_WORKERS as DEFAULT_IMAGE_WORKERS
+from dedupe import dedupe_jsonl, print_stats as print_dedupe_stats
+from listing_record import export_parquet, DEFAULT_PARQUET_FILE
+from spatial_index import build_spatial_index, print_stats as print_spatial_stats, DEFAULT_SPATIAL_INDEX_FILE
+from crawl_output import (JsonlRecordWriter, CrawlCheckpoint, iter_jsonl, truncate_partial_line, export_json_array,
+                          DEFAULT_JSONL_FILE, DEFAULT_CHECKPOINT_FILE, DEFAULT_JSON_FILE)
 
-def stable_dual_city_crawl():
-    """穩定的台北市+新北市爬蟲"""
-    browser = setup_browser()
-    all_data = []
+# 每寫入幾筆資料就 fsync 一次進度檔
+CHECKPOINT_EVERY = 10
+
+# 每次執行的耗時與事件統計（Prometheus 文字格式可交給 node_exporter textfile collector）
+DEFAULT_METRICS_PROM_FILE = os.path.join(DATA_FOLDER, "crawl_metrics.prom")
+DEFAULT_METRICS_JSON_FILE = os.path.join(DATA_FOLDER, "crawl_metrics.json")
+
+def stable_dual_city_crawl(workers=1, engine="browser", state_db=DEFAULT_STATE_DB, fetch_budget=None,
+                           full_refresh=False, resume=False, jsonl_file=DEFAULT_JSONL_FILE,
+                           checkpoint_file=DEFAULT_CHECKPOINT_FILE, json_file=DEFAULT_JSON_FILE,
+                           cache_dir=DEFAULT_CACHE_DIR, cache_max_bytes=DEFAULT_MAX_BYTES,
+                           metrics_prom_file=DEFAULT_METRICS_PROM_FILE, metrics_json_file=DEFAULT_METRICS_JSON_FILE,
+                           regions_file=DEFAULT_REGIONS_FILE, browser_max_pages=DEFAULT_MAX_PAGES,
+                           browser_max_rss_mb=DEFAULT_MAX_RSS_MB, spatial_index_file=DEFAULT_SPATIAL_INDEX_FILE,
+                           dedupe=True, image_dir=DEFAULT_IMAGE_DIR, image_workers=DEFAULT_IMAGE_WORKERS,
+                           parquet_file=DEFAULT_PARQUET_FILE, max_rate=DEFAULT_MAX_RATE):
+    """依地區設定檔（預設新北市、台北市）交錯爬取各地區，回傳收集筆數"""
+    METRICS.reset()
+    # 所有抓取路徑共用的每主機速率上限；請求間隔依網站回應自動調整，不再固定休息
+    RATE_CONTROLLER.configure(max_rate=max_rate)
+    region_configs = load_regions(regions_file)
+    cache = None
+    if cache_dir:
+        if full_refresh:
+            # 全部重抓時不直接使用快取，HTTP 抓取仍可用 ETag / Last-Modified 重新驗證
+            cache = ResponseCache(cache_dir, list_ttl=0, detail_ttl=0, max_bytes=cache_max_bytes)
+        else:
+            cache = ResponseCache(cache_dir, max_bytes=cache_max_bytes)
+        set_response_cache(cache)
+    
+    # 主瀏覽器：處理列表頁、序列模式的詳細頁與 HTTP 模式的備援，定期換新並在失效時自動重啟
+    # 有瀏覽器池時不保留備用瀏覽器，Chrome 數量維持 workers + 1，不會多出一個閒置的備用
+    session = BrowserSession(max_pages=browser_max_pages, max_rss_mb=browser_max_rss_mb, warm_spare=workers <= 1)
+    pool = BrowserPool(workers, max_pages=browser_max_pages, max_rss_mb=browser_max_rss_mb).start() if workers > 1 else None
+    scheduler = None
+    if state_db:
+        store = CrawlStateStore(state_db)
+        if full_refresh:
+            scheduler = RecrawlScheduler(store, fetch_budget, stale_after=0, changed_stale_after=0, retry_after=0)
+        else:
+            scheduler = RecrawlScheduler(store, fetch_budget)
+    
+    final_stats = {"detected": {}, "districts": {}}
+    done_urls = set()
+    checkpoint = CrawlCheckpoint.load(checkpoint_file) if resume else None
+    if checkpoint:
+        # 續跑：以 JSONL 還原已完成的網址與統計，檢查點之後寫入的資料歸入當時處理中的地區
+        truncate_partial_line(jsonl_file)
+        written = 0
+        for record in iter_jsonl(jsonl_file):
+            done_urls.add(record.get("url"))
+            tally_location(final_stats, record)
+            written += 1
+        print(f"從檢查點續跑：各地區下一頁 {checkpoint.region_pages or '（從第一頁開始）'}，已完成 {written} 筆")
+        checkpoint.pending_records = written - checkpoint.total_records
+        checkpoint.total_records = written
+        writer = JsonlRecordWriter(jsonl_file, append=True)
+    else:
+        if resume:
+            print("找不到檢查點，從頭開始爬取")
+        checkpoint = CrawlCheckpoint(checkpoint_file)
+        writer = JsonlRecordWriter(jsonl_file)
+    
+    def save_checkpoint():
+        writer.sync()
+        checkpoint.save()
+    
+    region_scheduler = RegionScheduler(region_configs, checkpoint)
+    if checkpoint.current_region:
+        checkpoint.region_counts[checkpoint.current_region] = (
+            checkpoint.region_counts.get(checkpoint.current_region, 0) + checkpoint.pending_records
+        )
+        for region in region_scheduler.all_regions():
+            if region.name == checkpoint.current_region:
+                region.count = checkpoint.region_counts[region.name]
+    checkpoint.pending_records = 0
+    prefetcher = ListPagePrefetcher()
+    
+    def load_list_page(list_url):
+        """列表頁依序取自：背景預抓結果 → 新鮮快取 → 瀏覽器；回傳 (卡片摘要, 分頁列最大頁碼)，抓不到時回傳 None"""
+        prefetched = prefetcher.take(list_url)
+        if prefetched is None:
+            html = session.call(fetch_page_html, list_url, "list", ready_selectors=LIST_READY_SELECTORS)
+            # 以網站原始網址解析相對連結（重播模式下 current_url 是本機位址）
+            return parse_list_html(html, list_url) if html is not None else None
+        html, summaries, last_page_link = prefetched
+        if cache:
+            cache.put(list_url, html, "list")
+        record_page(list_url, html, "list")
+        return summaries, last_page_link
+    
+    def crawl_houses(region, house_urls, reusable_urls):
+        """抓取詳細頁並寫入，配額未滿時以仍新鮮的上次結果補足，回傳寫入筆數"""
+        processed = 0
+
+        def record_house(house_url, house_data, reused=False):
+            nonlocal processed
+            if scheduler and not reused:
+                scheduler.record(house_url, house_data, region.name)
+            if not house_data:
+                print("房屋資料抓取失敗")
+                return
+
+            writer.write(house_data)
+            done_urls.add(house_url)
+            tally_location(region.stats, house_data)
+            tally_location(final_stats, house_data)
+            region.count += 1
+            processed += 1
+            checkpoint.region_counts[region.name] = region.count
+            checkpoint.total_records += 1
+            if checkpoint.total_records % CHECKPOINT_EVERY == 0:
+                save_checkpoint()
+
+            city = house_data.get('city', '未取得')
+            district = house_data.get('district', '未取得') 
+            detected_city = house_data.get('detected_city', '未取得')
+            title = house_data.get('title', '未取得')[:30]
+
+            print(f"成功: {title}...")
+            print(f"座標判斷: {detected_city}")
+            print(f"導航抓取: {city} {district}")
+            print(f"{region.name} 進度: {region.count}/{region.target_count}")
+
+        if engine == "http":
+            print(f"以 HTTP 並行抓取詳細頁，本頁配額 {region.remaining} 筆")
+            fallback = lambda url: session.call(crawl_house_details, url, region.name)
+            for house_url, house_data in crawl_houses_http_first(house_urls, region.name, region.remaining, fallback=fallback):
+                record_house(house_url, house_data)
+        elif pool:
+            print(f"以 {pool.size} 個瀏覽器平行處理，本頁配額 {region.remaining} 筆")
+            for house_url, house_data in pool.crawl(house_urls, region.name, region.remaining):
+                record_house(house_url, house_data)
+        else:
+            for i, house_url in enumerate(house_urls):
+                if region.remaining == 0:
+                    print(f"{region.name} 已達目標，停止處理本頁剩餘房屋")
+                    break
+
+                print(f"處理第 {i+1}/{len(house_urls)} 個房屋...")
+
+                try:
+                    record_house(house_url, session.call(crawl_house_details, house_url, region.name))
+                except Exception as e:
+                    print(f"處理房屋時發生錯誤: {e}")
+
+        # 配額未滿時，以仍新鮮的上次結果補足，輸出仍是完整快照
+        for house_url in reusable_urls:
+            if region.remaining == 0:
+                break
+            if house_url in done_urls:
+                continue
+            house_data = scheduler.reuse(house_url)
+            if house_data:
+                record_house(house_url, house_data, reused=True)
+        return processed
+    
+    def finish_region(region):
+        """地區的列表頁都看過後，才把剩餘預算分給過期物件（過期越久越前面），再輸出地區統計"""
+        if scheduler:
+            stale_urls, reusable_urls = scheduler.plan_stale(region.name)
+            stale_urls = [house_url for house_url in stale_urls if house_url not in done_urls]
+            if region.remaining and (stale_urls or reusable_urls):
+                print(f"{region.name} 重抓過期物件：{len(stale_urls)} 筆需抓取，{len(reusable_urls)} 筆沿用上次結果")
+                crawl_houses(region, stale_urls, reusable_urls)
+        report_region(region)
+    
+    def report_region(region):
+        print(f"{region.name} 處理完成！共處理 {region.pages_done} 頁，收集資料: {region.count} 筆")
+        if region.stats["detected"]:
+            print(f"{region.name} 座標判斷結果:")
+            for city, count in region.stats["detected"].items():
+                print(f"   {city}: {count} 筆")
+            
+            print(f"{region.name} 導航抓取結果:")
+            if region.stats["districts"]:
+                for district, count in region.stats["districts"].items():
+                    print(f"   {district}: {count} 筆")
+            else:
+                print("   未成功抓取導航地區信息")
+        print(f"累計總資料: {checkpoint.total_records} 筆")
+        if region.name not in checkpoint.finished_regions:
+            checkpoint.finished_regions.append(region.name)
     
+    crawl_finished = False
     try:
-        regions = [
-            {
-                "name": "新北市", 
-                "url": "https://rent.houseprice.tw/list/21_usage/27-26-15-23-33-28-32-36-37-34-35-31-29-30-38-39-40-41-14-13-16-20-19-21-22-18-17-24-25_zip/?p=1",
-                "target_count": 40,
-                "max_pages": 3
-            },
-            {
-                "name": "台北市",
-                "url": "https://rent.houseprice.tw",
-                "target_count": 40,
-                "max_pages": 3
-            }
-        ]
+        regions = region_scheduler.all_regions()
+        print(f"共 {len(regions)} 個地區：" + "、".join(
+            f"{region.name}（目標 {region.target_count} 筆，最多 {region.max_pages} 頁）" for region in regions
+        ))
+        for region in regions:
+            if region.done:
+                print(f"{region.name} 已在先前執行中完成，跳過")
         
         total_start_time = time.time()
         
-        for region_idx, region in enumerate(regions):
-            region_name = region["name"]
-            region_url = region["url"] 
-            target_count = region["target_count"]
-            max_pages = region["max_pages"]
+        while True:
+            region = region_scheduler.next_region()
+            if region is None:
+                break
             
-            print(f"第 {region_idx + 1}/2 個地區：開始處理 {region_name}")
-            print(f"目標：{target_count} 筆資料，最多 {max_pages} 頁")
+            region_name = region.name
+            target_count = region.target_count
+            page_num = region.next_page
+            list_url = page_url(region.url, page_num)
             
-            region_start_time = time.time()
-            region_data = []
+            checkpoint.current_region = region_name
+            checkpoint.region_pages[region_name] = page_num
+            save_checkpoint()
+            print(f"處理 {region_name} 第 {page_num}/{region.max_pages} 頁（進度 {region.count}/{target_count}）...")
+            page_start_time = time.perf_counter()
             
             try:
-                if not safe_get_page(browser, region_url):
-                    print(f"無法訪問 {region_name} 頁面，跳過此地區")
+                # 一次讀取列表頁 HTML，解析每張卡片的網址與摘要（標題、價格、坪數、地區）
+                list_page = load_list_page(list_url)
+                if list_page is None:
+                    print(f"無法訪問 {region_name} 第 {page_num} 頁，結束此地區")
+                    region.exhausted = True
+                    finish_region(region)
+                    continue
+                
+                summaries, last_page_link = list_page
+                print(f"第 {page_num} 頁找到 {len(summaries)} 個房屋連結")
+                is_new_page = region_scheduler.observe_page(region, page_num, summaries, last_page_link)
+                region_scheduler.finish_page(region)
+                
+                if not is_new_page:
+                    print(f"{region_name} 第 {page_num} 頁沒有新物件，已到最後一頁")
+                    finish_region(region)
                     continue
+                if region.exhausted:
+                    print(f"{region_name} 第 {page_num} 頁為最後一頁")
+                
+                # 處理詳細頁期間先在背景抓下一頁列表
+                if not region.done:
+                    next_list_url = page_url(region.url, region.next_page)
+                    if not (cache and cache.is_fresh(next_list_url, "list")):
+                        prefetcher.submit(next_list_url)
                 
-                print(f"成功訪問 {region_name} 頁面")
+                house_urls = [summary["url"] for summary in summaries]
                 
-                for page_num in range(1, max_pages + 1):
-                    if len(region_data) >= target_count:
-                        print(f"{region_name} 已達目標數量 ({len(region_data)}/{target_count})，停止爬取")
-                        break
-                    
-                    print(f"處理 {region_name} 第 {page_num}/{max_pages} 頁...")
-                    
-                    if page_num > 1:
-                        if "?p=" in region_url:
-                            next_url = region_url.replace("?p=1", f"?p={page_num}")
-                        else:
-                            separator = "&" if "?" in region_url else "?"
-                            next_url = f"{region_url}{separator}p={page_num}"
-                        
-                        if not safe_get_page(browser, next_url):
-                            print(f"無法訪問第 {page_num} 頁，停止翻頁")
-                            break
-                    
-                    house_links = browser.find_elements("css selector", "a.group")
-                    print(f"第 {page_num} 頁找到 {len(house_links)} 個房屋連結")
-                    
-                    if not house_links:
-                        print("本頁無房屋連結，跳過")
-                        continue
-                    
-                    house_urls = []
-                    for i, link in enumerate(house_links):
-                        try:
-                            href = link.get_attribute("href")
-                            if href:
-                                house_urls.append(href)
-                        except Exception as e:
-                            pass
-                    
-                    print(f"成功收集 {len(house_urls)} 個有效連結")
-                    
-                    page_processed = 0
-                    for i, house_url in enumerate(house_urls):
-                        if len(region_data) >= target_count:
-                            print(f"{region_name} 已達目標，停止處理本頁剩餘房屋")
-                            break
-                        
-                        print(f"處理第 {i+1}/{len(house_urls)} 個房屋...")
-                        
-                        try:
-                            house_data = crawl_house_details(browser, house_url, region_name)
-                            if house_data:
-                                region_data.append(house_data)
-                                page_processed += 1
-                                
-                                city = house_data.get('city', '未取得')
-                                district = house_data.get('district', '未取得') 
-                                detected_city = house_data.get('detected_city', '未取得')
-                                title = house_data.get('title', '未取得')[:30]
-                                
-                                print(f"成功: {title}...")
-                                print(f"座標判斷: {detected_city}")
-                                print(f"導航抓取: {city} {district}")
-                                print(f"{region_name} 進度: {len(region_data)}/{target_count}")
-                            else:
-                                print("房屋資料抓取失敗")
-                        
-                        except Exception as e:
-                            print(f"處理房屋時發生錯誤: {e}")
-                        
-                        time.sleep(random.uniform(1, 2))
-                    
-                    print(f"第 {page_num} 頁處理完成，成功 {page_processed} 筆")
-                    print(f"{region_name} 累計: {len(region_data)} 筆")
-                    
-                    if page_num < max_pages:
-                        time.sleep(random.uniform(2, 4))
+                print(f"成功收集 {len(house_urls)} 個有效連結")
                 
-                region_elapsed = time.time() - region_start_time
-                print(f"{region_name} 處理完成！")
-                print(f"收集資料: {len(region_data)} 筆")
-                print(f"耗時: {region_elapsed:.1f} 秒")
+                if done_urls:
+                    house_urls = [house_url for house_url in house_urls if house_url not in done_urls]
                 
-                if region_data:
-                    detected_cities = {}
-                    nav_districts = {}
-                    
-                    for item in region_data:
-                        detected = item.get('detected_city', '未知')
-                        detected_cities[detected] = detected_cities.get(detected, 0) + 1
-                        
-                        city = item.get('city', '未知')
-                        district = item.get('district', '未知')
-                        if city != '未知' and district != '未知':
-                            key = f"{city} {district}"
-                            nav_districts[key] = nav_districts.get(key, 0) + 1
-                    
-                    print(f"{region_name} 座標判斷結果:")
-                    for city, count in detected_cities.items():
-                        print(f"   {city}: {count} 筆")
-                    
-                    print(f"{region_name} 導航抓取結果:")
-                    if nav_districts:
-                        for district, count in nav_districts.items():
-                            print(f"   {district}: {count} 筆")
-                    else:
-                        print("   未成功抓取導航地區信息")
+                if scheduler:
+                    house_urls, reusable_urls = scheduler.plan(
+                        house_urls, region_name, summaries={summary["url"]: summary for summary in summaries}
+                    )
+                    print(f"排程：{len(house_urls)} 筆需抓取，{len(reusable_urls)} 筆沿用上次結果")
+                else:
+                    reusable_urls = []
                 
-                all_data.extend(region_data)
-                print(f"累計總資料: {len(all_data)} 筆")
+                page_processed = crawl_houses(region, house_urls, reusable_urls)
+                
+                # 本頁詳細頁全部處理完才推進檢查點頁碼，中途當機時續跑會重新處理本頁
+                checkpoint.region_pages[region_name] = region.next_page
+                METRICS.add_page(region_name, page_num, time.perf_counter() - page_start_time, page_processed)
+                print(f"第 {page_num} 頁處理完成，成功 {page_processed} 筆")
+                print(f"{region_name} 累計: {region.count} 筆")
                 
             except Exception as e:
                 print(f"處理 {region_name} 時發生嚴重錯誤: {e}")
                 traceback.print_exc()
-                print("繼續處理下一個地區...")
+                print("結束此地區，繼續處理其他地區...")
+                region.exhausted = True
             
-            if region_idx < len(regions) - 1:
-                print(f"{region_name} 完成，休息 5 秒後處理下一個地區...")
-                time.sleep(5)
+            if region.done:
+                finish_region(region)
         
         total_elapsed = time.time() - total_start_time
+        total_records = checkpoint.total_records
         print(f"所有地區處理完成！")
-        print(f"總收集資料: {len(all_data)} 筆")
+        print(f"總收集資料: {total_records} 筆")
         print(f"總耗時: {total_elapsed:.1f} 秒")
         
-        if all_data:
-            final_city_stats = {}
-            final_district_stats = {}
-            
-            for item in all_data:
-                detected = item.get('detected_city', '未知')
-                final_city_stats[detected] = final_city_stats.get(detected, 0) + 1
-                
-                city = item.get('city', '未知')
-                district = item.get('district', '未知')
-                if city != '未知' and district != '未知':
-                    key = f"{city} {district}"
-                    final_district_stats[key] = final_district_stats.get(key, 0) + 1
-            
+        writer.close()
+        # 爬取已完成：之後的圖片、去重與空間索引會改寫 JSONL，先清除檢查點，
+        # 以免後處理中途中斷後，用改寫過的 JSONL 續跑而對不上已完成筆數與各地區進度
+        checkpoint.clear()
+        crawl_finished = True
+        if total_records:
             print(f"最終城市分布:")
-            for city, count in sorted(final_city_stats.items(), key=lambda x: x[1], reverse=True):
+            for city, count in sorted(final_stats["detected"].items(), key=lambda x: x[1], reverse=True):
                 print(f"   {city}: {count} 筆")
             
             print(f"最終地區分布:")
-            if final_district_stats:
-                for district, count in sorted(final_district_stats.items(), key=lambda x: x[1], reverse=True):
+            if final_stats["districts"]:
+                for district, count in sorted(final_stats["districts"].items(), key=lambda x: x[1], reverse=True):
                     print(f"   {district}: {count} 筆")
             else:
                 print("   未取得詳細地區資訊")
             
-            data_file = os.path.join("data", "stable_crawl_result.json")
-            with open(data_file, 'w', encoding='utf-8') as f:
-                json.dump(all_data, f, ensure_ascii=False, indent=2)
-            print(f"資料已保存至: {data_file}")
+            if image_dir:
+                try:
+                    print_image_stats(process_jsonl_images(jsonl_file, image_dir, image_workers))
+                except Exception as e:
+                    print(f"圖片處理失敗（資料仍會輸出）: {e}")
+            
+            if dedupe:
+                try:
+                    with METRICS.timer("dedupe"):
+                        dedupe_stats = dedupe_jsonl(jsonl_file)
+                    print_dedupe_stats(dedupe_stats)
+                    METRICS.set_gauge("duplicates_removed", dedupe_stats["removed"])
+                except Exception as e:
+                    print(f"合併重複物件失敗（保留全部資料）: {e}")
+            
+            if spatial_index_file:
+                try:
+                    with METRICS.timer("spatial_index"):
+                        index, spatial_stats = build_spatial_index(jsonl_file, spatial_index_file)
+                    print_spatial_stats(index, spatial_stats)
+                    print(f"空間索引已寫入: {spatial_index_file}")
+                except Exception as e:
+                    print(f"建立空間索引失敗（資料仍會輸出）: {e}")
+            
+            export_json_array(jsonl_file, json_file)
+            print(f"資料已保存至: {json_file}")
+            
+            if parquet_file:
+                try:
+                    parquet_stats = export_parquet(jsonl_file, parquet_file)
+                    print(f"Parquet 已保存至: {parquet_file}（{parquet_stats['written']} 筆）")
+                except Exception as e:
+                    print(f"輸出 Parquet 失敗: {e}")
         
-        return all_data
+        return total_records
         
     except Exception as e:
         print(f"爬蟲執行過程發生嚴重錯誤: {e}")
         traceback.print_exc()
-        return []
+        if crawl_finished:
+            print(f"爬取已完成，後處理中斷；資料保留在 {jsonl_file}")
+        else:
+            print(f"已寫入的資料保留在 {jsonl_file}，可使用 --resume 續跑")
+        return 0
     
     finally:
+        writer.close()
+        prefetcher.close()
+        if pool:
+            pool.close()
+        if scheduler:
+            print(f"本次實際抓取 {scheduler.fetched} 個詳細頁")
+            scheduler.store.close()
+        METRICS.set_gauge("records", checkpoint.total_records)
+        if scheduler:
+            METRICS.set_gauge("detail_pages_fetched", scheduler.fetched)
+        if cache:
+            print(f"回應快取：命中 {cache.hits} 頁，304 重新驗證 {cache.revalidated} 頁，未命中 {cache.misses} 頁")
+            METRICS.set_gauge("cache_hits", cache.hits)
+            METRICS.set_gauge("cache_misses", cache.misses)
+            METRICS.set_gauge("cache_revalidated", cache.revalidated)
+            set_response_cache(None)
+            cache.close()
+        RATE_CONTROLLER.print_report()
+        try:
+            METRICS.print_report()
+            if metrics_prom_file or metrics_json_file:
+                METRICS.write(metrics_prom_file, metrics_json_file)
+                print(f"執行統計已寫入: {metrics_prom_file or '-'}、{metrics_json_file or '-'}")
+        except Exception as e:
+            print(f"寫入執行統計失敗: {e}")
         try:
-            browser.quit()
-            print("瀏覽器已關閉")
+            session.close()
+            print(f"瀏覽器已關閉（換新 {session.recycles} 次，失效重啟 {session.restarts} 次）")
         except:
             pass
 
 if __name__ == "__main__":
-    print("開始穩定雙城市爬蟲...")
-    print("將依序處理: 新北市 → 台北市")
+    parser = argparse.ArgumentParser(description="穩定版多地區爬蟲")
+    parser.add_argument("--regions", default=os.getenv("CRAWLER_REGIONS_FILE", DEFAULT_REGIONS_FILE),
+                        help="地區設定檔（名稱、列表網址、目標筆數、最多頁數、優先度）")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CRAWLER_WORKERS", "1")),
+                        help="平行爬取詳細頁的瀏覽器數量（預設 1，即單一瀏覽器依序爬取）")
+    parser.add_argument("--engine", choices=["browser", "http"], default=os.getenv("CRAWLER_ENGINE", "browser"),
+                        help="詳細頁抓取方式：browser 全程使用 Selenium；http 先以 HTTP 並行抓取，缺欄位才用瀏覽器")
+    parser.add_argument("--state-db", default=DEFAULT_STATE_DB,
+                        help="抓取狀態資料庫路徑，設為空字串則停用排程、每次全部重抓")
+    parser.add_argument("--fetch-budget", type=int, default=None,
+                        help="本次最多抓取的詳細頁數量（新物件優先，其次為過期物件）")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="忽略新鮮度，所有物件都重新抓取（仍會更新抓取狀態）")
+    parser.add_argument("--resume", action="store_true",
+                        help="從上次中斷的檢查點續跑，略過已寫入 JSONL 的物件")
+    parser.add_argument("--browser-max-pages", type=int, default=DEFAULT_MAX_PAGES,
+                        help="每個瀏覽器處理幾頁後換新（0 表示不限）")
+    parser.add_argument("--browser-max-rss-mb", type=int, default=DEFAULT_MAX_RSS_MB,
+                        help="瀏覽器（含子程序）記憶體超過此值即換新（0 表示不檢查）")
+    parser.add_argument("--cache-dir", default=os.getenv("CRAWLER_CACHE_DIR", DEFAULT_CACHE_DIR),
+                        help="回應快取目錄，設為空字串則停用快取")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="回應快取容量上限（MB），超過時淘汰最久未使用的頁面")
+    parser.add_argument("--metrics-prom", default=DEFAULT_METRICS_PROM_FILE,
+                        help="Prometheus 文字格式的執行統計輸出路徑，設為空字串則不輸出")
+    parser.add_argument("--metrics-json", default=DEFAULT_METRICS_JSON_FILE,
+                        help="JSON 格式的執行統計摘要（含每頁耗時）輸出路徑，設為空字串則不輸出")
+    parser.add_argument("--spatial-index", default=DEFAULT_SPATIAL_INDEX_FILE,
+                        help="修正座標並輸出 geohash 空間索引的路徑，設為空字串則略過")
+    parser.add_argument("--image-dir", default=os.getenv("CRAWLER_IMAGE_DIR", DEFAULT_IMAGE_DIR),
+                        help="圖片縮圖的存放目錄，設為空字串則不下載圖片")
+    parser.add_argument("--image-workers", type=int, default=DEFAULT_IMAGE_WORKERS, help="同時下載圖片的執行緒數")
+    parser.add_argument("--parquet", default=DEFAULT_PARQUET_FILE,
+                        help="另外輸出型別化的 Parquet 檔（數值欄位已轉型），設為空字串則不輸出")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="不要合併重複刊登的物件（預設以標題、格局、坪數與座標判斷）")
+    parser.add_argument("--max-rate", type=float, default=DEFAULT_MAX_RATE,
+                        help="對同一主機的請求速率上限（次/秒），回應順利時會逐步加速到此值")
+    parser.add_argument("--record-corpus", default=None,
+                        help="將抓到的列表頁與詳細頁錄製到此目錄，供 replay.py / benchmark.py 離線使用")
+    args = parser.parse_args()
+
+    if args.record_corpus:
+        from replay import PageCorpus
+        set_page_recorder(PageCorpus(args.record_corpus))
+        print(f"錄製頁面到語料庫: {args.record_corpus}")
+    
+    print("開始穩定版爬蟲...")
+    print(f"地區設定: {args.regions}（各地區交錯處理）")
     print("確保不會中途停止")
     print("包含詳細地區資訊抓取")
     print("\n開始執行...")
     
-    result = stable_dual_city_crawl()
+    result = stable_dual_city_crawl(
+        workers=args.workers,
+        engine=args.engine,
+        state_db=args.state_db,
+        fetch_budget=args.fetch_budget,
+        full_refresh=args.full_refresh,
+        resume=args.resume,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+        metrics_prom_file=args.metrics_prom,
+        metrics_json_file=args.metrics_json,
+        regions_file=args.regions,
+        browser_max_pages=args.browser_max_pages,
+        browser_max_rss_mb=args.browser_max_rss_mb,
+        spatial_index_file=args.spatial_index,
+        dedupe=not args.no_dedupe,
+        image_dir=args.image_dir,
+        image_workers=args.image_workers,
+        parquet_file=args.parquet,
+        max_rate=args.max_rate,
+    )
     
     if result:
-        print(f"爬蟲成功完成！總共收集 {len(result)} 筆資料")
+        print(f"爬蟲成功完成！總共收集 {result} 筆資料")
     else:
         print(f"爬蟲未收集到資料或發生錯誤") 
\ No newline at end of file
@@ -0,0 +1,263 @@
+import json
+import time
+import uuid
+import threading
+from collections import deque
+
+# 租約逾時（秒）：工作者在此時間內未回報，任務會重新排入佇列
+DEFAULT_VISIBILITY_TIMEOUT = 180
+# 同一任務最多嘗試次數，超過就當作失敗回報給協調者
+MAX_ATTEMPTS = 3
+
+# 取出一個待處理任務並登記租約；任務已被 ack 刪除時略過
+LEASE_SCRIPT = """
+while true do
+    local task_id = redis.call('LPOP', KEYS[1])
+    if not task_id then
+        return nil
+    end
+    local payload = redis.call('HGET', KEYS[2], task_id)
+    if payload then
+        redis.call('ZADD', KEYS[3], ARGV[1], task_id)
+        return {task_id, payload}
+    end
+end
+"""
+
+# 將租約已過期的任務放回佇列，嘗試次數過多的回傳給呼叫端處理
+REQUEUE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local exhausted = {}
+for _, task_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], task_id)
+    local payload = redis.call('HGET', KEYS[2], task_id)
+    if payload then
+        local task = cjson.decode(payload)
+        task['attempts'] = (task['attempts'] or 0) + 1
+        if task['attempts'] >= tonumber(ARGV[2]) then
+            redis.call('HDEL', KEYS[2], task_id)
+            table.insert(exhausted, cjson.encode(task))
+        else
+            redis.call('HSET', KEYS[2], task_id, cjson.encode(task))
+            redis.call('RPUSH', KEYS[3], task_id)
+        end
+    end
+end
+return exhausted
+"""
+
+
+class MemoryTaskQueue:
+    """單一行程內的任務佇列，語意與 RedisTaskQueue 相同，供本機測試與單機多執行緒使用"""
+
+    def __init__(self, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._tasks = {}
+        self._leases = {}
+        self._results = deque()
+        self._seen = set()
+        self._generation = None
+        self._closed = None
+
+    def reset(self):
+        """清空佇列並開始新的一輪（generation），先前一輪的結束旗標不再有效"""
+        with self._lock:
+            self._pending.clear()
+            self._tasks.clear()
+            self._leases.clear()
+            self._results.clear()
+            self._seen.clear()
+            self._generation = uuid.uuid4().hex
+            self._closed = None
+
+    def generation(self):
+        return self._generation
+
+    def enqueue(self, task, dedupe_key=None):
+        """加入任務；指定 dedupe_key 時，已見過的鍵不會重複排入。回傳是否有排入"""
+        with self._lock:
+            if dedupe_key is not None:
+                if dedupe_key in self._seen:
+                    return False
+                self._seen.add(dedupe_key)
+            task_id = uuid.uuid4().hex
+            self._tasks[task_id] = dict(task, attempts=task.get("attempts", 0))
+            self._pending.append(task_id)
+            return True
+
+    def lease(self, now=None):
+        """取出一個任務並登記租約，沒有任務時回傳 None"""
+        now = now or time.time()
+        with self._lock:
+            while self._pending:
+                task_id = self._pending.popleft()
+                task = self._tasks.get(task_id)
+                if task is not None:
+                    self._leases[task_id] = now + self.visibility_timeout
+                    return task_id, dict(task)
+            return None
+
+    def ack(self, task_id):
+        with self._lock:
+            self._leases.pop(task_id, None)
+            self._tasks.pop(task_id, None)
+
+    def requeue_expired(self, now=None):
+        """租約逾時的任務重新排入；回傳嘗試次數用盡的任務"""
+        now = now or time.time()
+        exhausted = []
+        with self._lock:
+            for task_id, deadline in list(self._leases.items()):
+                if deadline > now:
+                    continue
+                del self._leases[task_id]
+                task = self._tasks.get(task_id)
+                if task is None:
+                    continue
+                task["attempts"] += 1
+                if task["attempts"] >= self.max_attempts:
+                    del self._tasks[task_id]
+                    exhausted.append(task)
+                else:
+                    self._pending.append(task_id)
+        return exhausted
+
+    def push_result(self, result):
+        with self._lock:
+            self._results.append(result)
+
+    def pop_results(self, max_items=100, timeout=1.0):
+        deadline = time.time() + timeout
+        while True:
+            with self._lock:
+                if self._results:
+                    return [self._results.popleft() for _ in range(min(max_items, len(self._results)))]
+            if time.time() >= deadline:
+                return []
+            time.sleep(0.05)
+
+    def close(self):
+        """標記目前這一輪已結束"""
+        with self._lock:
+            self._closed = self._generation or ""
+
+    def is_closed(self, generation=None):
+        """指定的一輪（預設為目前這一輪）是否已結束"""
+        with self._lock:
+            if self._closed is None:
+                return False
+            return self._closed == (self._generation or "" if generation is None else generation)
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._pending), "leased": len(self._leases), "results": len(self._results)}
+
+
+class RedisTaskQueue:
+    """以 Redis 協調多台機器的任務佇列
+
+    鍵以 crawler:<run_id>: 為前綴：pending（待處理清單）、tasks（任務內容）、
+    leases（租約到期時間 sorted set）、results（結果清單）、seen（已排入網址集合）、
+    generation（協調者每次開始時產生的編號）、closed（已結束那一輪的 generation）。
+    結束旗標只對同一輪有效，上一輪殘留的旗標不會讓下一輪的工作者誤以為已結束。
+    """
+
+    def __init__(self, redis_url, run_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS, expire_after=7 * 24 * 3600):
+        import redis
+
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.run_id = run_id
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.expire_after = expire_after
+        prefix = f"crawler:{run_id}:"
+        self.keys = {name: prefix + name for name in ("pending", "tasks", "leases", "results", "seen", "generation", "closed")}
+        self._lease_script = self.redis.register_script(LEASE_SCRIPT)
+        self._requeue_script = self.redis.register_script(REQUEUE_SCRIPT)
+
+    def reset(self):
+        """清除同一 run_id 上次執行留下的佇列、已見集合與結束旗標，並開始新的一輪；須在排入任務前呼叫"""
+        with self.redis.pipeline() as pipe:
+            pipe.delete(*self.keys.values())
+            pipe.set(self.keys["generation"], uuid.uuid4().hex, ex=self.expire_after)
+            pipe.execute()
+
+    def generation(self):
+        return self.redis.get(self.keys["generation"])
+
+    def enqueue(self, task, dedupe_key=None):
+        if dedupe_key is not None and not self.redis.sadd(self.keys["seen"], dedupe_key):
+            return False
+        task_id = uuid.uuid4().hex
+        payload = json.dumps(dict(task, attempts=task.get("attempts", 0)), ensure_ascii=False)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self.keys["tasks"], task_id, payload)
+            pipe.rpush(self.keys["pending"], task_id)
+            # 執行結束後殘留的鍵自動過期
+            for key in self.keys.values():
+                pipe.expire(key, self.expire_after)
+            pipe.execute()
+        return True
+
+    def lease(self, now=None):
+        now = now or time.time()
+        leased = self._lease_script(
+            keys=[self.keys["pending"], self.keys["tasks"], self.keys["leases"]],
+            args=[now + self.visibility_timeout],
+        )
+        if not leased:
+            return None
+        task_id, payload = leased
+        return task_id, json.loads(payload)
+
+    def ack(self, task_id):
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(self.keys["leases"], task_id)
+            pipe.hdel(self.keys["tasks"], task_id)
+            pipe.execute()
+
+    def requeue_expired(self, now=None):
+        now = now or time.time()
+        exhausted = self._requeue_script(
+            keys=[self.keys["leases"], self.keys["tasks"], self.keys["pending"]],
+            args=[now, self.max_attempts],
+        )
+        return [json.loads(payload) for payload in exhausted or []]
+
+    def push_result(self, result):
+        self.redis.rpush(self.keys["results"], json.dumps(result, ensure_ascii=False))
+
+    def pop_results(self, max_items=100, timeout=1.0):
+        first = self.redis.blpop(self.keys["results"], timeout=max(1, int(timeout)))
+        if not first:
+            return []
+        results = [json.loads(first[1])]
+        more = self.redis.lpop(self.keys["results"], max_items - 1) if max_items > 1 else None
+        results.extend(json.loads(payload) for payload in more or [])
+        return results
+
+    def close(self):
+        """標記目前這一輪已結束"""
+        self.redis.set(self.keys["closed"], self.generation() or "", ex=self.expire_after)
+
+    def is_closed(self, generation=None):
+        """指定的一輪（預設為目前這一輪）是否已結束"""
+        with self.redis.pipeline() as pipe:
+            pipe.get(self.keys["closed"])
+            pipe.get(self.keys["generation"])
+            closed, current = pipe.execute()
+        if closed is None:
+            return False
+        return closed == (current or "" if generation is None else generation)
+
+    def stats(self):
+        with self.redis.pipeline() as pipe:
+            pipe.llen(self.keys["pending"])
+            pipe.zcard(self.keys["leases"])
+            pipe.llen(self.keys["results"])
+            pending, leased, results = pipe.execute()
+        return {"pending": pending, "leased": leased, "results": results}
@@ -0,0 +1,7 @@
+import os
+import sys
+
+CRAWLER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CRAWLER_DIR)
+# crawler.py 匯入時會在工作目錄建立 logs/ 與 data/，固定在爬蟲目錄執行
+os.chdir(CRAWLER_DIR)
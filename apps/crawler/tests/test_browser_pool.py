@@ -0,0 +1,81 @@
+import threading
+
+from selenium.common.exceptions import InvalidSessionIdException
+
+import browser_pool
+from browser_pool import BrowserPool
+
+
+class FakeBrowser:
+    def __init__(self, number):
+        self.number = number
+        self.quit_called = threading.Event()
+
+    def quit(self):
+        self.quit_called.set()
+
+
+class FakeFactory:
+    def __init__(self):
+        self.browsers = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            browser = FakeBrowser(len(self.browsers))
+            self.browsers.append(browser)
+            return browser
+
+
+def _fake_crawl(crawled, fail_urls=(), dead_urls=None):
+    lock = threading.Lock()
+
+    def crawl_house_details(browser, house_url, target_region):
+        with lock:
+            crawled.append(house_url)
+            # 第一次處理時瀏覽器失效，重啟後的重試才成功
+            if dead_urls is not None and house_url in dead_urls:
+                dead_urls.remove(house_url)
+                raise InvalidSessionIdException("invalid session id")
+        if house_url in fail_urls:
+            return None
+        return {"url": house_url, "browser": browser.number}
+
+    return crawl_house_details
+
+
+def test_dispatch_stops_at_exact_quota(monkeypatch):
+    crawled = []
+    monkeypatch.setattr(browser_pool, "crawl_house_details", _fake_crawl(crawled, fail_urls={"f1", "f2"}))
+    urls = ["a", "f1", "b", "f2", "c", "d", "e"]
+    with BrowserPool(size=2, browser_factory=FakeFactory()) as pool:
+        results = list(pool.crawl(urls, "台北市", limit=3))
+
+    assert sorted(url for url, data in results if data) == ["a", "b", "c"]
+    # 失敗的頁面釋出配額後才補派下一頁，不會多爬用不到的頁面
+    assert sorted(crawled) == ["a", "b", "c", "f1", "f2"]
+
+
+def test_early_stop_drains_in_flight_results(monkeypatch):
+    crawled = []
+    monkeypatch.setattr(browser_pool, "crawl_house_details", _fake_crawl(crawled))
+    with BrowserPool(size=3, browser_factory=FakeFactory()) as pool:
+        for _ in pool.crawl(["a", "b", "c"], None, limit=3):
+            break
+        # 上一批尚未取回的結果不會混入下一批
+        assert [url for url, _ in pool.crawl(["x"], None, limit=1)] == ["x"]
+
+
+def test_dead_session_restarts_browser_and_retries(monkeypatch):
+    crawled = []
+    monkeypatch.setattr(browser_pool, "crawl_house_details", _fake_crawl(crawled, dead_urls={"a"}))
+    factory = FakeFactory()
+    with BrowserPool(size=1, browser_factory=factory) as pool:
+        [(url, data)] = list(pool.crawl(["a"], None, limit=1))
+
+    assert url == "a" and data["browser"] == 1
+    assert crawled == ["a", "a"]
+    # 工作執行緒不保留備用瀏覽器：只建立失效的與重啟後的兩個
+    assert len(factory.browsers) == 2
+    assert factory.browsers[0].quit_called.wait(timeout=5)
+    assert factory.browsers[1].quit_called.is_set()
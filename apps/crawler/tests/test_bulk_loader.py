@@ -0,0 +1,127 @@
+import csv
+import io
+
+import bulk_loader
+from bulk_loader import (CREATE_STAGING_SQL, DEACTIVATE_IDS_SQL, DEACTIVATE_SQL, MERGE_SQL, STAGING_COLUMNS, apply_delta,
+                         bulk_load, normalize_record)
+
+
+class FakeCursor:
+    """記錄執行的 SQL 與 COPY 內容；MERGE 回傳 (新增, 更新) 筆數"""
+
+    def __init__(self, merge_counts=(0, 0), rowcount=0):
+        self.executed = []
+        self.copied = []
+        self.merge_counts = merge_counts
+        self.rowcount = rowcount
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.merge_counts
+
+    def copy_expert(self, query, buffer):
+        self.copied.append(list(csv.reader(io.StringIO(buffer.read()))))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_normalize_record_applies_import_service_defaults():
+    record = normalize_record({"url": "https://rent.houseprice.tw/house/123", "title": "套房", "price": "12,000 元",
+                               "size": "8.5坪", "images": ["a.jpg"]})
+    assert record["source_id"] == "123"
+    assert (record["price"], record["size_ping"]) == (12000, 8.5)
+    assert (record["address"], record["city"], record["district"]) == ("套房", "台北市", "中正區")
+    assert (record["latitude"], record["longitude"]) == (0, 0)
+    assert normalize_record({"id": "1", "title": ""}) is None
+
+
+def test_merge_keeps_last_row_per_source_id():
+    assert "DISTINCT ON (source_id)" in MERGE_SQL
+    assert "ORDER BY source_id, row_num DESC" in MERGE_SQL
+
+
+def test_bulk_load_copies_merges_and_deactivates():
+    cursor = FakeCursor(merge_counts=(1, 1), rowcount=3)
+    records = [{"id": "1", "title": "套房", "images": ['含"引號"', "b.jpg"]}, {"id": "2", "title": ""},
+               {"id": "3", "title": "雅房"}]
+    result = bulk_load(records, FakeConnection(cursor))
+    assert result == {"imported": 1, "updated": 1, "skipped": 1, "errors": 0, "totalItems": 3, "deactivated": 3}
+    [copied] = cursor.copied
+    rows = [dict(zip(STAGING_COLUMNS, row)) for row in copied]
+    assert [(row["row_num"], row["source_id"]) for row in rows] == [("1", "1"), ("3", "3")]
+    assert rows[0]["image_urls"] == '{"含\\"引號\\"","b.jpg"}'
+    assert [query for query, _ in cursor.executed] == [CREATE_STAGING_SQL, MERGE_SQL, DEACTIVATE_SQL]
+
+
+def test_bulk_load_without_records_skips_merge():
+    cursor = FakeCursor()
+    assert bulk_load([{"id": "1", "title": ""}], FakeConnection(cursor))["skipped"] == 1
+    assert [query for query, _ in cursor.executed] == [CREATE_STAGING_SQL]
+
+
+def test_apply_delta_stages_added_updates_changed_fields_and_deactivates_removed(monkeypatch):
+    calls = []
+
+    def fake_execute_values(cursor, query, rows, template=None, page_size=None, fetch=False):
+        calls.append((query, template, rows))
+        # 資料庫中只有 2 號，3 號已被刪除
+        return [(row[1],) for row in rows if row[1] == "2"]
+
+    monkeypatch.setattr(bulk_loader, "execute_values", fake_execute_values)
+    added = normalize_record({"id": "1", "title": "新物件", "price": "9000", "images": ['含"引號"', "b.jpg"]})
+    delta = {
+        "added": [added],
+        "changed": [
+            {"source_id": "2", "fields": {"price": 15000}},
+            {"source_id": "3", "fields": {"price": 8000}},
+            {"source_id": "4", "fields": {"title": "新標題", "image_urls": ["c.jpg"]}},
+        ],
+        "removed": ["5", "6"],
+    }
+    cursor = FakeCursor(merge_counts=(1, 0), rowcount=2)
+
+    result = apply_delta(delta, FakeConnection(cursor))
+
+    assert result == {"imported": 1, "updated": 1, "skipped": 0, "errors": 0, "totalItems": 4, "deactivated": 2,
+                      "missing": 2}
+    [copied] = cursor.copied
+    assert len(copied) == 1 and len(copied[0]) == len(STAGING_COLUMNS)
+    row = dict(zip(STAGING_COLUMNS, copied[0]))
+    assert row["row_num"] == "1" and row["image_urls"] == '{"含\\"引號\\"","b.jpg"}'
+    assert [query for query, _ in cursor.executed] == [CREATE_STAGING_SQL, MERGE_SQL, DEACTIVATE_IDS_SQL]
+    assert cursor.executed[-1][1] == {"source": "houseprice", "source_ids": ["5", "6"]}
+
+    # 依變動欄位的組合分成兩次 UPDATE，只更新變動的欄位，非文字欄位明確轉型
+    [(price_query, price_template, price_rows), (title_query, title_template, title_rows)] = calls
+    assert "SET price = v.price," in price_query and "title" not in price_query
+    assert price_template == "(%s, %s, %s::integer)"
+    assert price_rows == [["houseprice", "2", 15000], ["houseprice", "3", 8000]]
+    assert "SET title = v.title, image_urls = v.image_urls," in title_query
+    assert title_template == "(%s, %s, %s::text, %s::text[])"
+    assert title_rows == [["houseprice", "4", "新標題", ["c.jpg"]]]
+
+
+def test_apply_delta_without_changes_touches_nothing():
+    cursor = FakeCursor()
+    result = apply_delta({"added": [], "changed": [], "removed": []}, FakeConnection(cursor))
+    assert cursor.executed == [] and result["totalItems"] == 0
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from commute_precompute import (
+    FAILED_DURATION, MAX_ELEMENTS, MAX_ORIGINS, StubDistanceMatrixClient, destination_hash, expand_jobs,
+    pack_requests, precompute_commutes, prefilter,
+)
+from spatial_index import haversine_km
+
+# 以 node 執行後端 commuteCacheService.generateDestinationHash 得到的結果
+BACKEND_HASHES = [
+    (25.0478, 121.517, "25.047,121.518:transit"),
+    (25.0015, 121.4985, "25.002,121.500:transit"),
+    (25.0345, 121.5645, "25.035,121.566:transit"),
+    (24.9985, 121.0015, "24.999,121.002:transit"),
+    (25.0795, 121.575, "25.080,121.575:transit"),
+    (22.6273, 120.3014, "22.626,120.300:transit"),
+    (-0.0015, -0.0045, "0.000,-0.003:transit"),
+    (23.9999, 120.6015, "24.000,120.603:transit"),
+    (25.04849999, 121.51650001, "25.047,121.518:transit"),
+]
+
+TAIPEI_MAIN = {"name": "台北車站", "lat": 25.0478, "lng": 121.5170}
+
+
+@pytest.mark.parametrize("lat,lng,expected", BACKEND_HASHES)
+def test_destination_hash_matches_backend(lat, lng, expected):
+    assert destination_hash(lat, lng, "transit") == expected
+
+
+def _listings(count=300, seed=1):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, count + 1, dtype=np.int64)
+    lats = 25.0478 + rng.uniform(-0.3, 0.3, count)
+    lngs = 121.5170 + rng.uniform(-0.3, 0.3, count)
+    return ids, lats, lngs
+
+
+def _jobs():
+    return expand_jobs([
+        dict(TAIPEI_MAIN, modes=["transit"], radius_km=15, max_minutes=60),
+        {"name": "板橋車站", "lat": 25.0143, "lng": 121.4637, "modes": ["transit", "driving"],
+         "radius_km": 15, "max_minutes": 60},
+    ])
+
+
+def test_prefilter_keeps_every_listing_within_radius():
+    listings = _listings()
+    ids, lats, lngs = listings
+    for job in _jobs():
+        survivors = set(prefilter(listings, job).tolist())
+        for index in range(len(ids)):
+            distance = haversine_km(lats[index], lngs[index], job["lat"], job["lng"])
+            if distance < job["radius_km"] - 1e-6:
+                assert index in survivors
+
+
+def test_prefilter_skips_cached_listings():
+    listings = _listings()
+    job = _jobs()[0]
+    survivors = prefilter(listings, job)
+    cached_id = int(listings[0][survivors[0]])
+    assert int(survivors[0]) not in set(prefilter(listings, job, {cached_id}).tolist())
+
+
+def test_pack_requests_respects_api_limits_and_covers_every_pair():
+    needed = {origin: {"a", "b", "c"} if origin % 2 else {"a"} for origin in range(120)}
+    plan = pack_requests(needed)
+    covered = set()
+    for origins, hashes in plan:
+        assert len(origins) <= MAX_ORIGINS
+        assert len(origins) * len(hashes) <= MAX_ELEMENTS
+        covered.update((origin, key) for origin in origins for key in hashes)
+    assert covered == {(origin, key) for origin, keys in needed.items() for key in keys}
+
+
+def test_stub_client_results_for_every_surviving_pair():
+    listings = _listings()
+    jobs = _jobs()
+    client = StubDistanceMatrixClient()
+    results = precompute_commutes(listings, jobs, client)
+    for job in jobs:
+        assert len(results[job["hash"]]) == len(prefilter(listings, job))
+        assert all(entry["durationMinutes"] < FAILED_DURATION for entry in results[job["hash"]].values())
+    assert client.calls > 0
+
+
+class FailingClient(StubDistanceMatrixClient):
+    """第一批整批失敗、第二批第一個元素失敗，其餘與 stub 相同"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+
+    def matrix(self, origins, destinations, mode):
+        self.batches += 1
+        if self.batches == 1:
+            return None
+        rows = super().matrix(origins, destinations, mode)
+        if self.batches == 2:
+            rows[0][0] = None
+        return rows
+
+
+def test_failed_batch_is_not_cached_as_999():
+    listings = _listings()
+    job = _jobs()[0]
+    survivors = prefilter(listings, job)
+    assert len(survivors) > 2 * MAX_ORIGINS
+
+    results = precompute_commutes(listings, [job], FailingClient())
+    entries = results[job["hash"]]
+    first_batch_ids = {int(listings[0][origin]) for origin in pack_requests(
+        {origin: {job["hash"]} for origin in survivors.tolist()})[0][0]}
+    assert not first_batch_ids & set(entries)
+    # 只有回應中個別失敗的元素記為 999
+    assert sum(entry["durationMinutes"] == FAILED_DURATION for entry in entries.values()) == 1
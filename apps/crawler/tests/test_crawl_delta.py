@@ -0,0 +1,42 @@
+import json
+
+from crawl_delta import compute_delta
+
+
+def _write(path, records):
+    path.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records), encoding="utf-8")
+    return str(path)
+
+
+def _listing(listing_id, **overrides):
+    record = {"id": listing_id, "url": f"https://rent.houseprice.tw/house/{listing_id}", "title": f"物件 {listing_id}",
+              "price": "10000", "size": "10", "city": "台北市", "district": "大安區", "images": ["a.jpg"],
+              "thumbnails": ["thumb/a.jpg"]}
+    record.update(overrides)
+    return record
+
+
+def test_delta_reports_added_changed_removed_and_unchanged(tmp_path):
+    previous = _write(tmp_path / "previous.jsonl", [_listing("1"), _listing("2"), _listing("3"), _listing("4")])
+    current = _write(tmp_path / "current.jsonl", [
+        _listing("1"),
+        _listing("2", price="12,000", images=["a.jpg", "b.jpg"]),
+        # 只有爬蟲端使用的欄位變動，不算變動
+        _listing("3", thumbnails=["thumb/b.jpg"], geohash="wsqqm"),
+        _listing("5"),
+        {"id": "6", "title": ""},
+    ])
+
+    delta = compute_delta(previous, current)
+
+    assert [record["source_id"] for record in delta["added"]] == ["5"]
+    assert delta["changed"] == [{"source_id": "2", "fields": {"price": 12000, "image_urls": ["a.jpg", "b.jpg"]}}]
+    assert delta["removed"] == ["4"]
+    assert delta["unchanged"] == 2
+
+
+def test_repeated_source_id_uses_last_record(tmp_path):
+    previous = _write(tmp_path / "previous.jsonl", [_listing("1", price="9000"), _listing("1")])
+    current = _write(tmp_path / "current.jsonl", [_listing("1", price="11000"), _listing("1")])
+    delta = compute_delta(previous, current)
+    assert (delta["added"], delta["changed"], delta["removed"], delta["unchanged"]) == ([], [], [], 1)
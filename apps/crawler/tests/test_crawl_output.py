@@ -0,0 +1,81 @@
+import json
+
+from crawl_output import CrawlCheckpoint, JsonlRecordWriter, export_json_array, iter_jsonl, truncate_partial_line
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    assert CrawlCheckpoint.load(path) is None
+
+    checkpoint = CrawlCheckpoint(path)
+    checkpoint.region_pages = {"台北市": 3, "新北市": 2}
+    checkpoint.finished_regions = ["新北市"]
+    checkpoint.current_region = "台北市"
+    checkpoint.region_counts = {"台北市": 40, "新北市": 20}
+    checkpoint.total_records = 60
+    checkpoint.pending_records = 5
+    checkpoint.save()
+
+    loaded = CrawlCheckpoint.load(path)
+    assert loaded.region_pages == {"台北市": 3, "新北市": 2}
+    assert loaded.finished_regions == ["新北市"]
+    assert loaded.current_region == "台北市"
+    assert loaded.region_counts == {"台北市": 40, "新北市": 20}
+    assert loaded.total_records == 60
+    # pending_records 只在續跑時計算，不寫入檔案
+    assert loaded.pending_records == 0
+
+    loaded.clear()
+    assert CrawlCheckpoint.load(path) is None
+
+
+def test_legacy_checkpoint_restarts_region_pages(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text(json.dumps({"region_index": 1, "page_num": 4, "total_records": 30}))
+    loaded = CrawlCheckpoint.load(str(path))
+    assert loaded.region_pages == {} and loaded.total_records == 30
+
+
+def test_resume_after_crash_mid_write(tmp_path):
+    jsonl_path = str(tmp_path / "houses.jsonl")
+    writer = JsonlRecordWriter(jsonl_path)
+    for listing_id in range(3):
+        writer.write({"id": str(listing_id), "title": "套房" * 1500})
+    writer.close()
+    # 當機時最後一行只寫了一半（長度超過一個讀取區塊）
+    with open(jsonl_path, 'a', encoding='utf-8') as f:
+        f.write('{"id": "3", "title": "' + "套房" * 1500)
+
+    truncate_partial_line(jsonl_path)
+    assert [record["id"] for record in iter_jsonl(jsonl_path)] == ["0", "1", "2"]
+
+    writer = JsonlRecordWriter(jsonl_path, append=True)
+    writer.write({"id": "3", "title": "雅房"})
+    writer.close()
+    assert [record["id"] for record in iter_jsonl(jsonl_path)] == ["0", "1", "2", "3"]
+
+
+def test_truncate_handles_single_partial_line_and_complete_files(tmp_path):
+    path = tmp_path / "houses.jsonl"
+    path.write_text('{"id": "0"')
+    truncate_partial_line(str(path))
+    assert path.read_text() == ""
+
+    path.write_text('{"id": "0"}\n')
+    truncate_partial_line(str(path))
+    assert path.read_text() == '{"id": "0"}\n'
+
+
+def test_export_json_array(tmp_path):
+    jsonl_path = str(tmp_path / "houses.jsonl")
+    json_path = str(tmp_path / "houses.json")
+    assert export_json_array(jsonl_path, json_path) == 0
+    assert json.loads(open(json_path, encoding='utf-8').read()) == []
+
+    writer = JsonlRecordWriter(jsonl_path)
+    writer.write({"id": "1", "images": ["a.jpg"]})
+    writer.write({"id": "2", "images": []})
+    writer.close()
+    assert export_json_array(jsonl_path, json_path) == 2
+    with open(json_path, encoding='utf-8') as f:
+        assert json.load(f) == [{"id": "1", "images": ["a.jpg"]}, {"id": "2", "images": []}]
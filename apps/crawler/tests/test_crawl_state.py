@@ -0,0 +1,47 @@
+from crawl_state import CrawlStateStore, RecrawlScheduler, STALE_AFTER
+
+NOW = 1_000_000_000.0
+
+
+def _url(listing_id):
+    return f"https://rent.houseprice.tw/house/{listing_id}"
+
+
+def _store_with_history(tmp_path, fetched_ago):
+    """建立已抓取過的物件：{編號: 距今幾秒前抓取}"""
+    store = CrawlStateStore(str(tmp_path / "state.db"))
+    for listing_id, ago in fetched_ago.items():
+        store.record_fetch(_url(listing_id), {"title": listing_id}, "台北市", now=NOW - ago)
+    return store
+
+
+def test_stale_listings_wait_until_region_pages_are_seen(tmp_path):
+    store = _store_with_history(tmp_path, {"s1": 2 * STALE_AFTER, "s2": 3 * STALE_AFTER, "fresh": 60})
+    scheduler = RecrawlScheduler(store, budget=3)
+
+    # 第一頁只有過期與新鮮物件：過期物件先暫存，不佔用預算
+    to_fetch, reusable = scheduler.plan([_url("s1"), _url("s2"), _url("fresh")], "台北市", now=NOW)
+    assert to_fetch == [] and reusable == [_url("fresh")]
+
+    # 後面頁面的新物件照樣拿得到預算
+    to_fetch, _ = scheduler.plan([_url("n1"), _url("n2")], "台北市", now=NOW)
+    assert to_fetch == [_url("n1"), _url("n2")]
+    for house_url in to_fetch:
+        scheduler.record(house_url, {"title": house_url}, "台北市")
+
+    # 剩下的一筆預算給過期最久的物件，另一筆沿用上次結果
+    assert scheduler.plan_stale("台北市") == ([_url("s2")], [_url("s1")])
+    assert scheduler.plan_stale("台北市") == ([], [])
+    store.close()
+
+
+def test_plan_commits_once_per_call(tmp_path):
+    store = _store_with_history(tmp_path, {"old": 60})
+    statements = []
+    store.conn.set_trace_callback(statements.append)
+
+    RecrawlScheduler(store).plan([_url(listing_id) for listing_id in ("old", "a", "b", "c")], "台北市", now=NOW,
+                                 summaries={_url("old"): {"summary_hash": "h"}})
+
+    assert statements.count("COMMIT") == 1
+    store.close()
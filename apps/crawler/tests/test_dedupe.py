@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+
+from dedupe import ListingFingerprint, dedupe_jsonl, find_duplicate_clusters, minhash_signature, record_shingles
+
+
+def _listing(listing_id, title="大安區近捷運 全新裝潢兩房 可寵", **overrides):
+    record = {
+        "id": listing_id, "url": f"https://rent.houseprice.tw/house/{listing_id}", "title": title,
+        "price": "32000", "size": "25.3", "room_layout": "2房1廳1衛", "city": "台北市", "district": "大安區",
+        "latitude": 25.0335, "longitude": 121.5436, "images": [],
+    }
+    record.update(overrides)
+    return record
+
+
+def _fingerprints(records):
+    return [ListingFingerprint(position, record) for position, record in enumerate(records)]
+
+
+def test_signature_ignores_punctuation_and_case():
+    left = minhash_signature(record_shingles(_listing("1", title="【大安區】近捷運 全新裝潢兩房!!")))
+    right = minhash_signature(record_shingles(_listing("2", title="大安區 近捷運全新裝潢兩房")))
+    assert np.array_equal(left, right)
+    assert minhash_signature(set()) is None
+
+
+def test_signature_similarity_tracks_jaccard():
+    base = record_shingles(_listing("1"))
+    other = record_shingles(_listing("2", title="信義區 景觀三房 近101 採光佳"))
+    similarity = float(np.mean(minhash_signature(base) == minhash_signature(other)))
+    exact = len(base & other) / len(base | other)
+    assert abs(similarity - exact) < 0.2
+
+
+def test_reposted_listing_is_clustered_with_best_copy_kept():
+    records = [
+        _listing("1"),
+        _listing("2", title="大安區近捷運，全新裝潢兩房（可寵）", latitude=25.0340, images=["a.jpg", "b.jpg"]),
+        _listing("3", title="板橋獨立套房 近府中站", size="8", room_layout="1房1衛", latitude=25.0087, longitude=121.4594),
+    ]
+    assert find_duplicate_clusters(_fingerprints(records)) == {1: [0]}
+
+
+def test_similar_titles_with_different_layout_or_location_are_kept():
+    records = [
+        _listing("1"),
+        _listing("2", room_layout="3房2廳2衛"),
+        # 直線距離約 1 公里
+        _listing("3", latitude=25.0425),
+    ]
+    assert find_duplicate_clusters(_fingerprints(records)) == {}
+
+
+def test_chained_matches_are_not_merged_transitively():
+    # 相鄰兩筆相距約 111 公尺，頭尾相距約 222 公尺：頭尾不是同一間，不能經由中間那筆串成一群
+    records = [_listing("1"), _listing("2", latitude=25.0345), _listing("3", latitude=25.0355)]
+    assert find_duplicate_clusters(_fingerprints(records)) == {0: [1]}
+
+
+def test_centroid_only_listings_need_same_district_and_price():
+    records = [
+        _listing("1", latitude=None, longitude=None),
+        _listing("2", latitude=None, longitude=None),
+        _listing("3", latitude=None, longitude=None, price="28000"),
+    ]
+    assert find_duplicate_clusters(_fingerprints(records)) == {0: [1]}
+
+
+def test_dedupe_jsonl_rewrites_with_alternates(tmp_path):
+    path = tmp_path / "houses.jsonl"
+    records = [_listing("1"), _listing("2", images=["a.jpg"]), _listing("3", title="板橋獨立套房 近府中站",
+                                                                          size="8", room_layout="1房1衛")]
+    path.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records), encoding="utf-8")
+
+    assert dedupe_jsonl(str(path)) == {"records": 3, "clusters": 1, "removed": 1}
+    kept = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [record["id"] for record in kept] == ["2", "3"]
+    assert [alternate["id"] for alternate in kept[0]["alternates"]] == ["1"]
+    assert kept[1]["alternates"] == []
@@ -0,0 +1,70 @@
+import pytest
+import requests
+
+from image_pipeline import MAX_ATTEMPTS, ImagePipeline
+
+URL = "https://img.houseprice.tw/house/1.jpg"
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.content = b"image"
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+class FakeSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        return FakeResponse(self.statuses.pop(0))
+
+
+class FakeRateController:
+    def __init__(self):
+        self.failures = []
+
+    def acquire(self, url):
+        pass
+
+    def record_success(self, url, latency=None):
+        pass
+
+    def record_failure(self, url, reason="error"):
+        self.failures.append(reason)
+
+
+def _pipeline(statuses):
+    pipeline = ImagePipeline(store=None, rate_controller=FakeRateController())
+    pipeline._local.session = FakeSession(statuses)
+    return pipeline
+
+
+@pytest.mark.parametrize("status", [404, 410, 403, 400])
+def test_client_errors_are_not_retried(status, capsys):
+    pipeline = _pipeline([status, 200])
+    with pytest.raises(requests.HTTPError):
+        pipeline._download(URL)
+    assert pipeline._local.session.calls == 1
+    assert "重試" not in capsys.readouterr().out
+
+
+def test_deleted_images_do_not_slow_the_host():
+    pipeline = _pipeline([404])
+    with pytest.raises(requests.HTTPError):
+        pipeline._download(URL)
+    assert pipeline.rate_controller.failures == []
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_throttling_and_server_errors_are_retried(status):
+    pipeline = _pipeline([status] * (MAX_ATTEMPTS - 1) + [200])
+    assert pipeline._download(URL) == b"image"
+    assert pipeline._local.session.calls == MAX_ATTEMPTS
+    assert pipeline.rate_controller.failures == ["image_error"] * (MAX_ATTEMPTS - 1)
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from listing_record import (ListingRecord, export_parquet, iter_parquet_rows, parse_floor, parse_layout,
+                            parse_price, parse_size)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12,000 元/月", 12000), ("0", None), ("", None), (None, None), ("面議", None), (12000, 12000), (12000.0, 12000),
+])
+def test_parse_price(value, expected):
+    assert parse_price(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [("12.5坪", 12.5), ("0", None), ("約坪", None), (25, 25.0), (0, None)])
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("3/13樓", (3, 13)), ("3F/13F", (3, 13)), ("B1/5樓", (-1, 5)), ("1~3/5樓", (1, 5)),
+    ("頂樓加蓋/5F", (6, 5)), ("頂樓/5F", (5, 5)), ("整棟/4樓", (None, 4)), ("未知", (None, None)),
+])
+def test_parse_floor(value, expected):
+    assert parse_floor(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("99999F/40000F", (None, None)), ("3/40000樓", (3, None)), ("B20/5樓", (None, 5)),
+    ("頂樓加蓋/99999樓", (None, None)), ("101/101樓", (101, 101)),
+])
+def test_parse_floor_drops_implausible_values(value, expected):
+    assert parse_floor(value) == expected
+
+
+def test_parse_layout():
+    assert parse_layout("2房1廳1衛") == {"rooms": 2, "living_rooms": 1, "bathrooms": 1}
+    assert parse_layout("開放格局 1衛") == {"rooms": None, "living_rooms": None, "bathrooms": 1}
+    assert parse_layout(None) == {"rooms": None, "living_rooms": None, "bathrooms": None}
+
+
+def test_parse_layout_drops_implausible_counts():
+    # 整棟出租的上百間套房仍保留，明顯是解析錯誤的數字改為 None
+    assert parse_layout("150房0廳150衛")["rooms"] == 150
+    assert parse_layout("20231房1廳1衛")["rooms"] is None
+
+
+def test_from_raw_requires_id_and_title():
+    assert ListingRecord.from_raw({"url": "https://rent.houseprice.tw/house/123", "title": ""}) is None
+    record = ListingRecord.from_raw({"url": "https://rent.houseprice.tw/house/123", "title": "套房",
+                                     "alternates": [{"id": 456}, {}]})
+    assert record.source_id == "123" and record.alternate_ids == ["456"]
+
+
+def test_parquet_export_keeps_large_layout_counts_and_survives_bad_floors(tmp_path):
+    pytest.importorskip("pyarrow")
+    jsonl_path = tmp_path / "houses.jsonl"
+    rows = [
+        {"id": "1", "title": "整棟套房", "price": "300,000", "room_layout": "150房0廳150衛", "floor_info": "1~5/5樓"},
+        {"id": "2", "title": "雅房", "price": "5000", "room_layout": "1房", "latitude": "25.03",
+         "floor_info": "99999F/40000F"},
+        {"id": "3", "title": ""},
+    ]
+    jsonl_path.write_text("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows), encoding="utf-8")
+    parquet_path = str(tmp_path / "houses.parquet")
+
+    assert export_parquet(str(jsonl_path), parquet_path) == {"skipped": 1, "written": 2}
+    exported = list(iter_parquet_rows(parquet_path, columns=["source_id", "rooms", "bathrooms", "latitude",
+                                                             "total_floors"]))
+    assert exported == [
+        {"source_id": "1", "rooms": 150, "bathrooms": 150, "latitude": None, "total_floors": 5},
+        {"source_id": "2", "rooms": 1, "bathrooms": None, "latitude": 25.03, "total_floors": None},
+    ]
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import rate_controller
+from rate_controller import COOLDOWN_BASE, RateController
+
+URL = "https://rent.houseprice.tw/house/1"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # 不加隨機抖動，等待秒數可以精確比對
+    monkeypatch.setattr(rate_controller, "JITTER", 0.0)
+    monkeypatch.setattr(rate_controller.METRICS, "sleep", lambda seconds, name=None: _advance(clock, seconds))
+    return clock
+
+
+def _advance(clock, seconds):
+    clock.now += seconds
+
+
+def test_reservations_are_spaced_by_rate(clock):
+    controller = RateController(initial_rate=0.5, burst=2, clock=clock)
+    delays = [controller.reserve(URL)[0] for _ in range(4)]
+    assert delays == [0.0, 0.0, 2.0, 4.0]
+
+
+def test_unlimited_hosts_never_wait(clock):
+    controller = RateController(initial_rate=0.5, burst=0, clock=clock)
+    assert controller.reserve("http://127.0.0.1:8000/house/1") == (0.0, None)
+
+
+def test_failure_halves_rate_once_per_interval(clock):
+    controller = RateController(initial_rate=1.0, min_rate=0.05, clock=clock)
+    controller.record_failure(URL, "timeout")
+    controller.record_failure(URL, "timeout")
+    state = controller.hosts["rent.houseprice.tw"]
+    assert state.rate == 0.5 and state.consecutive_failures == 1
+    controller.record_success(URL, latency=1.0)
+    assert state.rate == pytest.approx(0.55)
+    controller.record_success(URL, latency=30.0)
+    assert state.rate == pytest.approx(0.55)
+
+
+def test_scheduled_waiters_reserve_again_after_failure(clock):
+    controller = RateController(initial_rate=2.0, max_rate=2.0, burst=0, clock=clock)
+    # 預先排好 40 個請求，最後一個排在 20 秒後
+    scheduled = [controller.reserve(URL) for _ in range(40)]
+    assert scheduled[-1][0] == pytest.approx(20.0)
+
+    # 第一個請求發出後失敗：主機暫停 COOLDOWN_BASE 秒，速率減半
+    clock.now += scheduled[0][0]
+    controller.record_failure(URL, "http_429")
+    failed_at = clock.now
+
+    # 原本排在暫停期間的請求醒來後重新預約，不會在暫停結束前發出
+    sent = []
+    for delay, generation in scheduled[1:]:
+        clock.now = max(clock.now, 1000.0 + delay)
+        if controller._failed_since(URL, generation):
+            controller.acquire(URL)
+        sent.append(clock.now)
+    assert min(sent) >= failed_at + COOLDOWN_BASE
+    gaps = [later - earlier for earlier, later in zip(sorted(sent), sorted(sent)[1:])]
+    assert min(gaps) >= 1.0 - 1e-9
+
+
+def test_acquire_async_reserves_again_after_failure(clock, monkeypatch):
+    controller = RateController(initial_rate=1.0, max_rate=1.0, burst=0, clock=clock)
+
+    async def fake_sleep(seconds):
+        clock.now += seconds
+        # 等待期間另一個請求失敗
+        if not failures:
+            failures.append(clock.now)
+            controller.record_failure(URL, "timeout")
+
+    failures = []
+    monkeypatch.setattr(rate_controller.asyncio, "sleep", fake_sleep)
+    asyncio.run(controller.acquire_async(URL))
+    assert clock.now >= failures[0] + COOLDOWN_BASE
@@ -0,0 +1,51 @@
+from concurrent.futures import Future
+
+from house_parser import parse_list_html
+from region_scheduler import ListPagePrefetcher
+
+LIST_URL = "https://rent.houseprice.tw/list/台北市_city/?p=2"
+
+LIST_HTML = """
+<html><body>
+<a class="group" href="/house/1001?from=list&p=99"><h3>大安區近捷運兩房</h3><span>32,000 元/月</span></a>
+<a class="group" href="/house/1002"><h3>板橋獨立套房</h3><span>9,800 元</span></a>
+<footer><a href="/list/新北市_city/?p=50">新北市租屋</a></footer>
+<nav aria-label="Pagination"><ul class="pagination">
+  <li><a href="?p=1">1</a></li><li><a href="?p=2">2</a></li><li><a href="?q=x&p=5">5</a></li>
+</ul></nav>
+</body></html>
+"""
+
+
+def test_last_page_link_only_reads_the_pagination_element():
+    summaries, last_page_link = parse_list_html(LIST_HTML, LIST_URL)
+    assert [summary["listing_id"] for summary in summaries] == ["1001", "1002"]
+    assert last_page_link == 5
+
+    # 沒有分頁列時，卡片與頁尾連結中的 p=N 不算
+    _, last_page_link = parse_list_html(LIST_HTML.split("<nav")[0], LIST_URL)
+    assert last_page_link is None
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def test_prefetcher_returns_parsed_page():
+    prefetcher = ListPagePrefetcher()
+    try:
+        prefetcher._futures[LIST_URL] = _done(LIST_HTML)
+        html, summaries, last_page_link = prefetcher.take(LIST_URL)
+        assert html == LIST_HTML
+        assert [summary["listing_id"] for summary in summaries] == ["1001", "1002"]
+        assert last_page_link == 5
+
+        # 解析不到物件的預抓結果交回瀏覽器處理，連續兩次後停用預抓
+        for _ in range(2):
+            prefetcher._futures[LIST_URL] = _done("<html><body>請稍候</body></html>")
+            assert prefetcher.take(LIST_URL) is None
+        assert not prefetcher.enabled
+    finally:
+        prefetcher.close()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import crawler
+from benchmark import benchmark_list_pages, benchmark_parser
+from house_parser import extract_coordinates, parse_list_page
+from replay import CORPUS_FORMAT_VERSION, PageCorpus, ReplayServer, page_key
+
+# 少量手工整理的頁面：完整欄位、地圖連結座標、缺少大部分欄位只能從全文判斷地區
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+TARGET_REGION = "台北市"
+
+
+@pytest.fixture
+def corpus():
+    return PageCorpus(CORPUS_DIR)
+
+
+def test_parser_output_matches_golden(corpus):
+    report = benchmark_parser(corpus, TARGET_REGION)
+    assert report["pages"] == 3
+    assert report["missing_golden"] == []
+    assert report["mismatches"] == []
+
+
+def test_list_page_cards(corpus):
+    assert benchmark_list_pages(corpus)["cards"] == 2
+    [(url, _, html)] = list(corpus.pages("list"))
+    cards = parse_list_page(html, url)
+    assert [(card["listing_id"], card["price"], card["area"]) for card in cards] == [
+        ("1001", "32000", "台北市 大安區"),
+        ("1002", "9800", "新北市 板橋區"),
+    ]
+    assert cards[1]["title"] == "板橋獨立套房 近府中站"
+
+
+def test_page_key_ignores_host_and_encoding(corpus):
+    assert page_key("http://127.0.0.1:8000/list/%E5%8F%B0%E5%8C%97%E5%B8%82_city/?p=1") == "/list/台北市_city/?p=1"
+    assert corpus.lookup("/list/%E5%8F%B0%E5%8C%97%E5%B8%82_city/?p=1") is not None
+    assert corpus.lookup("/house/9999") is None
+
+
+def test_parser_does_not_import_the_browser_module():
+    # house_parser 不依賴 crawler（Selenium），crawler 可在模組頂端匯入 house_parser 而不形成循環
+    code = "import sys, house_parser; sys.exit('crawler' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+    assert extract_coordinates("https://www.google.com/maps?query=25.0335,121.5436") == {
+        "latitude": 25.0335, "longitude": 121.5436,
+    }
+
+
+def test_corpus_rejects_other_format_versions(tmp_path):
+    (tmp_path / "manifest.json").write_text(json.dumps({"format_version": CORPUS_FORMAT_VERSION + 1, "pages": {}}))
+    with pytest.raises(ValueError):
+        PageCorpus(str(tmp_path))
+
+
+def test_http_replay_matches_golden(corpus):
+    pytest.importorskip("aiohttp")
+    from http_fetcher import fetch_house_pages
+
+    urls = [url for url, _, _ in corpus.pages("detail")]
+    with ReplayServer(corpus) as server:
+        crawler.set_replay_origin(server.origin)
+        try:
+            results = asyncio.run(fetch_house_pages(urls, TARGET_REGION))
+        finally:
+            crawler.set_replay_origin(None)
+    assert [url for url, _ in results] == urls
+    for url, house_data in results:
+        assert house_data == corpus.load_golden(url)
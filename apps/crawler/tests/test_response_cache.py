@@ -0,0 +1,78 @@
+import pytest
+
+from response_cache import ResponseCache, normalize_url
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path), list_ttl=60, detail_ttl=60, max_bytes=10 ** 9)
+    yield cache
+    cache.close()
+
+
+def _page(n):
+    # 每頁內容不同，壓縮後大小也接近
+    return f"<html><title>租屋 {n}</title>" + "".join(f"<p>{n}-{i}</p>" for i in range(200)) + "</html>"
+
+
+def test_normalize_url_sorts_query_and_drops_fragment():
+    assert normalize_url("HTTPS://Rent.HousePrice.tw/list?b=2&a=1#top") == "https://rent.houseprice.tw/list?a=1&b=2"
+
+
+def test_running_total_matches_stored_blobs(cache):
+    cache.put("https://x/1", _page(1), "detail", now=1)
+    cache.put("https://x/2", _page(1), "detail", now=2)
+    cache.put("https://x/3", _page(3), "detail", now=3)
+    assert cache._total_bytes == cache.total_bytes()
+    # 內容改變後舊的內容沒有人使用，扣除大小
+    cache.put("https://x/3", _page(4), "detail", now=4)
+    cache.put("https://x/1", _page(5), "detail", now=5)
+    assert cache._total_bytes == cache.total_bytes()
+
+
+def test_evicts_least_recently_used_when_over_cap(cache):
+    cache.put("https://x/1", _page(1), "detail", now=1)
+    one_page = cache._total_bytes
+    cache.max_bytes = one_page * 2.5
+    cache.put("https://x/2", _page(2), "detail", now=2)
+    assert cache.get("https://x/1", "detail", now=3) is not None
+    cache.put("https://x/3", _page(3), "detail", now=4)
+    # 第 2 頁最久未被存取，先被淘汰
+    assert cache.get("https://x/2", "detail", now=5) is None
+    assert cache.get_fresh("https://x/1", "detail", now=5) == _page(1)
+    assert cache._total_bytes == cache.total_bytes() <= cache.max_bytes
+
+
+def test_running_total_is_restored_on_reopen(cache, tmp_path):
+    cache.put("https://x/1", _page(1), "detail", now=1)
+    total = cache._total_bytes
+    cache.close()
+    reopened = ResponseCache(str(tmp_path))
+    assert reopened._total_bytes == total
+    reopened.close()
+
+
+class FakePageBrowser:
+    def __init__(self, title, elements=()):
+        self.title = title
+        self.page_source = f"<html><title>{title}</title></html>"
+        self.elements = set(elements)
+
+    def find_elements(self, by, selector):
+        return [selector] if selector in self.elements else []
+
+
+@pytest.mark.parametrize("browser, cached", [
+    (FakePageBrowser("台北市租屋 - 好時價"), True),
+    (FakePageBrowser("物件頁", elements={"h1", "div.base_info"}), True),
+    (FakePageBrowser("安全性驗證", elements={"h1"}), False),
+    (FakePageBrowser("502 Bad Gateway"), False),
+])
+def test_browser_pages_are_cached_only_when_complete(cache, monkeypatch, browser, cached):
+    import crawler
+
+    monkeypatch.setattr(crawler, "safe_get_page", lambda browser, url, ready_selectors=None: True)
+    monkeypatch.setattr(crawler, "_response_cache", cache)
+    url = "https://rent.houseprice.tw/house/1"
+    assert crawler.fetch_page_html(browser, url, "detail", ready_selectors=["h1", "div.base_info"]) == browser.page_source
+    assert (cache.get_fresh(url, "detail") is not None) == cached
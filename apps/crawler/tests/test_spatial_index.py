@@ -0,0 +1,34 @@
+import pytest
+
+from gazetteer import TAIWAN_DIVISIONS, normalize_name
+from spatial_index import CITY_CENTROIDS, DISTRICT_CENTROIDS, centroid_for, haversine_km, in_taiwan
+
+# 同一縣市內最遠的行政區（例如台東縣的蘭嶼、金門縣的烏坵）與縣市中心的距離上限
+MAX_DISTRICT_SPREAD_KM = 130
+
+
+def test_every_gazetteer_district_has_a_centroid():
+    missing = [
+        (city, district)
+        for city, districts in TAIWAN_DIVISIONS.items()
+        for district in districts
+        if normalize_name(district) not in DISTRICT_CENTROIDS.get(city, {})
+    ]
+    assert missing == []
+    assert set(DISTRICT_CENTROIDS) == set(TAIWAN_DIVISIONS) == set(CITY_CENTROIDS)
+
+
+@pytest.mark.parametrize("city", sorted(DISTRICT_CENTROIDS))
+def test_district_centroids_are_near_their_city(city):
+    city_lat, city_lng = CITY_CENTROIDS[city]
+    for district, (lat, lng) in DISTRICT_CENTROIDS[city].items():
+        assert in_taiwan(lat, lng), district
+        assert haversine_km(lat, lng, city_lat, city_lng) < MAX_DISTRICT_SPREAD_KM, district
+
+
+def test_centroid_for_uses_city_to_resolve_shared_district_names():
+    assert centroid_for("新竹市", "東區") == DISTRICT_CENTROIDS["新竹市"]["東區"] + ("district_centroid",)
+    assert centroid_for("臺南市", "東區") == DISTRICT_CENTROIDS["台南市"]["東區"] + ("district_centroid",)
+    # 沒有縣市且區名重複時退回 None，不猜測
+    assert centroid_for(None, "東區") is None
+    assert centroid_for(None, "霧臺鄉") == DISTRICT_CENTROIDS["屏東縣"]["霧台鄉"] + ("district_centroid",)
@@ -0,0 +1,136 @@
+import threading
+
+import pytest
+
+import distributed_crawl
+from distributed_crawl import RunWatcher, run_worker
+from task_queue import LEASE_SCRIPT, REQUEUE_SCRIPT, MemoryTaskQueue, RedisTaskQueue
+
+
+@pytest.fixture(params=["memory", "redis"])
+def queue(request):
+    if request.param == "memory":
+        task_queue = MemoryTaskQueue(visibility_timeout=10, max_attempts=3)
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        task_queue = RedisTaskQueue("redis://localhost:6379/0", "test", visibility_timeout=10, max_attempts=3)
+        # 以 fakeredis 取代連線（建立 Redis 物件時不會實際連線），Lua 腳本重新註冊在同一個連線上
+        task_queue.redis = fakeredis.FakeRedis(decode_responses=True)
+        task_queue._lease_script = task_queue.redis.register_script(LEASE_SCRIPT)
+        task_queue._requeue_script = task_queue.redis.register_script(REQUEUE_SCRIPT)
+    task_queue.reset()
+    return task_queue
+
+
+def test_enqueue_dedupes_by_key(queue):
+    assert queue.enqueue({"type": "detail", "url": "a"}, dedupe_key="a")
+    assert not queue.enqueue({"type": "detail", "url": "a"}, dedupe_key="a")
+    assert queue.stats()["pending"] == 1
+
+
+def test_dead_worker_task_is_requeued_after_lease_expiry(queue):
+    queue.enqueue({"type": "detail", "url": "a"})
+    task_id, task = queue.lease(now=1000)
+    assert task["attempts"] == 0
+    # 租約未到期前不會重新排入，也不會被其他工作者取走
+    assert queue.requeue_expired(now=1005) == []
+    assert queue.lease(now=1005) is None
+
+    # 工作者當機沒有 ack，租約到期後任務回到佇列，由另一個工作者接手
+    assert queue.requeue_expired(now=1011) == []
+    retry_id, retried = queue.lease(now=1011)
+    assert retry_id == task_id
+    assert retried["url"] == "a" and retried["attempts"] == 1
+    queue.ack(retry_id)
+    assert queue.stats() == {"pending": 0, "leased": 0, "results": 0}
+
+
+def test_task_is_given_up_after_max_attempts(queue):
+    queue.enqueue({"type": "detail", "url": "a"})
+    now = 1000
+    for _ in range(2):
+        assert queue.lease(now=now) is not None
+        now += 11
+        assert queue.requeue_expired(now=now) == []
+    assert queue.lease(now=now) is not None
+    exhausted = queue.requeue_expired(now=now + 11)
+    assert [task["url"] for task in exhausted] == ["a"]
+    assert queue.lease(now=now + 11) is None
+
+
+def test_acked_task_is_not_requeued(queue):
+    queue.enqueue({"type": "detail", "url": "a"})
+    task_id, _ = queue.lease(now=1000)
+    queue.ack(task_id)
+    assert queue.requeue_expired(now=2000) == []
+    assert queue.lease(now=2000) is None
+
+
+def test_closed_flag_is_scoped_to_generation(queue):
+    first = queue.generation()
+    queue.close()
+    assert queue.is_closed() and queue.is_closed(first)
+
+    # 新的協調者開始下一輪：上一輪的結束旗標不再有效
+    queue.reset()
+    assert queue.generation() != first
+    assert not queue.is_closed()
+    assert not queue.is_closed(first)
+
+
+def test_run_watcher_ignores_stale_closed_flag(queue):
+    queue.close()
+    watcher = RunWatcher(queue)
+    # 啟動時只看到上一輪已結束：不離開，等待下一輪
+    assert not watcher()
+    queue.reset()
+    assert not watcher()
+    queue.close()
+    assert watcher()
+
+
+class FakeBrowser:
+    def quit(self):
+        pass
+
+
+def test_standing_worker_serves_consecutive_runs(queue, monkeypatch):
+    monkeypatch.setattr(distributed_crawl, "IDLE_POLL", 0.01)
+    monkeypatch.setattr(distributed_crawl, "process_task",
+                        lambda browser, task: {"type": "detail", "url": task["url"], "data": {"url": task["url"]}})
+    stop = threading.Event()
+    worker = threading.Thread(target=run_worker, args=(queue, "w"),
+                              kwargs={"browser_factory": FakeBrowser, "should_stop": stop.is_set}, daemon=True)
+    # 上一輪已結束後才啟動的工作者不會離開
+    queue.close()
+    worker.start()
+    try:
+        for run in ("first", "second"):
+            queue.reset()
+            queue.enqueue({"type": "detail", "region": "r", "url": run})
+            results = []
+            for _ in range(100):
+                results += queue.pop_results(timeout=0.05)
+                if results:
+                    break
+            assert [result["url"] for result in results] == [run]
+            queue.close()
+            assert worker.is_alive()
+    finally:
+        stop.set()
+        worker.join(timeout=5)
+    assert not worker.is_alive()
+
+
+def test_local_workers_skip_the_spare_browser(monkeypatch):
+    started = []
+    monkeypatch.setattr(distributed_crawl, "run_worker", lambda queue, worker_id, **kwargs: started.append(kwargs))
+    monkeypatch.setattr(distributed_crawl, "run_coordinator", lambda queue, **kwargs: 0)
+
+    distributed_crawl.run_local(workers=3)
+    assert [kwargs["warm_spare"] for kwargs in started] == [False] * 3
+
+    started.clear()
+    distributed_crawl.run_local(workers=1)
+    assert [kwargs["warm_spare"] for kwargs in started] == [True]
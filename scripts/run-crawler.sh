@@ -39,8 +39,24 @@ if [ $? -eq 0 ] && [ -f "$RESULT_FILE" ]; then
     
     # 導入資料庫 
     echo "📥 導入資料庫..."
-    cd "$PROJECT_ROOT"
-    /usr/bin/docker-compose exec -T backend npx ts-node scripts/import-listings.ts data/crawl_result_current.json
+    PREVIOUS_FILE="$BACKEND_DIR/data/crawl_result_previous.json"
+    if [ "${IMPORT_MODE:-service}" = "bulk" ]; then
+        # 以 COPY 批次匯入（需能連到 DATABASE_URL）
+        if [ -f "$PREVIOUS_FILE" ] && [ "${FULL_IMPORT:-0}" != "1" ]; then
+            # 與上一次匯入的結果比對，只寫入新增、變動與下架的物件
+            DELTA_FILE="$CRAWLER_DIR/data/crawl_delta.json"
+            /usr/bin/python3 "$CRAWLER_DIR/crawl_delta.py" "$PREVIOUS_FILE" "$RESULT_FILE" --output "$DELTA_FILE"
+            /usr/bin/python3 "$CRAWLER_DIR/bulk_loader.py" --delta "$DELTA_FILE"
+        else
+            /usr/bin/python3 "$CRAWLER_DIR/bulk_loader.py" "$RESULT_FILE"
+        fi
+    else
+        cd "$PROJECT_ROOT"
+        /usr/bin/docker-compose exec -T backend npx ts-node scripts/import-listings.ts data/crawl_result_current.json
+    fi
+
+    # 匯入成功後才更新比對基準，匯入失敗時下次會與更早的結果比對
+    cp "$RESULT_FILE" "$PREVIOUS_FILE"
     
     echo "🎉 完成！"
 else